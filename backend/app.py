@@ -1,17 +1,526 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import threading
+import contextvars
+import importlib.util
+import json
 import os
+import tempfile
+import time
 
 # Import moderation modules
 from modules.hate_speech_detector import HateSpeechDetector
 from modules.fake_news_detector import FakeNewsDetector
+from modules.result_cache import create_cache
+from modules.admission import (AdmissionController, SharedLimiterState, TrafficClass, default_state_path,
+                              parse_endpoint_limits)
+from modules.artifact import ArtifactWatcher
+from modules.cascade import parse_band
+from modules.chat_session import ChatSessions
+from modules.domain_reputation import DomainReputationIndex
+from modules.job_queue import JobQueue, JobWorkerPool, check_callback_url, parse_callback_hosts
+from modules.lazy_component import LazyComponent
+from modules.near_duplicate import NearDuplicateIndex
+from modules.response_format import (CATEGORY_CODES, JSON_MIMETYPE, SEVERITY_CODES, compact, compress,
+                                     compression_encodings, dumps_msgpack, dumps_orjson, response_mimetypes,
+                                     wants_compact)
+from modules.stream_scan import FakeNewsScan, HateSpeechScan, scan_stream
+from modules.text_analysis import TextAnalysis
+from modules.metrics import (REGISTRY, SIZE_BUCKETS, format_breakdown, start_breakdown,
+                             stop_breakdown, timed)
+
+# Image support needs opencv-python, Pillow and pytesseract; they are
+# imported when the image moderator is first used, not at startup
+IMAGE_SUPPORT = all(importlib.util.find_spec(name) is not None for name in ('cv2', 'pytesseract'))
+
+class InstrumentedJSONProvider(DefaultJSONProvider):
+    """JSON provider that times request parsing and response serialization
+    
+    Responses go through orjson when it is installed, or msgpack when the
+    client's Accept header prefers it, and are compacted (no echoed input,
+    numeric codes) when the request asked for that.
+    """
+    
+    def _indent(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+    
+    def dumps(self, obj, **kwargs):
+        with timed('response.serialize'):
+            if not kwargs:
+                body = dumps_orjson(obj, self.default, self.sort_keys, self._indent())
+                if body is not None:
+                    return body.decode('utf-8')
+            return super().dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        with timed('request.parse_json'):
+            return super().loads(s, **kwargs)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = JSON_MIMETYPE
+        if has_request_context():
+            if g.get('compact'):
+                obj = compact(obj)
+            mimetype = request.accept_mimetypes.best_match(response_mimetypes(), JSON_MIMETYPE)
+        
+        with timed('response.serialize'):
+            if mimetype != JSON_MIMETYPE:
+                body = dumps_msgpack(obj, self.default)
+            else:
+                body = dumps_orjson(obj, self.default, self.sort_keys, self._indent())
+                if body is None:
+                    body = super().dumps(obj) + "\n"
+        response = self._app.response_class(body, mimetype=mimetype)
+        if has_request_context():
+            response.vary.update(('Accept', 'Prefer'))
+            if g.get('compact') and 'Prefer' in request.headers:
+                response.headers['Preference-Applied'] = 'return=minimal'
+        return response
 
 app = Flask(__name__)
+app.json = InstrumentedJSONProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
 CORS(app)
 
-# Initialize detectors
-hate_detector = HateSpeechDetector()
-fake_news_detector = FakeNewsDetector()
+# Request metrics, exposed at /api/metrics
+REQUESTS_TOTAL = REGISTRY.counter(
+    'moderation_requests_total', 'Requests by endpoint and outcome', ['endpoint', 'outcome']
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'moderation_request_duration_seconds', 'End-to-end request latency', ['endpoint']
+)
+INPUT_BYTES = REGISTRY.histogram(
+    'moderation_request_input_bytes', 'Request body size', ['endpoint'], buckets=SIZE_BUCKETS
+)
+IN_FLIGHT = REGISTRY.gauge(
+    'moderation_requests_in_flight', 'Requests currently being handled', ['endpoint']
+)
+
+# Always send the X-Timing breakdown, not only when the client asks for it
+TIMING_HEADER_ALWAYS = os.environ.get('TIMING_HEADER', '').lower() in ('1', 'true', 'always')
+
+# Batch responses at least this large are gzip/br compressed when the client
+# accepts it (Accept-Encoding)
+COMPRESSED_ENDPOINTS = {'/api/analyze-text/batch', '/api/check-fake-news/batch', '/api/analyze-image/batch'}
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', 1))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 4))
+
+# Upper bound on items per batch request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Default and maximum per-request deadline for /api/moderate
+MODERATE_TIMEOUT_MS = int(os.environ.get('MODERATE_TIMEOUT_MS', 2000))
+
+# Image analysis pool size, queue bound and limits
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+IMAGE_TIMEOUT_S = float(os.environ.get('IMAGE_TIMEOUT_S', 30))
+MAX_IMAGE_BATCH_SIZE = int(os.environ.get('MAX_IMAGE_BATCH_SIZE', 32))
+# Images queued or running at once; a batch must fit in the queue
+IMAGE_QUEUE_SIZE = int(os.environ.get('IMAGE_QUEUE_SIZE', max(IMAGE_WORKERS * 4, MAX_IMAGE_BATCH_SIZE)))
+MAX_IMAGE_BATCH_SIZE = min(MAX_IMAGE_BATCH_SIZE, IMAGE_QUEUE_SIZE)
+
+# Animated GIFs and short videos: base seconds between sampled frames (the
+# sampler adapts it to how much the picture changes), limits on frames and
+# seconds read, and how many distinct frames share the image pool at once
+VIDEO_SAMPLE_INTERVAL_S = float(os.environ.get('VIDEO_SAMPLE_INTERVAL_S', 0.5))
+VIDEO_MAX_FRAMES = int(os.environ.get('VIDEO_MAX_FRAMES', 64))
+VIDEO_MAX_DURATION_S = float(os.environ.get('VIDEO_MAX_DURATION_S', 600))
+VIDEO_TIMEOUT_S = float(os.environ.get('VIDEO_TIMEOUT_S', 60))
+VIDEO_PARALLEL_FRAMES = min(int(os.environ.get('VIDEO_PARALLEL_FRAMES', IMAGE_WORKERS)), IMAGE_QUEUE_SIZE)
+
+# Shared result cache ("memory", "disk" or "off"); point the disk cache at
+# /dev/shm to share it between gunicorn workers on one host
+result_cache = create_cache(
+    kind=os.environ.get('RESULT_CACHE', 'memory'),
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl=int(os.environ.get('RESULT_CACHE_TTL', 3600)),
+    path=os.environ.get('RESULT_CACHE_PATH')
+)
+
+# Clusters reworded copies of a text so spam waves reuse one verdict
+text_clusters = NearDuplicateIndex(
+    threshold=float(os.environ.get('TEXT_DEDUP_THRESHOLD', 0.7)),
+    window_seconds=int(os.environ.get('TEXT_DEDUP_WINDOW_S', 3600)),
+    max_clusters=int(os.environ.get('TEXT_DEDUP_MAX_CLUSTERS', 100000))
+) if os.environ.get('TEXT_DEDUP', 'on') != 'off' else None
+
+# Trained classifiers from train_models.py; detectors fall back to rules without them
+MODEL_PATH = os.environ.get('MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+
+# Cheap tiers answer clear-cut inputs; only scores inside the band reach the models
+CASCADE = os.environ.get('CASCADE', 'on') != 'off'
+
+# Detectors are built on first use (or by warm_up()), so a worker can answer
+# health checks before the lexicon, models and indexes are loaded
+def build_hate_detector():
+    detector = HateSpeechDetector(
+        lexicon_path=os.environ.get('HATE_LEXICON_PATH'),
+        cache=result_cache,
+        near_duplicates=text_clusters,
+        model_path=os.path.join(MODEL_PATH, 'hate_speech_model.npz'),
+        cascade_band=parse_band(os.environ.get('HATE_CASCADE_BAND'), (0.2, 0.7)) if CASCADE else None
+    )
+    artifact = current_artifact()
+    if artifact is not None:
+        detector.load_artifact(artifact)
+    return detector
+
+def load_domain_index():
+    """Memory-map the domain reputation index, or None for the built-in outlet list"""
+    path = os.environ.get('DOMAIN_REPUTATION_PATH')
+    if path and os.path.exists(path):
+        return DomainReputationIndex.load(path)
+    return None
+
+def build_fake_news_detector():
+    detector = FakeNewsDetector(
+        cache=result_cache,
+        model_path=os.path.join(MODEL_PATH, 'fake_news_model.npz'),
+        domain_index=load_domain_index(),
+        cascade_band=parse_band(os.environ.get('FAKE_CASCADE_BAND'), (0.25, 0.85)) if CASCADE else None
+    )
+    artifact = current_artifact()
+    if artifact is not None:
+        detector.load_artifact(artifact)
+    return detector
+
+def load_hash_index(artifact=None):
+    """Near-duplicate image index from the artifact or IMAGE_HASH_INDEX_PATH, or an empty one"""
+    from modules.image_hash import PerceptualHashIndex
+    max_distance = int(os.environ.get('IMAGE_HASH_MAX_DISTANCE', 6))
+    if artifact is not None and 'image_hashes' in artifact:
+        return PerceptualHashIndex.from_arrays(artifact.arrays('image_hashes'), max_distance=max_distance)
+    path = os.environ.get('IMAGE_HASH_INDEX_PATH')
+    if path and os.path.exists(path):
+        return PerceptualHashIndex.load(path, max_distance=max_distance)
+    return PerceptualHashIndex(max_distance=max_distance)
+
+def build_image_moderator():
+    from modules.image_hash import RecentHashIndex
+    from modules.image_moderator import ImageModerator
+    return ImageModerator(
+        max_dimension=int(os.environ.get('IMAGE_MAX_DIMENSION', 1024)),
+        hash_index=load_hash_index(current_artifact()),
+        # Verdicts reached here stay in this worker, bounded and aged out
+        recent_hashes=RecentHashIndex(
+            max_distance=int(os.environ.get('IMAGE_HASH_MAX_DISTANCE', 6)),
+            max_entries=int(os.environ.get('IMAGE_RECENT_HASHES', 10000)),
+            max_age=float(os.environ.get('IMAGE_RECENT_HASH_TTL_S', 86400))
+        ),
+        cascade=CASCADE,
+        min_edge_density=float(os.environ.get('IMAGE_MIN_EDGE_DENSITY', 0.0005))
+    )
+
+def build_video_moderator():
+    from modules.video_moderator import VideoModerator
+    return VideoModerator(
+        image_moderator.get(),
+        sample_interval=VIDEO_SAMPLE_INTERVAL_S,
+        max_frames=VIDEO_MAX_FRAMES,
+        max_duration=VIDEO_MAX_DURATION_S,
+        max_in_flight=VIDEO_PARALLEL_FRAMES
+    )
+
+hate_detector = LazyComponent('hate_speech', build_hate_detector)
+fake_news_detector = LazyComponent('fake_news', build_fake_news_detector)
+image_moderator = LazyComponent('image', build_image_moderator) if IMAGE_SUPPORT else None
+video_moderator = LazyComponent('video', build_video_moderator) if IMAGE_SUPPORT else None
+
+def apply_artifact(artifact):
+    """Swap a newly opened artifact into the loaded detectors; the others read it when built"""
+    if hate_detector.loaded:
+        hate_detector.load_artifact(artifact)
+    if fake_news_detector.loaded:
+        fake_news_detector.load_artifact(artifact)
+    if image_moderator is not None and image_moderator.loaded and 'image_hashes' in artifact:
+        image_moderator.get().hash_index = load_hash_index(artifact)
+    print(f"Loaded moderation artifact {artifact.version} from {artifact.path}")
+
+# Single memory-mapped file built by build_artifact.py; every worker maps the
+# same pages, and a replaced file is picked up without a restart
+artifact_watcher = LazyComponent('artifact', lambda: ArtifactWatcher(
+    os.environ['MODERATION_ARTIFACT'],
+    apply_artifact,
+    interval=float(os.environ.get('ARTIFACT_CHECK_INTERVAL_S', 1.0)),
+    verify=os.environ.get('ARTIFACT_VERIFY', 'on') != 'off'
+)) if os.environ.get('MODERATION_ARTIFACT') else None
+
+def current_artifact():
+    return artifact_watcher.current if artifact_watcher is not None else None
+
+COMPONENTS = [component for component in (artifact_watcher, hate_detector, fake_news_detector,
+                                           image_moderator, video_moderator)
+              if component is not None]
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+def warm_up():
+    """Build every component now; gunicorn.conf.py calls this in the master before forking"""
+    for component in COMPONENTS:
+        component.get()
+
+def start_warm_up():
+    """Build the components on a background thread, once per process"""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None or (not _warm_up_thread.is_alive() and
+                                       not all(component.loaded for component in COMPONENTS)):
+            _warm_up_thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            _warm_up_thread.start()
+
+if os.environ.get('LAZY_LOAD', 'on') == 'off':
+    warm_up()
+
+# Runs independent detectors of one /api/moderate request concurrently
+detector_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('MODERATE_WORKERS', 4)),
+    thread_name_prefix='detector'
+)
+
+# OpenCV and tesseract release the GIL, so a thread pool spreads the
+# CPU-heavy image stages across cores; the semaphore bounds queued work
+image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+image_slots = threading.BoundedSemaphore(IMAGE_QUEUE_SIZE)
+
+MODERATE_DETECTORS = ('hate_speech', 'fake_news')
+
+# Streaming scan of long documents: the body is read and scanned one window
+# at a time, so memory depends on the window, not the document
+STREAM_WINDOW_CHARS = int(os.environ.get('STREAM_WINDOW_CHARS', 65536))
+STREAM_OVERLAP_CHARS = int(os.environ.get('STREAM_OVERLAP_CHARS', 512))
+STREAM_READ_BYTES = 65536
+
+# Live chat: rolling moderation state per conversation, kept in an SQLite file
+# in /dev/shm that every worker on the host shares, so any worker can take a
+# conversation's next message. CHAT_STORE=memory keeps it in each worker's
+# memory instead, which is only right with one worker or sticky routing on
+# conversation_id.
+CHAT_STORE_PATH = None if os.environ.get('CHAT_STORE', 'shared') == 'memory' else \
+    os.environ.get('CHAT_STORE_PATH') or default_state_path('moderation-chat.sqlite')
+chat_sessions = ChatSessions(
+    hate_detector,
+    max_sessions=int(os.environ.get('CHAT_MAX_SESSIONS', 50000)),
+    idle_seconds=float(os.environ.get('CHAT_IDLE_S', 1800)),
+    window_tokens=int(os.environ.get('CHAT_WINDOW_TOKENS', 16)),
+    half_life=float(os.environ.get('CHAT_HALF_LIFE_S', 300)),
+    toxic_level=float(os.environ.get('CHAT_TOXIC_LEVEL', 1.0)),
+    store_path=CHAT_STORE_PATH
+)
+MAX_CHAT_MESSAGES = int(os.environ.get('MAX_CHAT_MESSAGES', 100))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Background jobs for OCR-heavy images and long documents: submitters get a
+# job ID at once while worker threads drain a SQLite queue shared by every
+# process that points at the same file
+JOB_TIMEOUT_S = float(os.environ.get('JOB_TIMEOUT_S', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+# Submitted priorities are clamped to this range
+JOB_MAX_PRIORITY = 100
+# Hosts callback_url may point at (comma-separated, '.example.com' for a
+# domain and its subdomains); unset disables callbacks
+JOB_CALLBACK_HOSTS = parse_callback_hosts(os.environ.get('JOB_CALLBACK_HOSTS'))
+
+def run_image_job(params, payload, timeout):
+    from modules.video_moderator import is_animated_gif
+    if is_animated_gif(payload):
+        return run_video_job(params, payload, timeout)
+    # A payload that does not decode raises ValueError and is not retried
+    image = image_moderator.decode(payload)
+    result = image_moderator.analyze(image, ocr_timeout=timeout)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+def run_video_job(params, payload, timeout):
+    result = video_moderator.analyze(payload, ocr_timeout=timeout, timeout=timeout)
+    if "error" in result:
+        # Undecodable media will not decode on a retry either
+        raise ValueError(result["error"])
+    return result
+
+def run_moderate_job(params, payload, timeout):
+    text = params.get('text', '')
+    title = params.get('title', '')
+    detectors = params.get('detectors') or MODERATE_DETECTORS
+    analysis = TextAnalysis(text)
+    title_analysis = TextAnalysis(title) if title else analysis
+    hate_detector.reload_lexicon_if_changed()
+    
+    results = {}
+    if 'hate_speech' in detectors:
+        results['hate_speech'] = hate_detector.predict_analysis(analysis)
+    if 'fake_news' in detectors:
+        results['fake_news'] = fake_news_detector.predict_analysis(title_analysis, analysis)
+    return {"results": results}
+
+job_queue = JobQueue(
+    os.environ.get('JOB_QUEUE_PATH', os.path.join(tempfile.gettempdir(), 'moderation-jobs.db')),
+    retention=int(os.environ.get('JOB_RETENTION_S', 86400))
+)
+job_workers = JobWorkerPool(
+    job_queue,
+    {'image': run_image_job, 'video': run_video_job, 'moderate': run_moderate_job},
+    workers=int(os.environ.get('JOB_WORKERS', 2)),
+    callback_hosts=JOB_CALLBACK_HOSTS
+)
+
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    'moderation_job_queue_depth', 'Jobs in the shared queue by status', ['status']
+)
+
+def _collect_job_stats():
+    for status, count in job_queue.depth().items():
+        JOB_QUEUE_DEPTH.labels(status).set(count)
+
+REGISTRY.add_collector(_collect_job_stats)
+
+if result_cache is not None:
+    CACHE_EVENTS = REGISTRY.gauge(
+        'moderation_cache_events', 'Result cache counters for this worker', ['event']
+    )
+    
+    def _collect_cache_stats():
+        stats = result_cache.stats()
+        for event in ('hits', 'misses', 'evictions', 'entries', 'size_bytes'):
+            CACHE_EVENTS.labels(event).set(stats[event])
+    
+    REGISTRY.add_collector(_collect_cache_stats)
+
+if text_clusters is not None:
+    CLUSTER_EVENTS = REGISTRY.gauge(
+        'moderation_text_cluster_events', 'Near-duplicate text index counters for this worker', ['event']
+    )
+    
+    def _collect_cluster_stats():
+        stats = text_clusters.stats()
+        for event in ('hits', 'misses', 'clusters'):
+            CLUSTER_EVENTS.labels(event).set(stats[event])
+    
+    REGISTRY.add_collector(_collect_cluster_stats)
+
+# Admission control: host-wide in-flight caps per traffic class and per
+# endpoint, plus optional per-client token buckets, kept in a shared-memory
+# file so every gunicorn worker enforces the same limits. Image requests are
+# shed first so cheap text checks keep flowing. A chat stream stays open for
+# the whole conversation and would hold an in-flight slot all that time
+ADMISSION_EXEMPT = {'/', '/api/health', '/api/ready', '/api/metrics', '/api/cache/stats', '/api/chat/stream',
+                    'unmatched'}
+IMAGE_ENDPOINTS = {'/api/analyze-image', '/api/analyze-image/batch', '/api/analyze-video'}
+ADMISSION_ENDPOINT_LIMITS = parse_endpoint_limits(os.environ.get(
+    'ADMISSION_ENDPOINT_LIMITS',
+    '/api/analyze-video=2,/api/analyze-image/batch=4,/api/analyze-text/batch=16,/api/check-fake-news/batch=16'
+))
+# Behind a reverse proxy (Render included) every request arrives from the
+# proxy, so per-client buckets are off by default: with them on and this
+# off, all users would share one bucket
+ADMISSION_TRUST_PROXY = os.environ.get('ADMISSION_TRUST_PROXY', 'off') == 'on'
+# API keys that get a bucket of their own. Any other X-API-Key is ignored:
+# a client could otherwise send a fresh key per request for a full bucket
+ADMISSION_API_KEYS = frozenset(key.strip() for key in os.environ.get('ADMISSION_API_KEYS', '').split(',')
+                               if key.strip())
+
+admission = AdmissionController(
+    SharedLimiterState(os.environ.get('ADMISSION_STATE_PATH') or default_state_path()),
+    [
+        TrafficClass('text', cost=1,
+                     queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 100)) / 1000),
+        TrafficClass('image', cost=float(os.environ.get('ADMISSION_IMAGE_COST', 5)),
+                     max_inflight=int(os.environ.get('ADMISSION_IMAGE_MAX_INFLIGHT', 8)),
+                     shed_at=float(os.environ.get('ADMISSION_IMAGE_SHED_AT', 0.5)),
+                     queue_timeout=0)
+    ],
+    rate=float(os.environ.get('ADMISSION_RATE', 0)),
+    burst=float(os.environ.get('ADMISSION_BURST', 40)),
+    max_inflight=int(os.environ.get('ADMISSION_MAX_INFLIGHT', 64)),
+    max_waiting=int(os.environ.get('ADMISSION_MAX_WAITING', 32)),
+    endpoint_limits=ADMISSION_ENDPOINT_LIMITS
+) if os.environ.get('ADMISSION', 'on') != 'off' else None
+
+if admission is not None:
+    REGISTRY.add_collector(admission.collect)
+
+def client_id():
+    """Rate-limit identity: a configured API key when one is sent, else the client address"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in ADMISSION_API_KEYS:
+        return f"key:{api_key}"
+    if ADMISSION_TRUST_PROXY and request.headers.get('X-Forwarded-For'):
+        return f"ip:{request.headers['X-Forwarded-For'].split(',')[0].strip()}"
+    return f"ip:{request.remote_addr}"
+
+@app.before_request
+def start_request_metrics():
+    g.endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.started = time.perf_counter()
+    # Compact responses drop echoed input and prose and use numeric codes
+    g.compact = wants_compact(request.args, request.headers)
+    IN_FLIGHT.labels(g.endpoint).inc()
+    INPUT_BYTES.labels(g.endpoint).observe(request.content_length or 0)
+    g.breakdown = start_breakdown() if TIMING_HEADER_ALWAYS or 'X-Timing' in request.headers else None
+    # Not yet loaded means no detector has been built either; building one opens the artifact
+    if artifact_watcher is not None and artifact_watcher.loaded:
+        artifact_watcher.reload_if_changed()
+    # Worker threads start in each process after any fork
+    job_workers.ensure_started()
+
+@app.before_request
+def admit_request():
+    """Turn the request away with 429/503 and Retry-After when over its limits"""
+    if admission is None or g.endpoint in ADMISSION_EXEMPT:
+        return None
+    traffic_class = 'image' if g.endpoint in IMAGE_ENDPOINTS else 'text'
+    rejection = admission.admit(traffic_class, client_id(), g.endpoint)
+    if rejection is not None:
+        message = "Rate limit exceeded" if rejection["reason"] == 'rate_limited' else \
+            "Server is at capacity, retry shortly"
+        response = jsonify({"error": message, "retry_after": rejection["retry_after"]})
+        response.headers['Retry-After'] = str(rejection["retry_after"])
+        return response, rejection["status"]
+    g.admitted = (traffic_class, g.endpoint)
+    return None
+
+@app.after_request
+def record_request_metrics(response):
+    if 'started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.started
+    outcome = 'success' if response.status_code < 400 else \
+        'client_error' if response.status_code < 500 else 'server_error'
+    REQUESTS_TOTAL.labels(g.endpoint, outcome).inc()
+    REQUEST_SECONDS.labels(g.endpoint).observe(elapsed)
+    if g.breakdown is not None:
+        g.breakdown['total'] = elapsed
+        response.headers['X-Timing'] = format_breakdown(g.breakdown)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip/br-encode large batch responses for clients that accept it"""
+    if g.get('endpoint') not in COMPRESSED_ENDPOINTS or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(compression_encodings())
+    if encoding is None or 'Content-Encoding' in response.headers:
+        return response
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+    with timed('response.compress'):
+        response.set_data(compress(body, encoding, RESPONSE_GZIP_LEVEL, RESPONSE_BROTLI_QUALITY))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'started' in g:
+        IN_FLIGHT.labels(g.endpoint).dec()
+    if 'admitted' in g:
+        admission.release(*g.admitted)
+    stop_breakdown()
 
 @app.route('/')
 def home():
@@ -20,9 +529,20 @@ def home():
         "version": "1.0",
         "endpoints": [
             "/api/analyze-text",
+            "/api/analyze-text/batch",
+            "/api/analyze-text/stream",
             "/api/analyze-image",
-            "/api/check-fake-news"
-        ]
+            "/api/analyze-image/batch",
+            "/api/analyze-video",
+            "/api/check-fake-news",
+            "/api/check-fake-news/batch",
+            "/api/moderate",
+            "/api/chat/messages",
+            "/api/chat/stream",
+            "/api/jobs"
+        ],
+        # Numeric values of category and severity in compact responses
+        "compact_codes": {"category": CATEGORY_CODES, "severity": SEVERITY_CODES}
     })
 
 @app.route('/api/analyze-text', methods=['POST'])
@@ -35,18 +555,171 @@ def analyze_text():
         if not text:
             return jsonify({"error": "No text provided"}), 400
         
+        # Pick up lexicon edits without restarting the workers
+        hate_detector.reload_lexicon_if_changed()
+        
         # Detect hate speech
         hate_result = hate_detector.predict(text)
         
-        return jsonify({
+        response = {
             "success": True,
             "text": text,
             "hate_speech": hate_result
+        }
+        if data.get('highlight'):
+            response["highlights"] = hate_detector.highlight(text)
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analyze-text/batch', methods=['POST'])
+def analyze_text_batch():
+    """Analyze many texts for hate speech in one request"""
+    try:
+        data = request.json
+        texts = data.get('texts')
+        
+        if not isinstance(texts, list) or not texts:
+            return jsonify({"error": "No texts provided"}), 400
+        if len(texts) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} texts)"}), 413
+        
+        hate_detector.reload_lexicon_if_changed()
+        results = hate_detector.predict_batch(texts)
+        
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analyze-text/stream', methods=['POST'])
+def analyze_text_stream():
+    """Scan a long raw-text body in overlapping windows, stopping once the verdicts are decided"""
+    try:
+        detectors = request.args.get('detectors', 'hate_speech').split(',')
+        unknown = [name for name in detectors if name not in MODERATE_DETECTORS]
+        if unknown:
+            return jsonify({"error": f"Unknown detectors: {', '.join(unknown)}"}), 400
+        
+        hate_detector.reload_lexicon_if_changed()
+        scans = {}
+        if 'hate_speech' in detectors:
+            scans['hate_speech'] = HateSpeechScan(hate_detector)
+        if 'fake_news' in detectors:
+            scans['fake_news'] = FakeNewsScan(fake_news_detector, request.args.get('title', ''))
+        
+        def chunks():
+            while True:
+                chunk = request.stream.read(STREAM_READ_BYTES)
+                if not chunk:
+                    return
+                yield chunk
+        
+        results, stats = scan_stream(
+            chunks(), scans,
+            window_chars=STREAM_WINDOW_CHARS,
+            overlap_chars=STREAM_OVERLAP_CHARS,
+            early_exit=request.args.get('full', '').lower() not in ('1', 'true')
+        )
+        if not stats["chars_scanned"]:
+            return jsonify({"error": "No text provided"}), 400
+        
+        return jsonify({
+            "success": True,
+            **stats,
+            **results
         })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/messages', methods=['POST'])
+def chat_messages():
+    """Moderate the next message(s) of a live chat conversation in the context of the earlier ones"""
+    try:
+        data = request.json
+        conversation_id = data.get('conversation_id')
+        if not isinstance(conversation_id, str) or not conversation_id:
+            return jsonify({"error": "No conversation_id provided"}), 400
+        messages = data['messages'] if 'messages' in data else [data.get('text', '')]
+        if not isinstance(messages, list) or not all(isinstance(text, str) and text for text in messages):
+            return jsonify({"error": "No text provided"}), 400
+        if len(messages) > MAX_CHAT_MESSAGES:
+            return jsonify({"error": f"At most {MAX_CHAT_MESSAGES} messages per request"}), 400
+        
+        hate_detector.reload_lexicon_if_changed()
+        results = [chat_sessions.add_message(conversation_id, text) for text in messages]
+        
+        return jsonify({
+            "success": True,
+            "conversation_id": conversation_id,
+            "results": results,
+            "conversation": results[-1]["conversation"]
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Moderate newline-delimited JSON messages as they arrive, one result line per message
+    
+    Each line is {"conversation_id": ..., "text": ...}; conversation_id
+    defaults to the query parameter, so one connection can carry one
+    conversation or multiplex many. A bad line gets an error line and the
+    stream goes on.
+    """
+    default_id = request.args.get('conversation_id')
+    compact_lines = g.compact
+    
+    def encode(obj):
+        if compact_lines:
+            obj = compact(obj)
+        body = dumps_orjson(obj, app.json.default, indent=False)
+        if body is None:
+            body = json.dumps(obj, default=app.json.default, sort_keys=True).encode('utf-8')
+        return body + b'\n'
+    
+    def results():
+        hate_detector.reload_lexicon_if_changed()
+        # Lines are handled as they are read, so results flow back while the client is still sending
+        for number, line in enumerate(request.stream, 1):
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                conversation_id = message.get('conversation_id') or default_id
+                text = message.get('text', '')
+                if not isinstance(conversation_id, str) or not isinstance(text, str) or not text:
+                    yield encode({"line": number, "error": "Each line needs a conversation_id and text"})
+                    continue
+                result = chat_sessions.add_message(conversation_id, text)
+                yield encode({"conversation_id": conversation_id, **result})
+            except Exception as e:
+                yield encode({"line": number, "error": str(e)})
+    
+    return Response(stream_with_context(results()), mimetype=NDJSON_MIMETYPE)
+
+@app.route('/api/chat/<conversation_id>', methods=['GET'])
+def chat_conversation(conversation_id):
+    """Rolling moderation state of a live chat conversation"""
+    summary = chat_sessions.summary(conversation_id)
+    if summary is None:
+        return jsonify({"error": "Unknown conversation"}), 404
+    return jsonify({"success": True, "conversation_id": conversation_id, "conversation": summary})
+
+@app.route('/api/chat/<conversation_id>', methods=['DELETE'])
+def end_chat_conversation(conversation_id):
+    """Forget a live chat conversation once it has ended"""
+    if not chat_sessions.end(conversation_id):
+        return jsonify({"error": "Unknown conversation"}), 404
+    return jsonify({"success": True, "conversation_id": conversation_id})
+
 @app.route('/api/check-fake-news', methods=['POST'])
 def check_fake_news():
     """Check if news is fake or real"""
@@ -69,15 +742,387 @@ def check_fake_news():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/check-fake-news/batch', methods=['POST'])
+def check_fake_news_batch():
+    """Check many news items in one request"""
+    try:
+        data = request.json
+        items = data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "No items provided"}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} items)"}), 413
+        
+        results = fake_news_detector.predict_batch(items)
+        
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/moderate', methods=['POST'])
+def moderate():
+    """Run every enabled detector over one shared analysis of the input"""
+    try:
+        if request.files:
+            data = request.form
+            detectors = data.getlist('detectors') or MODERATE_DETECTORS
+        else:
+            data = request.json or {}
+            detectors = data.get('detectors') or MODERATE_DETECTORS
+        
+        unknown = [name for name in detectors if name not in MODERATE_DETECTORS]
+        if unknown:
+            return jsonify({"error": f"Unknown detectors: {', '.join(unknown)}"}), 400
+        
+        try:
+            timeout_ms = int(data.get('timeout_ms') or MODERATE_TIMEOUT_MS)
+        except (TypeError, ValueError):
+            return jsonify({"error": "timeout_ms must be an integer"}), 400
+        if timeout_ms <= 0:
+            return jsonify({"error": "timeout_ms must be greater than 0"}), 400
+        timeout_ms = min(timeout_ms, MODERATE_TIMEOUT_MS)
+        deadline = time.monotonic() + timeout_ms / 1000
+        text = data.get('text', '')
+        title = data.get('title', '')
+        if not isinstance(text, str) or not isinstance(title, str):
+            return jsonify({"error": "text and title must be strings"}), 400
+        
+        # Text found in an uploaded image is moderated along with the message.
+        # OCR runs on the image pool within the request's deadline, and its
+        # time counts against what the detectors get
+        ocr_text = None
+        timed_out = []
+        image = request.files.get('image')
+        if image is not None:
+            if image_moderator is None:
+                return jsonify({"error": "Image analysis not available. Install opencv-python first."}), 501
+            data = image.read()
+            if not image_slots.acquire(timeout=0.05):
+                return jsonify({"error": "Image analysis is at capacity, retry shortly"}), 503
+            try:
+                # tesseract is killed at the deadline; 0 would mean no limit
+                ocr = image_pool.submit(contextvars.copy_context().run, image_moderator.detect_text_in_image,
+                                        data, max(0.001, deadline - time.monotonic()))
+            except BaseException:
+                image_slots.release()
+                raise
+            ocr.add_done_callback(lambda _: image_slots.release())
+            try:
+                with timed('moderate.ocr'):
+                    ocr_text = ocr.result(timeout=max(0.0, deadline - time.monotonic()))
+            except (FutureTimeoutError, TimeoutError):
+                ocr.cancel()
+                timed_out.append('ocr')
+            if ocr_text:
+                text = f"{text}\n{ocr_text}" if text else ocr_text
+        
+        if not text and not title and not timed_out:
+            return jsonify({"error": "No text provided"}), 400
+        
+        # Normalize once; every detector reads the same analysis object
+        analysis = TextAnalysis(text)
+        title_analysis = TextAnalysis(title) if title else analysis
+        hate_detector.reload_lexicon_if_changed()
+        
+        # Each task runs in a copy of this request's context so stage timings reach X-Timing
+        tasks = {}
+        if not text and not title:
+            # OCR ran out of time and there is nothing else to moderate
+            detectors = []
+        if 'hate_speech' in detectors:
+            tasks['hate_speech'] = detector_pool.submit(
+                contextvars.copy_context().run, hate_detector.predict_analysis, analysis
+            )
+        if 'fake_news' in detectors:
+            tasks['fake_news'] = detector_pool.submit(
+                contextvars.copy_context().run, fake_news_detector.predict_analysis, title_analysis, analysis
+            )
+        
+        wait(tasks.values(), timeout=max(0.0, deadline - time.monotonic()))
+        
+        results = {}
+        errors = {}
+        for name, future in tasks.items():
+            if not future.done():
+                future.cancel()
+                timed_out.append(name)
+            elif future.exception() is not None:
+                errors[name] = str(future.exception())
+            else:
+                results[name] = future.result()
+        
+        response = {
+            "success": True,
+            "partial": bool(timed_out or errors),
+            "results": results,
+            "timed_out": timed_out,
+            "errors": errors
+        }
+        if ocr_text is not None:
+            response["ocr_text"] = ocr_text[:200]
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/analyze-image', methods=['POST'])
 def analyze_image():
     """Analyze image for harmful content"""
-    return jsonify({"error": "Image analysis not available. Install opencv-python first."}), 501
+    if image_moderator is None:
+        return jsonify({"error": "Image analysis not available. Install opencv-python first."}), 501
+    
+    try:
+        image = request.files.get('image')
+        if image is None:
+            return jsonify({"error": "No image provided"}), 400
+        
+        data = image.read()
+        from modules.video_moderator import is_animated_gif
+        if is_animated_gif(data):
+            # Every distinct frame is analyzed, not just the first
+            return media_response(analyze_media(data))
+        
+        # Decoded straight from the upload buffer; nothing is written to disk
+        results = submit_images([data])
+        if results is None:
+            return jsonify({"error": "Image analysis is at capacity, retry shortly"}), 503
+        
+        result = results[0]
+        if "error" in result:
+            status = 504 if result.get("timed_out") else 400
+            return jsonify({"error": result["error"]}), status
+        
+        return jsonify({
+            "success": True,
+            "result": result
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analyze-video', methods=['POST'])
+def analyze_video():
+    """Analyze an animated GIF or short video frame by frame"""
+    if video_moderator is None:
+        return jsonify({"error": "Video analysis not available. Install opencv-python first."}), 501
+    
+    try:
+        video = request.files.get('video')
+        if video is None:
+            return jsonify({"error": "No video provided"}), 400
+        
+        # Frames are decoded one at a time from the upload stream (werkzeug
+        # spools large uploads to a temporary file), never the whole clip at once
+        return media_response(analyze_media(video.stream))
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def analyze_media(source):
+    """Frame-by-frame analysis of a GIF or video on the image pool; None if the queue has no room"""
+    acquired = 0
+    try:
+        # Frames in flight take image queue slots, like a batch of images
+        for _ in range(VIDEO_PARALLEL_FRAMES):
+            if not image_slots.acquire(timeout=0.05):
+                return None
+            acquired += 1
+        return video_moderator.analyze(source, executor=image_pool, timeout=VIDEO_TIMEOUT_S)
+    finally:
+        for _ in range(acquired):
+            image_slots.release()
+
+def media_response(result):
+    if result is None:
+        return jsonify({"error": "Image analysis is at capacity, retry shortly"}), 503
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 400
+    return jsonify({
+        "success": True,
+        "result": result
+    })
+
+@app.route('/api/analyze-image/batch', methods=['POST'])
+def analyze_image_batch():
+    """Analyze several uploaded images in one request"""
+    if image_moderator is None:
+        return jsonify({"error": "Image analysis not available. Install opencv-python first."}), 501
+    
+    try:
+        images = request.files.getlist('images')
+        if not images:
+            return jsonify({"error": "No images provided"}), 400
+        if len(images) > MAX_IMAGE_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_IMAGE_BATCH_SIZE} images)"}), 413
+        
+        results = submit_images([image.read() for image in images])
+        if results is None:
+            return jsonify({"error": "Image analysis is at capacity, retry shortly"}), 503
+        
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def submit_images(images):
+    """Run image analysis on the pool; None if the queue has no room"""
+    acquired = 0
+    try:
+        for _ in images:
+            if not image_slots.acquire(timeout=0.05):
+                return None
+            acquired += 1
+        
+        futures = []
+        for data in images:
+            # tesseract is killed once the request's deadline has passed
+            future = image_pool.submit(contextvars.copy_context().run, image_moderator.analyze, data,
+                                       IMAGE_TIMEOUT_S)
+            acquired -= 1
+            # A slot is held until its work really finishes: a timed-out
+            # analysis that is already running keeps it
+            future.add_done_callback(lambda _: image_slots.release())
+            futures.append(future)
+        deadline = time.monotonic() + IMAGE_TIMEOUT_S
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                future.cancel()
+                results.append({"error": "Image analysis timed out", "timed_out": True})
+        return results
+    finally:
+        for _ in range(acquired):
+            image_slots.release()
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue an image, video or long document for background moderation and return its job ID"""
+    try:
+        image = request.files.get('image')
+        video = request.files.get('video')
+        if image is not None or video is not None:
+            if image_moderator is None:
+                return jsonify({"error": "Image analysis not available. Install opencv-python first."}), 501
+            data = request.form
+            kind, params, payload = ('image', {}, image.read()) if image is not None else ('video', {}, video.read())
+        else:
+            data = request.json or {}
+            text = data.get('text', '')
+            title = data.get('title', '')
+            if not text and not title:
+                return jsonify({"error": "No text, image or video provided"}), 400
+            detectors = data.get('detectors') or list(MODERATE_DETECTORS)
+            unknown = [name for name in detectors if name not in MODERATE_DETECTORS]
+            if unknown:
+                return jsonify({"error": f"Unknown detectors: {', '.join(unknown)}"}), 400
+            kind, params, payload = 'moderate', {"text": text, "title": title, "detectors": detectors}, None
+        
+        callback_url = data.get('callback_url') or None
+        if callback_url:
+            try:
+                check_callback_url(str(callback_url), JOB_CALLBACK_HOSTS)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        try:
+            priority = int(data.get('priority') or 0)
+        except (TypeError, ValueError):
+            return jsonify({"error": "priority must be an integer"}), 400
+        try:
+            timeout = float(data.get('timeout_s') or JOB_TIMEOUT_S)
+        except (TypeError, ValueError):
+            return jsonify({"error": "timeout_s must be a number"}), 400
+        # Also turns away NaN and infinity
+        if not 0 < timeout < float('inf'):
+            return jsonify({"error": "timeout_s must be greater than 0"}), 400
+        
+        job_id = job_queue.submit(
+            kind, params, payload,
+            priority=max(-JOB_MAX_PRIORITY, min(priority, JOB_MAX_PRIORITY)),
+            max_attempts=JOB_MAX_ATTEMPTS,
+            timeout=min(timeout, JOB_TIMEOUT_S),
+            callback_url=callback_url
+        )
+        job_workers.notify()
+        
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a queued job, with its result once done"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job"}), 404
+        
+        return jsonify({
+            "success": True,
+            "job": job
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def job_queue_stats():
+    """Shared queue depth by status"""
+    return jsonify({"depth": job_queue.depth(), "workers": job_workers.workers})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss/eviction counters for this worker"""
+    if result_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **result_cache.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "API is running"})
+    response = {"status": "healthy", "message": "API is running"}
+    # Liveness only: never waits for the artifact to be opened
+    if artifact_watcher is not None and artifact_watcher.loaded:
+        response["artifact"] = {
+            "version": artifact_watcher.current.version,
+            "created": artifact_watcher.current.created
+        }
+    return jsonify(response)
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until every detector is loaded; the first probe starts loading them"""
+    components = {
+        component.name: round(component.load_seconds * 1000, 1) if component.loaded else None
+        for component in COMPONENTS
+    }
+    if all(component.loaded for component in COMPONENTS):
+        return jsonify({"status": "ready", "load_ms": components})
+    start_warm_up()
+    return jsonify({"status": "loading", "load_ms": components}), 503
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,424 @@
+"""Asyncio (ASGI) serving mode for the moderation API
+
+Serves /api/analyze-text, /api/check-fake-news, /api/analyze-image,
+/api/health and /api/ready from one event loop, so idle and slow
+connections cost a coroutine rather than a worker thread. Detector calls
+run on bounded executors and are cancelled when the client disconnects
+before they start:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000
+
+Detectors, caches, admission control and metrics are the ones app.py sets
+up from the same environment; the remaining routes stay on the Flask app.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import Headers, MIMEAccept
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_accept_header, parse_options_header
+
+import app as flask_app
+from modules.metrics import format_breakdown, start_breakdown, stop_breakdown, timed
+from modules.response_format import (
+    JSON_MIMETYPE, compact, dumps_msgpack, dumps_orjson, response_mimetypes, wants_compact
+)
+
+# 'process' forks workers that inherit the loaded detectors, for hosts where
+# the GIL caps text throughput; 'thread' shares one copy of everything
+ASGI_EXECUTOR = os.environ.get('ASGI_EXECUTOR', 'thread')
+ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', os.cpu_count() or 1))
+# Text detector calls queued or running at once; past this a request waits
+# up to ASGI_QUEUE_TIMEOUT_MS for room, then gets 503
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', ASGI_WORKERS * 16))
+ASGI_QUEUE_TIMEOUT_S = float(os.environ.get('ASGI_QUEUE_TIMEOUT_MS', 1000)) / 1000
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, Prefer, X-API-Key, X-Timing')
+]
+
+
+class HTTPError(Exception):
+    """Ends a request early with an error response"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"error": message}
+        self.headers = headers or []
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its response was ready"""
+
+
+def parse_json(body):
+    with timed('request.parse_json'):
+        return json.loads(body)
+
+
+def analyze_text(body):
+    data = parse_json(body)
+    text = data.get('text', '')
+    if not text:
+        return 400, {"error": "No text provided"}
+
+    # Pick up lexicon edits without restarting the workers
+    flask_app.hate_detector.reload_lexicon_if_changed()
+    response = {
+        "success": True,
+        "text": text,
+        "hate_speech": flask_app.hate_detector.predict(text)
+    }
+    if data.get('highlight'):
+        response["highlights"] = flask_app.hate_detector.highlight(text)
+    return 200, response
+
+
+def check_fake_news(body):
+    data = parse_json(body)
+    title = data.get('title', '')
+    content = data.get('content', '')
+    if not title and not content:
+        return 400, {"error": "No content provided"}
+    return 200, {"success": True, "result": flask_app.fake_news_detector.predict(title, content)}
+
+
+def image_upload(body, content_type):
+    """Bytes of the multipart 'image' field, or None"""
+    mimetype, options = parse_options_header(content_type)
+    _, _, files = FormDataParser().parse(BytesIO(body), mimetype, len(body), options)
+    image = files.get('image')
+    return None if image is None else image.read()
+
+
+def analyze_image(data):
+    # Decoded straight from the upload buffer; nothing is written to disk
+    result = flask_app.image_moderator.analyze(data, ocr_timeout=flask_app.IMAGE_TIMEOUT_S)
+    if "error" in result:
+        return 400, {"error": result["error"]}
+    return 200, {"success": True, "result": result}
+
+
+def analyze_gif(data):
+    # Same slots, frame fan-out over the image pool and timeout as the Flask route
+    result = flask_app.analyze_media(data)
+    if result is None:
+        return 503, {"error": "Image analysis is at capacity, retry shortly"}
+    if "error" in result:
+        return 400, {"error": result["error"]}
+    return 200, {"success": True, "result": result}
+
+
+def run_handler(handler, timing, *args):
+    """Executor side of a request: (status, payload, stage breakdown or None)
+
+    Module-level so a process executor can pickle it; forked workers use
+    the detectors the parent had already built.
+    """
+    breakdown = start_breakdown() if timing else None
+    try:
+        if flask_app.artifact_watcher is not None and flask_app.artifact_watcher.loaded:
+            flask_app.artifact_watcher.reload_if_changed()
+        status, payload = handler(*args)
+    except Exception as e:
+        status, payload = 500, {"error": str(e)}
+    finally:
+        stop_breakdown()
+    return status, payload, breakdown
+
+
+async def read_body(receive, limit):
+    """The whole request body; 413 past limit bytes"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            raise HTTPError(413, "Request body too large")
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class ModerationASGI:
+    """ASGI application for the latency-critical moderation routes"""
+
+    def __init__(self, executor_kind=ASGI_EXECUTOR, workers=ASGI_WORKERS, max_pending=ASGI_MAX_PENDING):
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = None
+        self.media_executor = None
+        self.pending = None
+        self.routes = {
+            ('POST', '/api/analyze-text'): self.analyze_text,
+            ('POST', '/api/check-fake-news'): self.check_fake_news,
+            ('POST', '/api/analyze-image'): self.analyze_image,
+            ('GET', '/api/health'): self.health,
+            ('GET', '/api/ready'): self.ready
+        }
+        self.paths = {path for _, path in self.routes}
+
+    def start(self):
+        """Create the text executor; done on lifespan startup or the first request"""
+        if self.executor is not None:
+            return
+        if self.executor_kind == 'process':
+            # Fork, so workers start with the parent's detectors instead of rebuilding them
+            flask_app.warm_up()
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='asgi-detector')
+        # Threads that decode animated GIFs and hand their frames to the image
+        # pool; a GIF cannot run on that pool itself and wait for its own frames
+        self.media_executor = ThreadPoolExecutor(
+            max(1, flask_app.IMAGE_QUEUE_SIZE // flask_app.VIDEO_PARALLEL_FRAMES), thread_name_prefix='asgi-media'
+        )
+        self.pending = asyncio.Semaphore(self.max_pending)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.media_executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, scope, receive, send):
+        self.start()
+        path = scope['path']
+        method = scope['method']
+        if method == 'OPTIONS' and path in self.paths:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': PREFLIGHT_HEADERS})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        route = self.routes.get((method, path))
+        endpoint = path if route is not None else 'unmatched'
+        headers = Headers([(name.decode('latin-1'), value.decode('latin-1'))
+                           for name, value in scope['headers']])
+        args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        request = {
+            "headers": headers,
+            "receive": receive,
+            "compact": wants_compact(args, headers),
+            "timing": flask_app.TIMING_HEADER_ALWAYS or 'X-Timing' in headers,
+            "breakdown": None
+        }
+
+        started = time.perf_counter()
+        flask_app.IN_FLIGHT.labels(endpoint).inc()
+        flask_app.INPUT_BYTES.labels(endpoint).observe(int(headers.get('Content-Length') or 0))
+        admitted = None
+        extra_headers = []
+        try:
+            if route is None:
+                raise HTTPError(405 if path in self.paths else 404,
+                                "Method not allowed" if path in self.paths else "Not found")
+            # Read before admission, so a slow upload does not hold an in-flight slot
+            if method == 'POST':
+                request["body"] = await read_body(receive, flask_app.app.config['MAX_CONTENT_LENGTH'])
+            admitted = await self.admit(endpoint, headers, scope)
+            status, payload = await route(request)
+        except HTTPError as e:
+            status, payload, extra_headers = e.status, e.payload, e.headers
+        except ClientDisconnected:
+            # Nobody to answer; 499 as nginx logs it
+            status, payload = 499, None
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        finally:
+            flask_app.IN_FLIGHT.labels(endpoint).dec()
+            if admitted is not None:
+                flask_app.admission.release(*admitted)
+
+        elapsed = time.perf_counter() - started
+        outcome = 'success' if status < 400 else 'client_error' if status < 500 else 'server_error'
+        flask_app.REQUESTS_TOTAL.labels(endpoint, outcome).inc()
+        flask_app.REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+        if payload is None:
+            return
+
+        breakdown = request["breakdown"]
+        if request["timing"]:
+            breakdown = dict(breakdown or {})
+            breakdown['total'] = elapsed
+            extra_headers.append((b'x-timing', format_breakdown(breakdown).encode('latin-1')))
+        await self.respond(send, request, status, payload, extra_headers)
+
+    async def admit(self, endpoint, headers, scope):
+        """(traffic class, endpoint) the request was admitted under, or None when exempt"""
+        admission = flask_app.admission
+        if admission is None or endpoint in flask_app.ADMISSION_EXEMPT:
+            return None
+        traffic_class = 'image' if endpoint in flask_app.IMAGE_ENDPOINTS else 'text'
+        # Waits in the short queue with asyncio.sleep, so neither the loop nor a thread blocks
+        rejection = await admission.admit_async(traffic_class, self.client_id(headers, scope), endpoint)
+        if rejection is not None:
+            message = "Rate limit exceeded" if rejection["reason"] == 'rate_limited' else \
+                "Server is at capacity, retry shortly"
+            error = HTTPError(rejection["status"], message,
+                              [(b'retry-after', str(rejection["retry_after"]).encode('latin-1'))])
+            error.payload["retry_after"] = rejection["retry_after"]
+            raise error
+        return traffic_class, endpoint
+
+    @staticmethod
+    def client_id(headers, scope):
+        """Same rate-limit identity as app.client_id()"""
+        api_key = headers.get('X-API-Key')
+        if api_key and api_key in flask_app.ADMISSION_API_KEYS:
+            return f"key:{api_key}"
+        if flask_app.ADMISSION_TRUST_PROXY and headers.get('X-Forwarded-For'):
+            return f"ip:{headers['X-Forwarded-For'].split(',')[0].strip()}"
+        client = scope.get('client')
+        return f"ip:{client[0] if client else None}"
+
+    async def offload(self, request, executor, release, timeout, handler, *args):
+        """Run handler on executor and wait for it or the client to go away
+
+        release frees the caller's queue slot once the work has really
+        finished. Work that has not started when the client disconnects (or
+        the timeout passes) is cancelled; running work completes and its
+        result is dropped.
+        """
+        try:
+            future = executor.submit(run_handler, handler, request["timing"], *args)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda _: release())
+
+        waiter = asyncio.wrap_future(future)
+        disconnect = asyncio.ensure_future(wait_disconnect(request["receive"]))
+        try:
+            done, _ = await asyncio.wait({waiter, disconnect}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not waiter.done():
+                waiter.cancel()
+        if waiter in done:
+            status, payload, request["breakdown"] = waiter.result()
+            return status, payload
+        if disconnect in done:
+            raise ClientDisconnected()
+        return None
+
+    async def offload_text(self, request, handler):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(self.pending.acquire(), ASGI_QUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise HTTPError(503, "Server is at capacity, retry shortly") from None
+        release = lambda: loop.call_soon_threadsafe(self.pending.release)
+        return await self.offload(request, self.executor, release, None, handler, request["body"])
+
+    async def analyze_text(self, request):
+        return await self.offload_text(request, analyze_text)
+
+    async def check_fake_news(self, request):
+        return await self.offload_text(request, check_fake_news)
+
+    async def analyze_image(self, request):
+        if flask_app.image_moderator is None:
+            raise HTTPError(501, "Image analysis not available. Install opencv-python first.")
+        data = await asyncio.to_thread(image_upload, request["body"], request["headers"].get('Content-Type', ''))
+        if data is None:
+            raise HTTPError(400, "No image provided")
+
+        from modules.video_moderator import is_animated_gif
+        if is_animated_gif(data):
+            # analyze_media takes the frames' slots and stops itself at VIDEO_TIMEOUT_S
+            return await self.offload(request, self.media_executor, lambda: None, None, analyze_gif, data)
+
+        # Same bounded pool and queue as the Flask routes; OpenCV releases the GIL
+        if not flask_app.image_slots.acquire(blocking=False):
+            raise HTTPError(503, "Image analysis is at capacity, retry shortly")
+        result = await self.offload(request, flask_app.image_pool, flask_app.image_slots.release,
+                                    flask_app.IMAGE_TIMEOUT_S, analyze_image, data)
+        if result is None:
+            raise HTTPError(504, "Image analysis timed out")
+        return result
+
+    async def health(self, request):
+        response = {"status": "healthy", "message": "API is running", "server": "asgi"}
+        if flask_app.artifact_watcher is not None and flask_app.artifact_watcher.loaded:
+            response["artifact"] = {
+                "version": flask_app.artifact_watcher.current.version,
+                "created": flask_app.artifact_watcher.current.created
+            }
+        return 200, response
+
+    async def ready(self, request):
+        components = {
+            component.name: round(component.load_seconds * 1000, 1) if component.loaded else None
+            for component in flask_app.COMPONENTS
+        }
+        if all(component.loaded for component in flask_app.COMPONENTS):
+            return 200, {"status": "ready", "load_ms": components}
+        flask_app.start_warm_up()
+        return 503, {"status": "loading", "load_ms": components}
+
+    async def respond(self, send, request, status, payload, extra_headers):
+        """Encode payload the way the Flask JSON provider does and send it"""
+        headers = request["headers"]
+        if request["compact"]:
+            payload = compact(payload)
+        mimetype = parse_accept_header(headers.get('Accept'), MIMEAccept).best_match(
+            response_mimetypes(), JSON_MIMETYPE
+        )
+        default = flask_app.app.json.default
+        if mimetype != JSON_MIMETYPE:
+            body = dumps_msgpack(payload, default)
+        else:
+            body = dumps_orjson(payload, default)
+            if body is None:
+                body = json.dumps(payload, default=default, sort_keys=True).encode('utf-8')
+
+        response_headers = [
+            (b'content-type', mimetype.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            (b'vary', b'Accept, Prefer')
+        ] + CORS_HEADERS + extra_headers
+        if request["compact"] and 'Prefer' in headers:
+            response_headers.append((b'preference-applied', b'return=minimal'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = ModerationASGI()
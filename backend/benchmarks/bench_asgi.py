@@ -0,0 +1,185 @@
+"""Load-test the Flask (gunicorn) and ASGI (uvicorn) serving paths at rising concurrency
+
+Each server runs as it would be deployed, in its own process, and is driven
+over HTTP/1.1 keep-alive connections from one asyncio client, so a thousand
+concurrent connections do not need a thousand client threads:
+
+    python benchmarks/bench_asgi.py --concurrency 1,10,100,1000 --requests 4000 --workers 2
+
+Results go to a JSON file in the suite.py format; a server whose package is
+not installed is skipped.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from harness import print_table, save_results, summarize
+from suite import REQUESTS
+
+ROUTES = ("analyze_text", "check_fake_news")
+
+
+def server_command(kind, port, workers, flask_threads):
+    if kind == 'flask':
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+                   '--log-level', 'warning', '--backlog', '4096']
+        if flask_threads > 1:
+            command += ['-k', 'gthread', '--threads', str(flask_threads)]
+        return command + ['app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning', '--no-access-log', '--backlog', '4096']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, timeout=60):
+    env = dict(os.environ)
+    # Measure the serving path, not the result cache or one client's rate limit
+    env.setdefault('RESULT_CACHE', 'off')
+    env.setdefault('ADMISSION', 'off')
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}: {' '.join(command)}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not come up: {' '.join(command)}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def build_request(path, payload):
+    body = json.dumps(payload).encode('utf-8')
+    return (f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body
+
+
+async def send_request(conn, port, request):
+    """Send one request, reconnecting when needed; (status, connection to reuse or None)"""
+    if conn is None:
+        conn = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = conn
+    writer.write(request)
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split()[1])
+    headers = {}
+    for line in head[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    # gunicorn's sync workers close the connection after every response
+    if headers.get('connection') == 'close':
+        writer.close()
+        conn = None
+    return status, conn
+
+
+async def run_level(port, request, concurrency, total_requests, timeout=30):
+    """Send total_requests over `concurrency` concurrent keep-alive connections"""
+    per_client = max(1, total_requests // concurrency)
+    latencies = []
+    errors = [0]
+
+    async def client():
+        conn = None
+        for _ in range(per_client):
+            start = time.perf_counter_ns()
+            try:
+                status, conn = await asyncio.wait_for(send_request(conn, port, request), timeout)
+                if status >= 500:
+                    errors[0] += 1
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                errors[0] += 1
+                if conn is not None:
+                    conn[1].close()
+                conn = None
+            latencies.append(time.perf_counter_ns() - start)
+        if conn is not None:
+            conn[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    stats = summarize(latencies, time.perf_counter() - started)
+    stats["errors"] = errors[0]
+    return stats
+
+
+def bench_server(kind, levels, total_requests, workers, flask_threads):
+    port = free_port()
+    process = start_server(server_command(kind, port, workers, flask_threads), port)
+    results = {}
+    try:
+        for name in ROUTES:
+            request = build_request(*REQUESTS[name])
+            # Warm up every worker process before measuring
+            asyncio.run(run_level(port, request, workers * 4, workers * 40))
+            for concurrency in levels:
+                results[f"{kind}.{name}.c{concurrency}"] = asyncio.run(
+                    run_level(port, request, concurrency, max(total_requests, concurrency))
+                )
+    finally:
+        stop_server(process)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Flask vs ASGI serving benchmark")
+    parser.add_argument('--requests', type=int, default=4000, help="Requests per load level")
+    parser.add_argument('--concurrency', default='1,10,100,1000', help="Comma-separated load levels")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Server worker processes")
+    parser.add_argument('--flask-threads', type=int, default=1,
+                        help="Threads per gunicorn worker (1 = the documented sync workers)")
+    parser.add_argument('--only', help="Comma-separated servers: flask, asgi")
+    parser.add_argument('--output', default=os.path.join(BACKEND_DIR, 'benchmarks', 'asgi_results.json'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    servers = args.only.split(',') if args.only else ['flask', 'asgi']
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    # Thousands of client and server sockets in one run
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 65536)), hard))
+
+    results = {}
+    for kind in servers:
+        package = 'gunicorn' if kind == 'flask' else 'uvicorn'
+        if importlib.util.find_spec(package) is None:
+            print(f"Skipping {kind}: {package} is not installed", file=sys.stderr)
+            continue
+        results.update(bench_server(kind, levels, args.requests, args.workers, args.flask_threads))
+
+    print_table(results)
+    save_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Live chat sessions at tens of thousands of concurrent conversations
+
+Messages are sent round-robin across every conversation, the worst case
+for locality, and each call to ChatSessions.add_message is timed next to
+a stateless HateSpeechDetector.predict of the same message, both with
+state in memory and in the SQLite file workers share. A second pass
+under tracemalloc measures the memory each conversation holds, and a run
+with half as many session slots as conversations shows eviction keeping
+it bounded:
+
+    python benchmarks/bench_chat.py --conversations 1000,10000,50000 --messages 10 --threads 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from harness import print_table, save_results, summarize
+from modules.chat_session import ChatSessions
+from modules.hate_speech_detector import HateSpeechDetector
+
+MESSAGES = [
+    "hey, how is everyone doing tonight?",
+    "did you see the match yesterday",
+    "lol that was a great play",
+    "you are such an idiot",
+    "stu",
+    "pid",
+    "ok",
+    "I think the referee got that one wrong, honestly",
+    "whatever, loser",
+    "brb getting food",
+    "this stream is laggy again",
+    "nobody asked, moron",
+]
+
+
+def conversation_messages(conversations, messages, seed=7):
+    """(conversation id, text) pairs, one message per conversation per round"""
+    rng = random.Random(seed)
+    ids = [f"conv-{i}" for i in range(conversations)]
+    return [(conversation_id, rng.choice(MESSAGES)) for _ in range(messages) for conversation_id in ids]
+
+
+def run(fn, items, threads):
+    """Call fn on every item from `threads` threads; per-call latencies and wall time"""
+    latencies = [[] for _ in range(threads)]
+
+    def worker(slot):
+        clock = time.perf_counter_ns
+        out = latencies[slot]
+        for item in items[slot::threads]:
+            start = clock()
+            fn(*item)
+            out.append(clock() - start)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return [value for values in latencies for value in values], time.perf_counter() - started
+
+
+def session_memory(detector, conversations, messages, max_sessions):
+    """(live conversations, bytes they hold) once every conversation has sent its messages"""
+    sessions = ChatSessions(detector, max_sessions=max_sessions)
+    items = conversation_messages(conversations, messages)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for conversation_id, text in items:
+        sessions.add_message(conversation_id, text)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return len(sessions), held
+
+
+def bench_level(detector, conversations, messages, threads):
+    """Latency results and memory results for one conversation count"""
+    items = conversation_messages(conversations, messages)
+    sessions = ChatSessions(detector, max_sessions=conversations)
+    timings = {}
+    latencies, elapsed = run(lambda _, text: detector.predict(text), items, threads)
+    timings[f"chat.stateless.c{conversations}"] = summarize(latencies, elapsed)
+    latencies, elapsed = run(sessions.add_message, items, threads)
+    timings[f"chat.session.c{conversations}"] = summarize(latencies, elapsed)
+    with tempfile.TemporaryDirectory() as directory:
+        shared = ChatSessions(detector, max_sessions=conversations, store_path=os.path.join(directory, 'chat'))
+        latencies, elapsed = run(shared.add_message, items, threads)
+    timings[f"chat.shared.c{conversations}"] = summarize(latencies, elapsed)
+
+    memory = {}
+    # Half the slots: the least recently used half is evicted as the rest keep talking
+    for name, max_sessions in (("all", conversations), ("half", conversations // 2)):
+        held, size = session_memory(detector, conversations, messages, max_sessions)
+        memory[f"chat.memory.{name}.c{conversations}"] = {
+            "sessions": held, "bytes_held": size, "bytes_per_session": round(size / held)
+        }
+    return timings, memory
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Live chat session benchmark")
+    parser.add_argument('--conversations', default='1000,10000,50000', help="Comma-separated conversation counts")
+    parser.add_argument('--messages', type=int, default=10, help="Messages per conversation")
+    parser.add_argument('--threads', type=int, default=1, help="Threads sending messages")
+    parser.add_argument('--output', default=os.path.join(BACKEND_DIR, 'benchmarks', 'chat_results.json'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Rule-based scoring without a result cache, so every message is scored
+    detector = HateSpeechDetector()
+
+    timings, memory = {}, {}
+    for conversations in (int(level) for level in args.conversations.split(',')):
+        level_timings, level_memory = bench_level(detector, conversations, args.messages, args.threads)
+        timings.update(level_timings)
+        memory.update(level_memory)
+
+    print_table(timings)
+    print()
+    print(f"{'memory':<44} {'sessions':>10} {'MB held':>10} {'bytes/session':>14}")
+    for name, stats in memory.items():
+        print(f"{name:<44} {stats['sessions']:>10} {stats['bytes_held'] / 1e6:>10.1f} "
+              f"{stats['bytes_per_session']:>14}")
+    save_results(args.output, {**timings, **memory})
+
+
+if __name__ == '__main__':
+    main()
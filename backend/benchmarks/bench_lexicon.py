@@ -0,0 +1,67 @@
+"""Per-request latency of keyword matching as the lexicon grows
+
+Compares the old substring scan (one `keyword in text` per term) with the
+compiled LexiconMatcher. Run from the backend directory:
+
+    python benchmarks/bench_lexicon.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.lexicon_matcher import LexiconMatcher
+
+LEXICON_SIZES = [30, 1000, 10000, 50000]
+SAMPLE_TEXT = (
+    "Honestly this thread is getting out of hand, you are a stupid loser and "
+    "everyone here knows it. Hello to the class, please keep the discussion "
+    "civil and on topic or the moderators will step in."
+)
+
+
+def random_terms(count, seed=0):
+    """Synthetic lexicon of single words and short phrases"""
+    rng = random.Random(seed)
+    terms = ['stupid', 'loser', 'hell', 'ass']
+    while len(terms) < count:
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+                 for _ in range(rng.choice([1, 1, 1, 2, 3]))]
+        terms.append(' '.join(words))
+    return terms
+
+
+def substring_scan(terms, text):
+    """The original rule_based_detection loop"""
+    text_lower = text.lower()
+    return [term for term in terms if term in text_lower]
+
+
+def time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    print(f"{'terms':>8} {'build ms':>10} {'substring us':>14} {'matcher us':>12}")
+    for size in LEXICON_SIZES:
+        terms = random_terms(size)
+
+        start = time.perf_counter()
+        matcher = LexiconMatcher(terms)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        repeat = max(20, 20000 // size)
+        substring_us = time_per_call(lambda: substring_scan(terms, SAMPLE_TEXT), repeat)
+        matcher_us = time_per_call(lambda: matcher.find_all(SAMPLE_TEXT), 2000)
+
+        print(f"{size:>8} {build_ms:>10.1f} {substring_us:>14.1f} {matcher_us:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
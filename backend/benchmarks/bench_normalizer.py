@@ -0,0 +1,60 @@
+"""Per-call cost of text cleaning: the old regex chain against TextNormalizer
+
+The chain is what preprocess_text used to run (lower() then one re.sub per
+URL, mention, hashtag and punctuation pass). TextNormalizer also undoes
+Unicode and leetspeak obfuscation, yet still runs faster. The offsets column
+is the highlighting path, which also maps each character back to the input.
+Run from the backend directory:
+
+    python benchmarks/bench_normalizer.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.text_normalizer import CLEAN_NORMALIZER, MATCH_NORMALIZER
+
+SAMPLES = {
+    "plain tweet": "honestly this thread is getting out of hand and everyone here knows it",
+    "tweet": "RT @someone: you are such a l0ser lol... check https://t.co/abc123 #Monday",
+    "obfuscated": "ｙｏｕ ａｒｅ an 1d10t, a s.t.u.p.i.d l0ser and everyone k n o w s it",
+    "article": ("According to Reuters, officials confirmed the report on Tuesday. It's a "
+                "2024 update; see www.example.com or @reuters for more. " * 40),
+}
+
+
+def regex_chain(text):
+    """The original HateSpeechDetector.preprocess_text"""
+    text = text.lower()
+    text = re.sub(r'http\S+|www\S+|https\S+', '', text)
+    text = re.sub(r'@\w+', '', text)
+    text = re.sub(r'#\w+', '', text)
+    text = re.sub(r'[^\w\s]', '', text)
+    return text.strip()
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'sample':>12} {'chars':>6} {'chain us':>9} {'clean us':>9} {'match us':>9} {'offsets us':>11}")
+    for name, text in SAMPLES.items():
+        number = max(20, 200000 // len(text))
+        chain_us = time_per_call(lambda: regex_chain(text), number)
+        clean_us = time_per_call(lambda: CLEAN_NORMALIZER.normalize(text).strip(), number)
+        match_us = time_per_call(lambda: MATCH_NORMALIZER.normalize(text), number)
+        offsets_us = time_per_call(lambda: MATCH_NORMALIZER.normalize_with_offsets(text), number)
+        print(f"{name:>12} {len(text):>6} {chain_us:>9.2f} {clean_us:>9.2f} {match_us:>9.2f} {offsets_us:>11.2f}")
+
+    print()
+    for name, text in SAMPLES.items():
+        if name != "article":
+            print(f"{name:>12}: {regex_chain(text)!r}\n{'':>12}  {CLEAN_NORMALIZER.normalize(text).strip()!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Import and boot time of the API, so startup regressions get caught
+
+Each run starts a fresh interpreter and times importing app.py, the first
+health check, the first text request (which builds what it needs) and the
+warm-up of the remaining components:
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --baseline benchmarks/startup_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from harness import compare, load_results, print_table, save_results, summarize
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/health')
+health = time.perf_counter()
+client.post('/api/analyze-text', json={"text": "startup probe"})
+first_text = time.perf_counter()
+app.warm_up()
+warm = time.perf_counter()
+print(json.dumps({
+    "import_app": imported - started,
+    "first_health": health - started,
+    "first_text": first_text - started,
+    "warm_up": warm - first_text,
+    "components": {component.name: component.load_seconds for component in app.COMPONENTS}
+}))
+"""
+
+
+def run_probe(env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    # Interpreter start, import and warm-up, as a cold-started worker sees them
+    timings["process"] = time.perf_counter() - started
+    return timings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup benchmarks")
+    parser.add_argument('--runs', type=int, default=10, help="Fresh interpreters to time")
+    parser.add_argument('--output', default=os.path.join(BACKEND_DIR, 'benchmarks', 'startup_results.json'))
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline path")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed relative regression before failing (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ)
+    # Timings should not depend on what an earlier run left in the disk cache
+    env.setdefault('RESULT_CACHE', 'memory')
+    env.setdefault('ADMISSION', 'off')
+
+    samples = {}
+    for _ in range(args.runs):
+        timings = run_probe(env)
+        components = timings.pop("components")
+        for component, seconds in components.items():
+            timings[f"load.{component}"] = seconds
+        for stage, seconds in timings.items():
+            samples.setdefault(f"startup.{stage}", []).append(seconds * 1e9)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    print_table(results)
+    save_results(args.output, results)
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
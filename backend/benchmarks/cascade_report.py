@@ -0,0 +1,163 @@
+"""Accuracy and cost of the tiered cascade against running every item through the full model
+
+Scores a labeled dataset once with the classifier alone and once per
+uncertainty band with the cheap tier in front, then reports how many items
+each tier answered, time per item, and how far the cascade's verdicts
+drift from the full model's. Run from the backend directory:
+
+    python benchmarks/cascade_report.py --hate ../data/text/labeled_data.csv
+    python benchmarks/cascade_report.py --fake ../data/text/Fake.csv ../data/text/True.csv \\
+        --bands 0.2,0.8 0.25,0.85 0.3,0.9
+    python benchmarks/cascade_report.py --safe-images ../data/images/safe --unsafe-images ../data/images/unsafe
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.cascade import parse_band
+from modules.datasets import load_fake_news_csv, load_hate_speech_csv
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def scores(predicted, labels):
+    labels = np.asarray(labels, dtype=bool)
+    predicted = np.asarray(predicted, dtype=bool)
+    tp = np.sum(predicted & labels)
+    fp = np.sum(predicted & ~labels)
+    fn = np.sum(~predicted & labels)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": float(np.mean(predicted == labels)),
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    }
+
+
+def run(predict_batch, items, verdict, batch_size):
+    """Verdicts, tier counts and seconds per item for one configuration"""
+    results = []
+    started = time.perf_counter()
+    for start in range(0, len(items), batch_size):
+        results.extend(predict_batch(items[start:start + batch_size]))
+    elapsed = time.perf_counter() - started
+    tiers = collections.Counter(result.get("tier", "n/a") for result in results)
+    return [verdict(result) for result in results], tiers, elapsed / max(len(items), 1)
+
+
+def report(name, make_detector, items, labels, verdict, bands, batch_size):
+    print(f"\n{name}: {len(items)} items, {np.mean(labels):.1%} positive")
+    print(f"{'band':>12} {'tiers':>34} {'us/item':>9} {'saved':>7} {'acc':>7} {'f1':>7} {'agree':>7}")
+
+    full_verdicts, tiers, full_time = run(make_detector(None).predict_batch, items, verdict, batch_size)
+    if set(tiers) != {"model"}:
+        print(f"  No classifier loaded (tiers {dict(tiers)}); train one with train_models.py first")
+        return
+    full = scores(full_verdicts, labels)
+    print(f"{'full':>12} {'model 100%':>34} {full_time * 1e6:9.1f} {'':>7} "
+          f"{full['accuracy']:7.4f} {full['f1']:7.4f} {'':>7}")
+
+    for band in bands:
+        verdicts, tiers, elapsed = run(make_detector(band).predict_batch, items, verdict, batch_size)
+        cascade = scores(verdicts, labels)
+        shares = ' '.join(f"{tier} {count / len(items):.0%}" for tier, count in sorted(tiers.items()))
+        agreement = np.mean(np.array(verdicts) == np.array(full_verdicts))
+        print(f"{band[0]:>5},{band[1]:<6} {shares:>34} {elapsed * 1e6:9.1f} "
+              f"{1 - elapsed / full_time:7.1%} {cascade['accuracy']:7.4f} {cascade['f1']:7.4f} {agreement:7.2%}")
+
+
+def hate_report(args, bands):
+    from modules.hate_speech_detector import HateSpeechDetector
+
+    texts, labels = [], []
+    for path in args.hate:
+        for text, label in load_hate_speech_csv(path):
+            texts.append(text)
+            labels.append(label)
+    texts, labels = texts[:args.limit], labels[:args.limit]
+
+    model_path = os.path.join(args.model_dir, 'hate_speech_model.npz')
+    report("Hate speech", lambda band: HateSpeechDetector(model_path=model_path, cascade_band=band),
+           texts, labels, lambda result: result["is_hate_speech"], bands, args.batch_size)
+
+
+def fake_report(args, bands):
+    from modules.fake_news_detector import FakeNewsDetector
+
+    items, labels = [], []
+    for path in args.fake:
+        for title, content, label in load_fake_news_csv(path):
+            items.append({"title": title, "content": content})
+            labels.append(label)
+    # Fake.csv and True.csv are read one after the other; shuffle before --limit
+    order = np.random.default_rng(0).permutation(len(items))[:args.limit]
+    items, labels = [items[i] for i in order], [labels[i] for i in order]
+
+    model_path = os.path.join(args.model_dir, 'fake_news_model.npz')
+    report("Fake news", lambda band: FakeNewsDetector(model_path=model_path, cascade_band=band),
+           items, labels, lambda result: result["is_fake"], bands, args.batch_size)
+
+
+def image_report(args):
+    from modules.image_moderator import ImageModerator
+
+    paths, labels = [], []
+    for directory, label in ((args.safe_images, 0), (args.unsafe_images, 1)):
+        if not directory:
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(directory, name))
+                labels.append(label)
+    paths, labels = paths[:args.limit], labels[:args.limit]
+    images = [open(path, 'rb').read() for path in paths]
+
+    print(f"\nImages: {len(images)} items, {np.mean(labels):.1%} unsafe")
+    print(f"{'mode':>12} {'tiers':>34} {'ms/item':>9} {'saved':>7} {'acc':>7} {'f1':>7} {'agree':>7}")
+    runs = {}
+    for mode, cascade in (("full", False), ("cascade", True)):
+        moderator = ImageModerator(cascade=cascade, min_edge_density=args.min_edge_density)
+        runs[mode] = run(moderator.analyze_batch, images, lambda result: not result["is_safe"], len(images))
+
+    full_verdicts, _, full_time = runs["full"]
+    for mode, (verdicts, tiers, elapsed) in runs.items():
+        result = scores(verdicts, labels)
+        shares = ' '.join(f"{tier} {count / len(images):.0%}" for tier, count in sorted(tiers.items()))
+        agreement = np.mean(np.array(verdicts) == np.array(full_verdicts))
+        print(f"{mode:>12} {shares:>34} {elapsed * 1e3:9.1f} {1 - elapsed / full_time:7.1%} "
+              f"{result['accuracy']:7.4f} {result['f1']:7.4f} {agreement:7.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the inference cascade with the full model")
+    parser.add_argument('--hate', nargs='*', default=[], help="Labeled hate speech CSV files")
+    parser.add_argument('--fake', nargs='*', default=[], help="Labeled fake news CSV files")
+    parser.add_argument('--safe-images', help="Folder of images labeled safe")
+    parser.add_argument('--unsafe-images', help="Folder of images labeled unsafe")
+    parser.add_argument('--model-dir', default=os.environ.get('MODEL_PATH', '../models'))
+    parser.add_argument('--bands', nargs='+', default=['0.1,0.9', '0.2,0.7', '0.25,0.85', '0.3,0.6'],
+                        help="Uncertainty bands to try, as low,high")
+    parser.add_argument('--min-edge-density', type=float, default=0.0005)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--limit', type=int, help="Use at most this many items per dataset")
+    args = parser.parse_args()
+
+    if not (args.hate or args.fake or args.safe_images or args.unsafe_images):
+        parser.error("Pass --hate, --fake and/or image folders")
+    bands = [parse_band(band, None) for band in args.bands]
+    if args.hate:
+        hate_report(args, bands)
+    if args.fake:
+        fake_report(args, bands)
+    if args.safe_images or args.unsafe_images:
+        image_report(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Shared timing, statistics and baseline helpers for the benchmark scripts"""
+import json
+import math
+import time
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_ns, elapsed_s=None):
+    """p50/p95/p99 latency in microseconds plus throughput"""
+    values = sorted(latencies_ns)
+    count = len(values)
+    if elapsed_s is None:
+        elapsed_s = sum(values) / 1e9
+    return {
+        "count": count,
+        "p50_us": round(percentile(values, 50) / 1000, 2),
+        "p95_us": round(percentile(values, 95) / 1000, 2),
+        "p99_us": round(percentile(values, 99) / 1000, 2),
+        "mean_us": round(sum(values) / count / 1000, 2) if count else 0.0,
+        "throughput_per_s": round(count / elapsed_s, 1) if elapsed_s > 0 else 0.0
+    }
+
+
+def time_calls(fn, iterations, warmup=10):
+    """Call fn repeatedly and summarize per-call latency"""
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        start = clock()
+        fn()
+        latencies.append(clock() - start)
+    return summarize(latencies, (clock() - started) / 1e9)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, threshold):
+    """List regressions where p95 grew or throughput fell by more than threshold"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous.get("p95_us") and current["p95_us"] > previous["p95_us"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {previous['p95_us']}us -> {current['p95_us']}us"
+            )
+        if previous.get("throughput_per_s") and \
+                current["throughput_per_s"] < previous["throughput_per_s"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_per_s']}/s -> {current['throughput_per_s']}/s"
+            )
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':<44} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10} {'ops/s':>12}")
+    for name, stats in results.items():
+        print(f"{name:<44} {stats['p50_us']:>10} {stats['p95_us']:>10} "
+              f"{stats['p99_us']:>10} {stats['throughput_per_s']:>12}")
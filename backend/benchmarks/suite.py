@@ -0,0 +1,287 @@
+"""Self-contained benchmark and load-test suite (no running server needed)
+
+Micro-benchmarks the detector methods, drives the Flask app through its
+test client, then load-tests it over HTTP on an in-process server at a few
+concurrency levels. Results go to a JSON file that can be compared against
+a saved baseline:
+
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from harness import compare, load_results, print_table, save_results, summarize, time_calls
+
+SHORT_TEXT = "You are a stupid loser and everyone here knows it"
+LONG_TEXT = ("According to Reuters, officials confirmed the report on Tuesday. " * 40).strip()
+CLICKBAIT_TITLE = "SHOCKING: You won't believe this one weird trick doctors hate!!!"
+
+REQUESTS = {
+    "analyze_text": ('/api/analyze-text', {"text": SHORT_TEXT}),
+    "analyze_text_batch_100": ('/api/analyze-text/batch', {"texts": [SHORT_TEXT, LONG_TEXT] * 50}),
+    "analyze_text_batch_100_compact": ('/api/analyze-text/batch?compact=1', {"texts": [SHORT_TEXT, LONG_TEXT] * 50}),
+    "check_fake_news": ('/api/check-fake-news', {"title": CLICKBAIT_TITLE, "content": LONG_TEXT}),
+    "moderate": ('/api/moderate', {"text": SHORT_TEXT, "title": CLICKBAIT_TITLE})
+}
+
+
+def synthetic_images(directory, count=3, size=(480, 640)):
+    """Write random noise and block images to disk, return their paths"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        img = rng.integers(0, 255, size=(*size, 3), dtype=np.uint8)
+        img[size[0] // 4: size[0] // 2, size[1] // 4: size[1] // 2] = (0, 0, 200)
+        path = os.path.join(directory, f"synthetic_{i}.png")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    return paths
+
+
+def synthetic_clip(directory, seconds=4, fps=25, size=(480, 640)):
+    """Write a clip of mostly static scenes with a few noisy cuts, return its path"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(directory, "synthetic.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (size[1], size[0]))
+    for i in range(seconds * fps):
+        if i % (2 * fps) < 2:
+            frame = rng.integers(0, 255, size=(*size, 3), dtype=np.uint8)
+        else:
+            frame = np.full((*size, 3), (i // (2 * fps) * 40, 120, 60), dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def bench_detectors(iterations):
+    from modules.hate_speech_detector import HateSpeechDetector
+    from modules.fake_news_detector import FakeNewsDetector
+    from modules.near_duplicate import NearDuplicateIndex
+    from modules.text_classifier import TextClassifier
+
+    hate = HateSpeechDetector()
+    fake = FakeNewsDetector()
+    clusters = NearDuplicateIndex()
+    wave = [clusters.normalize(f"{LONG_TEXT[:200]} {i}") for i in range(1000)]
+    # Untrained weights score exactly as fast as trained ones
+    classifier = TextClassifier()
+    comments = [f"{SHORT_TEXT} {i}" for i in range(10000)]
+    return {
+        "hate.preprocess_text": time_calls(lambda: hate.preprocess_text(LONG_TEXT), iterations),
+        "hate.rule_based_detection": time_calls(lambda: hate.rule_based_detection(SHORT_TEXT), iterations),
+        "hate.predict_batch_1000": time_calls(lambda: hate.predict_batch([SHORT_TEXT] * 1000),
+                                              max(5, iterations // 200)),
+        "dedup.signatures_1000": time_calls(lambda: clusters.signatures(wave), max(5, iterations // 200)),
+        "classifier.predict_proba_10000": time_calls(lambda: classifier.predict_proba(comments),
+                                                     max(3, iterations // 500)),
+        "fake.check_clickbait": time_calls(lambda: fake.check_clickbait(CLICKBAIT_TITLE), iterations),
+        "fake.analyze_content": time_calls(lambda: fake.analyze_content(LONG_TEXT), iterations),
+        "fake.domain_lookup": time_calls(lambda: fake.domain_index.lookup('www.news.reuters.com'), iterations)
+    }
+
+
+def bench_metrics(iterations):
+    from modules.metrics import timed
+
+    def stage():
+        with timed('benchmark.noop'):
+            pass
+
+    return {"metrics.timed_stage": time_calls(stage, iterations * 10)}
+
+
+def bench_admission(iterations):
+    from modules.admission import AdmissionController, SharedLimiterState, TrafficClass
+
+    with tempfile.TemporaryDirectory() as directory:
+        admission = AdmissionController(SharedLimiterState(os.path.join(directory, 'admission')),
+                                        [TrafficClass('text')], rate=1e9, burst=1e9)
+
+        def admit():
+            admission.admit('text', 'ip:127.0.0.1')
+            admission.release('text')
+
+        return {"admission.admit_release": time_calls(admit, iterations * 10)}
+
+
+def bench_images(iterations):
+    try:
+        from modules.image_moderator import ImageModerator
+    except ImportError as e:
+        print(f"Skipping image benchmarks: {e}", file=sys.stderr)
+        return {}
+
+    moderator = ImageModerator()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = synthetic_images(directory)
+        state = {"i": 0}
+
+        def analyze():
+            state["i"] += 1
+            # OCR failures are printed by the moderator; keep them out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                moderator.analyze(paths[state["i"] % len(paths)])
+
+        results["image.analyze"] = time_calls(analyze, max(5, iterations // 100), warmup=1)
+
+        # Keyframe sampling and dedup against analyzing every frame of the same clip
+        from modules.video_moderator import VideoModerator
+        clip = synthetic_clip(directory)
+        sampled = VideoModerator(moderator)
+        every_frame = VideoModerator(moderator, sample_interval=0, min_interval=0, max_interval=0,
+                                     duplicate_threshold=-1, max_frames=10 ** 6)
+        for name, video_moderator in (("image.video_sampled", sampled), ("image.video_every_frame", every_frame)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = time_calls(lambda: video_moderator.analyze(clip), max(2, iterations // 1000),
+                                           warmup=0)
+    return results
+
+
+def bench_test_client(app, iterations):
+    client = app.test_client()
+    results = {}
+    for name, (path, payload) in REQUESTS.items():
+        results[f"client.{name}"] = time_calls(
+            lambda: client.post(path, json=payload), max(10, iterations // 10)
+        )
+    return results
+
+
+def run_load(port, path, payload, concurrency, total_requests):
+    """Send total_requests over `concurrency` keep-alive connections"""
+    body = json.dumps(payload)
+    headers = {"Content-Type": "application/json"}
+    per_worker = max(1, total_requests // concurrency)
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        errors = 0
+        for _ in range(per_worker):
+            start = time.perf_counter_ns()
+            try:
+                conn.request('POST', path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter_ns() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            failures.append(errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = summarize(latencies, time.perf_counter() - started)
+    stats["errors"] = sum(failures)
+    return stats
+
+
+def bench_load(app, concurrency_levels, total_requests):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    results = {}
+    try:
+        for name in ("analyze_text", "check_fake_news"):
+            path, payload = REQUESTS[name]
+            for concurrency in concurrency_levels:
+                results[f"load.{name}.c{concurrency}"] = run_load(
+                    server.port, path, payload, concurrency, total_requests
+                )
+    finally:
+        server.shutdown()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Detector and API benchmarks")
+    parser.add_argument('--iterations', type=int, default=2000, help="Calls per micro-benchmark")
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per load level")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated load levels")
+    parser.add_argument('--only', help="Comma-separated groups: detectors, images, client, load")
+    parser.add_argument('--output', default=os.path.join(BACKEND_DIR, 'benchmarks', 'results.json'))
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline path")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed relative regression before failing (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    groups = set(args.only.split(',')) if args.only else {'detectors', 'images', 'client', 'load'}
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    # The benchmarks measure the detectors, not the result cache
+    os.environ.setdefault('RESULT_CACHE', 'off')
+    # One client address would be rate limited long before the load test ends
+    os.environ.setdefault('ADMISSION', 'off')
+    results = {}
+    if 'detectors' in groups:
+        results.update(bench_detectors(args.iterations))
+        results.update(bench_metrics(args.iterations))
+        results.update(bench_admission(args.iterations))
+    if 'images' in groups:
+        results.update(bench_images(args.iterations))
+    if groups & {'client', 'load'}:
+        from app import app
+        if 'client' in groups:
+            results.update(bench_test_client(app, args.iterations))
+        if 'load' in groups:
+            results.update(bench_load(app, levels, args.requests))
+
+    print_table(results)
+    save_results(args.output, results)
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Bundle lexicon, models, domain and image hash indexes into one memory-mapped artifact
+
+Workers open the artifact read-only with mmap, so its pages are shared
+between processes, and pick up a rebuilt file while running:
+
+    python build_artifact.py -o ../models/moderation.artifact \\
+        --lexicon ../models/hate_lexicon.txt --domain-index ../models/domain_reputation.idx \\
+        --hash-index ../models/image_hashes.idx
+
+    MODERATION_ARTIFACT=../models/moderation.artifact python app.py
+
+Model files default to the ones train_models.py writes to MODEL_PATH.
+"""
+import argparse
+import json
+import os
+
+from modules.artifact import Artifact, ArtifactWriter
+from modules.domain_reputation import DomainReputationIndex
+from modules.hate_speech_detector import HateSpeechDetector
+from modules.lexicon_matcher import LexiconMatcher, load_lexicon_file
+from modules.text_classifier import TextClassifier
+
+
+def add_classifier(writer, name, path):
+    classifier = TextClassifier.load(path)
+    writer.add(name, {"weights": classifier.weights}, classifier.config(**classifier.metadata))
+    print(f"  {name}: {path} ({classifier.vectorizer.n_features} features, version {classifier.version})")
+
+
+def main():
+    model_path = os.environ.get('MODEL_PATH', '../models')
+    parser = argparse.ArgumentParser(description="Build a memory-mapped moderation artifact")
+    parser.add_argument('-o', '--output', required=True, help="Artifact file to write")
+    parser.add_argument('--lexicon', help="Hate lexicon file (default: the built-in keyword list)")
+    parser.add_argument('--hate-model', default=os.path.join(model_path, 'hate_speech_model.npz'))
+    parser.add_argument('--fake-model', default=os.path.join(model_path, 'fake_news_model.npz'))
+    parser.add_argument('--domain-index', help="Domain reputation index from build_domain_index.py")
+    parser.add_argument('--hash-index', help="Image hash index from build_hash_index.py")
+    args = parser.parse_args()
+
+    writer = ArtifactWriter()
+    print("Components:")
+
+    terms = load_lexicon_file(args.lexicon) if args.lexicon else HateSpeechDetector().hate_keywords
+    matcher = LexiconMatcher(terms)
+    writer.add('hate_lexicon', matcher.to_arrays(), {"terms": len(matcher), "version": matcher.version,
+                                                      "source": args.lexicon or "built-in"})
+    print(f"  hate_lexicon: {len(matcher)} terms (version {matcher.version})")
+
+    if os.path.exists(args.hate_model):
+        add_classifier(writer, 'hate_model', args.hate_model)
+    if os.path.exists(args.fake_model):
+        add_classifier(writer, 'fake_model', args.fake_model)
+
+    if args.domain_index:
+        index = DomainReputationIndex.load(args.domain_index)
+        writer.add('domain_reputation', index.to_arrays(), {"domains": len(index), "version": index.version})
+        print(f"  domain_reputation: {len(index)} domains (version {index.version})")
+
+    if args.hash_index:
+        # Image support is optional, so only import it when asked for
+        from modules.image_hash import PerceptualHashIndex
+        index = PerceptualHashIndex.load(args.hash_index)
+        writer.add('image_hashes', index.to_arrays(), {"entries": len(index), "max_distance": index.max_distance})
+        print(f"  image_hashes: {len(index)} entries")
+
+    version = writer.write(args.output)
+
+    # Read it back the way the server will, checksums included
+    artifact = Artifact(args.output)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {args.output}: version {version}, {size / 1024 / 1024:.1f} MB")
+    print(json.dumps({"version": artifact.version, "components": sorted(artifact.components)}))
+
+
+if __name__ == '__main__':
+    main()
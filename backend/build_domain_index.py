@@ -0,0 +1,36 @@
+"""Build a domain reputation index from domain,score lists
+
+Each input line is 'domain,score' (or tab-separated) with scores from 0
+(unreliable) to 1 (reliable); later files override earlier ones. The index
+is memory-mappable and the API loads it through DOMAIN_REPUTATION_PATH:
+
+    python build_domain_index.py -o ../models/domain_reputation.idx \\
+        ../data/domains/outlets.csv ../data/domains/overrides.csv
+"""
+import argparse
+import os
+import time
+
+from modules.domain_reputation import DomainReputationIndex, load_domain_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped domain reputation index")
+    parser.add_argument('inputs', nargs='+', help="domain,score files")
+    parser.add_argument('-o', '--output', required=True, help="Index file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries = []
+    for path in args.inputs:
+        entries.extend(load_domain_file(path))
+    index = DomainReputationIndex.build(entries)
+    index.save(args.output)
+
+    size = os.path.getsize(args.output)
+    print(f"Indexed {len(index)} domains from {len(entries)} lines in {time.perf_counter() - start:.1f}s; "
+          f"{args.output}: {size / 1024 / 1024:.1f} MB, version {index.version}")
+
+
+if __name__ == '__main__':
+    main()
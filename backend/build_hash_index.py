@@ -0,0 +1,64 @@
+"""Build a perceptual-hash index of already-classified images
+
+Hashes every image under the given folders and writes a memory-mappable
+index that the API loads through IMAGE_HASH_INDEX_PATH:
+
+    python build_hash_index.py -o ../models/image_hashes.idx \\
+        --unsafe ../data/images/nsfw/unsafe ../data/images/violence/violent \\
+        --safe ../data/images/nsfw/safe
+"""
+import argparse
+import os
+import sys
+
+import cv2
+
+from modules.image_hash import PerceptualHashIndex, phash
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tif', '.tiff')
+
+
+def iter_images(directories):
+    """Yield image paths under each directory"""
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def add_folder_hashes(index, directories, is_safe, confidence):
+    added = 0
+    for path in iter_images(directories):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"Skipping unreadable image: {path}", file=sys.stderr)
+            continue
+        index.add(phash(gray), is_safe, confidence)
+        added += 1
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a perceptual-hash index of labeled images")
+    parser.add_argument('-o', '--output', required=True, help="Index file to write")
+    parser.add_argument('--unsafe', nargs='*', default=[], help="Folders of known harmful images")
+    parser.add_argument('--safe', nargs='*', default=[], help="Folders of known safe images")
+    parser.add_argument('--append', action='store_true', help="Add to an existing index instead of replacing it")
+    parser.add_argument('--max-distance', type=int, default=6, help="Hamming radius for near-duplicates")
+    parser.add_argument('--confidence', type=float, default=0.9, help="Confidence stored with each verdict")
+    args = parser.parse_args()
+
+    if args.append and os.path.exists(args.output):
+        index = PerceptualHashIndex.load(args.output, max_distance=args.max_distance)
+    else:
+        index = PerceptualHashIndex(max_distance=args.max_distance)
+
+    unsafe = add_folder_hashes(index, args.unsafe, False, args.confidence)
+    safe = add_folder_hashes(index, args.safe, True, args.confidence)
+    index.save(args.output)
+    print(f"Indexed {unsafe} unsafe and {safe} safe images; {len(index)} entries in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Offline bulk moderation of JSONL/CSV files
+
+Streams records through the detectors on a multiprocessing pool and writes
+one JSONL result per input record, in input order. Memory stays flat: only
+a bounded number of chunks is in flight at any time.
+
+    python bulk_moderate.py comments.jsonl -o scored.jsonl
+    python bulk_moderate.py articles.csv -o scored.jsonl --detectors fake
+    python bulk_moderate.py comments.jsonl -o scored.jsonl --resume
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from modules.hate_speech_detector import HateSpeechDetector
+from modules.domain_reputation import DomainReputationIndex
+from modules.fake_news_detector import FakeNewsDetector
+
+DETECTORS = ('hate', 'fake')
+
+# Per-process detector state, created once by the pool initializer
+_worker = {}
+
+
+def read_records(path, fmt):
+    """Yield input records one at a time
+
+    CSV rows are parsed here since a row can span lines; JSONL lines are
+    passed through raw and decoded in the workers.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+            return
+
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def decode_record(record):
+    """Turn a raw JSONL line into a record dict"""
+    if isinstance(record, dict):
+        return record
+    try:
+        record = json.loads(record)
+    except ValueError as e:
+        return {"_error": f"Invalid JSON: {e}"}
+    if not isinstance(record, dict):
+        return {"_error": "Record must be a JSON object"}
+    return record
+
+
+def chunked(records, size):
+    """Group an iterator into lists of at most size records"""
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def init_worker(options):
+    """Build detectors once per worker process"""
+    _worker['options'] = options
+    if 'hate' in options['detectors']:
+        _worker['hate'] = HateSpeechDetector(
+            lexicon_path=options['lexicon'],
+            model_path=os.path.join(options['model_path'], 'hate_speech_model.npz')
+        )
+    if 'fake' in options['detectors']:
+        _worker['fake'] = FakeNewsDetector(
+            model_path=os.path.join(options['model_path'], 'fake_news_model.npz'),
+            # Memory-mapped, so every worker shares one copy of the pages
+            domain_index=DomainReputationIndex.load(options['domain_index']) if options['domain_index'] else None
+        )
+
+
+def moderate_chunk(start_offset, records):
+    """Score one chunk and return its serialized output lines"""
+    options = _worker['options']
+    records = [decode_record(record) for record in records]
+    outputs = []
+    for i, record in enumerate(records):
+        output = {"offset": start_offset + i}
+        if options['id_field'] in record:
+            output["id"] = record[options['id_field']]
+        if '_error' in record:
+            output["error"] = record['_error']
+        outputs.append(output)
+
+    valid = [i for i, record in enumerate(records) if '_error' not in record]
+
+    if 'hate' in _worker:
+        texts = [records[i].get(options['text_field'], '') or '' for i in valid]
+        for i, result in zip(valid, _worker['hate'].predict_batch(texts)):
+            outputs[i]["hate_speech"] = result
+
+    if 'fake' in _worker:
+        items = [{
+            "title": records[i].get(options['title_field'], '') or '',
+            "content": records[i].get(options['content_field'], '') or ''
+        } for i in valid]
+        for i, result in zip(valid, _worker['fake'].predict_batch(items)):
+            outputs[i]["fake_news"] = result
+
+    return [json.dumps(output, ensure_ascii=False) for output in outputs]
+
+
+def read_checkpoint(path):
+    """(records done, output bytes written) from a checkpoint file, or zeros"""
+    try:
+        with open(path) as f:
+            records, size = f.read().split()
+            return int(records), int(size)
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def write_checkpoint(path, offset, size):
+    """Atomically record how many input records and output bytes are done"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(f"{offset} {size}")
+    os.replace(tmp_path, path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score a JSONL/CSV backlog offline")
+    parser.add_argument('input', help="Input .jsonl or .csv file")
+    parser.add_argument('-o', '--output', required=True, help="Output .jsonl file")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Input format (default: from extension)")
+    parser.add_argument('--detectors', default='hate,fake', help="Comma-separated: hate, fake")
+    parser.add_argument('--text-field', default='text', help="Field scored for hate speech")
+    parser.add_argument('--title-field', default='title', help="Field used as news title")
+    parser.add_argument('--content-field', default='content', help="Field used as news content")
+    parser.add_argument('--id-field', default='id', help="Field copied to the output to identify records")
+    parser.add_argument('--lexicon', default=os.environ.get('HATE_LEXICON_PATH'), help="Hate lexicon file")
+    parser.add_argument('--domain-index', default=os.environ.get('DOMAIN_REPUTATION_PATH'),
+                        help="Domain reputation index from build_domain_index.py")
+    parser.add_argument('--model-path', default=os.environ.get('MODEL_PATH', '../models'),
+                        help="Directory with trained model files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Records per task")
+    parser.add_argument('--resume', action='store_true', help="Continue from the output's checkpoint")
+    parser.add_argument('--progress-every', type=float, default=5.0, help="Seconds between progress reports")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    detectors = [name.strip() for name in args.detectors.split(',') if name.strip()]
+    unknown = set(detectors) - set(DETECTORS)
+    if unknown or not detectors:
+        sys.exit(f"Unknown detectors: {', '.join(sorted(unknown)) or '(none given)'}")
+
+    checkpoint_path = args.output + '.checkpoint'
+    start, output_size = read_checkpoint(checkpoint_path) if args.resume else (0, 0)
+    if start:
+        print(f"Resuming after {start} records", file=sys.stderr)
+
+    options = {
+        "detectors": detectors,
+        "lexicon": args.lexicon,
+        "domain_index": args.domain_index,
+        "model_path": args.model_path,
+        "text_field": args.text_field,
+        "title_field": args.title_field,
+        "content_field": args.content_field,
+        "id_field": args.id_field
+    }
+
+    records = itertools.islice(read_records(args.input, fmt), start, None)
+    # A few chunks per worker keeps every core busy without reading ahead unboundedly
+    max_in_flight = max(2, args.workers * 2)
+
+    offset = start
+    done = 0
+    started = time.perf_counter()
+    last_report = started
+
+    with Pool(args.workers, initializer=init_worker, initargs=(options,)) as pool, \
+            open(args.output, 'ab' if args.resume else 'wb') as out:
+        # Drop any lines written after the last checkpoint so nothing is duplicated
+        out.truncate(output_size)
+        out.seek(output_size)
+        pending = deque()
+        chunks = chunked(records, args.chunk_size)
+        chunk_offset = start
+
+        while True:
+            while len(pending) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append((len(chunk), pool.apply_async(moderate_chunk, (chunk_offset, chunk))))
+                chunk_offset += len(chunk)
+
+            if not pending:
+                break
+
+            # Results are written strictly in submission order
+            size, result = pending.popleft()
+            lines = result.get()
+            out.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            out.flush()
+            offset += size
+            done += size
+            write_checkpoint(checkpoint_path, offset, out.tell())
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_every:
+                rate = done / (now - started)
+                print(f"{offset} records written ({rate:,.0f} records/sec)", file=sys.stderr)
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {done} records in {elapsed:.1f}s ({rate:,.0f} records/sec), "
+          f"{offset} total in {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
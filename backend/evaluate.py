@@ -0,0 +1,290 @@
+"""Offline evaluation: quality and speed of each detector version in one run
+
+Scores the labeled CSVs from data/DATASETS.md with every detector variant
+(keyword rules / fixed-weight heuristic, each model directory's classifier,
+and the classifier behind the inference cascade) on a process pool across
+all cores. Prints precision, recall and F1 next to per-item latency and
+throughput, side by side per variant:
+
+    python evaluate.py --hate ../data/text/labeled_data.csv --fake ../data/text/Fake.csv ../data/text/True.csv
+    python evaluate.py --hate ../data/text/labeled_data.csv --model-dir ../models ../models-candidate
+
+Scores can be kept and re-swept over other thresholds without re-scoring;
+a sweep is one sort plus a binary search per threshold:
+
+    python evaluate.py --hate ../data/text/labeled_data.csv --save-scores eval.npz --sweep
+    python evaluate.py --load-scores eval.npz --sweep 0.3:0.9:0.02
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from modules.cascade import parse_band
+from modules.datasets import load_fake_news_csv, load_hate_speech_csv
+
+TASKS = {
+    "hate": ("Hate speech", "is_hate_speech"),
+    "fake": ("Fake news", "is_fake")
+}
+
+# Per-process detectors, one per variant, created once by the pool initializer
+_worker = {}
+
+
+def build_variants(args):
+    """(task, name, detector kwargs) for every variant to compare"""
+    variants = []
+    for task, model_file, band in (("hate", 'hate_speech_model.npz', args.hate_band),
+                                   ("fake", 'fake_news_model.npz', args.fake_band)):
+        if not getattr(args, task):
+            continue
+        # Without a model file the detector falls back to its fixed rules
+        variants.append((task, "rules" if task == "hate" else "heuristic", {}))
+        for model_dir in args.model_dir:
+            model_path = os.path.join(model_dir, model_file)
+            if not os.path.exists(model_path):
+                print(f"No {model_file} in {model_dir}; skipping its variants", file=sys.stderr)
+                continue
+            label = os.path.basename(os.path.normpath(model_dir))
+            variants.append((task, f"model:{label}", {"model_path": model_path}))
+            variants.append((task, f"cascade:{label}", {"model_path": model_path, "cascade_band": band}))
+    return variants
+
+
+def make_detector(task, kwargs, options):
+    if task == "hate":
+        from modules.hate_speech_detector import HateSpeechDetector
+        return HateSpeechDetector(lexicon_path=options['lexicon'], **kwargs)
+    from modules.domain_reputation import DomainReputationIndex
+    from modules.fake_news_detector import FakeNewsDetector
+    domain_index = DomainReputationIndex.load(options['domain_index']) if options['domain_index'] else None
+    return FakeNewsDetector(domain_index=domain_index, **kwargs)
+
+
+def detector_version(detector):
+    return f"{detector.VERSION}:{detector.lexicon_version}:{detector.model_version}"
+
+
+def init_worker(variants, options):
+    """Build every variant's detector once per worker process"""
+    _worker['detectors'] = [make_detector(task, kwargs, options) for task, _, kwargs in variants]
+    _worker['variants'] = variants
+
+
+def score_chunk(variant, items):
+    """(scores, verdicts, latencies in ns) for one chunk, one predict() call per item as the API makes"""
+    task = _worker['variants'][variant][0]
+    detector = _worker['detectors'][variant]
+    verdict_field = TASKS[task][1]
+    clock = time.perf_counter_ns
+    scores = np.zeros(len(items), dtype=np.float32)
+    verdicts = np.zeros(len(items), dtype=bool)
+    latencies = np.zeros(len(items), dtype=np.int64)
+    for i, item in enumerate(items):
+        start = clock()
+        result = detector.predict(item) if task == "hate" else detector.predict(*item)
+        latencies[i] = clock() - start
+        scores[i] = result["confidence"]
+        verdicts[i] = result[verdict_field]
+    return scores, verdicts, latencies
+
+
+def load_task(task, paths, limit):
+    """Items and labels of one task, shuffled so --limit draws from every file"""
+    items, labels = [], []
+    for path in paths:
+        if task == "hate":
+            for text, label in load_hate_speech_csv(path):
+                items.append(text)
+                labels.append(label)
+        else:
+            for title, content, label in load_fake_news_csv(path):
+                items.append((title, content))
+                labels.append(label)
+    # Same seed for both tasks, so runs with one --limit score the same items
+    order = np.random.default_rng(0).permutation(len(items))
+    items, labels = [items[i] for i in order], [labels[i] for i in order]
+    return items[:limit], np.array(labels[:limit], dtype=bool)
+
+
+def confusion(predicted, labels):
+    """Precision, recall, F1 and accuracy from boolean arrays"""
+    tp = int(np.sum(predicted & labels))
+    fp = int(np.sum(predicted & ~labels))
+    fn = int(np.sum(~predicted & labels))
+    return rates(tp, fp, fn, len(labels))
+
+
+def rates(tp, fp, fn, total):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "accuracy": (total - fp - fn) / total if total else 0.0
+    }
+
+
+def sweep(scores, labels, thresholds):
+    """Rates of `score > threshold` for every threshold, from one sort of the scores"""
+    order = np.argsort(scores, kind='stable')
+    sorted_scores = scores[order]
+    # Positives at or after each sorted position, with a trailing 0
+    positives_from = np.zeros(len(scores) + 1, dtype=np.int64)
+    positives_from[:-1] = np.cumsum(labels[order][::-1])[::-1]
+    first_above = np.searchsorted(sorted_scores, thresholds, side='right')
+    tp = positives_from[first_above]
+    predicted = len(scores) - first_above
+    fp = predicted - tp
+    fn = positives_from[0] - tp
+    return [dict(threshold=float(threshold), positive_share=predicted[i] / max(len(scores), 1),
+                 **rates(int(tp[i]), int(fp[i]), int(fn[i]), len(scores)))
+            for i, threshold in enumerate(thresholds)]
+
+
+def score_variants(args, variants, datasets):
+    """Scores of every variant, each run across the whole pool, plus wall-clock seconds"""
+    options = {"lexicon": args.lexicon, "domain_index": args.domain_index}
+    runs = []
+    with Pool(args.workers, initializer=init_worker, initargs=(variants, options)) as pool:
+        detectors = [make_detector(task, kwargs, options) for task, _, kwargs in variants]
+        for index, (task, name, _) in enumerate(variants):
+            items, labels = datasets[task]
+            chunks = [items[start:start + args.chunk_size] for start in range(0, len(items), args.chunk_size)]
+            started = time.perf_counter()
+            parts = pool.starmap(score_chunk, [(index, chunk) for chunk in chunks])
+            elapsed = time.perf_counter() - started
+            runs.append({
+                "task": task,
+                "variant": name,
+                "version": detector_version(detectors[index]),
+                "seconds": elapsed,
+                "workers": args.workers,
+                "labels": labels,
+                "scores": np.concatenate([part[0] for part in parts]),
+                "verdicts": np.concatenate([part[1] for part in parts]),
+                "latencies": np.concatenate([part[2] for part in parts])
+            })
+            print(f"  {TASKS[task][0]} / {name}: {len(items)} items in {elapsed:.1f}s", file=sys.stderr)
+    return runs
+
+
+def save_scores(path, runs):
+    arrays = {}
+    meta = []
+    for index, run in enumerate(runs):
+        for field in ("labels", "scores", "verdicts", "latencies"):
+            arrays[f"{index}_{field}"] = run[field]
+        meta.append({key: run[key] for key in ("task", "variant", "version", "seconds", "workers")})
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_scores(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        return [dict(run, **{field: data[f"{index}_{field}"]
+                             for field in ("labels", "scores", "verdicts", "latencies")})
+                for index, run in enumerate(meta)]
+
+
+def summarize(run):
+    latencies = np.sort(run["latencies"]) / 1000
+    count = len(latencies)
+    return dict(
+        task=run["task"], variant=run["variant"], version=run["version"], items=count,
+        **confusion(run["verdicts"], run["labels"]),
+        p50_us=float(np.percentile(latencies, 50)) if count else 0.0,
+        p95_us=float(np.percentile(latencies, 95)) if count else 0.0,
+        p99_us=float(np.percentile(latencies, 99)) if count else 0.0,
+        # Items per second across the pool, wall clock
+        throughput_per_s=count / run["seconds"] if run["seconds"] > 0 else 0.0
+    )
+
+
+def print_report(runs, thresholds):
+    summaries = [summarize(run) for run in runs]
+    for task, (title, _) in TASKS.items():
+        task_runs = [(run, summary) for run, summary in zip(runs, summaries) if run["task"] == task]
+        if not task_runs:
+            continue
+        labels = task_runs[0][0]["labels"]
+        print(f"\n{title}: {len(labels)} items, {np.mean(labels):.1%} positive, "
+              f"{task_runs[0][0]['workers']} workers")
+        width = max(len(summary['version']) for _, summary in task_runs)
+        print(f"{'variant':<20} {'version':<{width}} {'prec':>6} {'recall':>6} {'f1':>6} {'acc':>6} "
+              f"{'p50 us':>9} {'p95 us':>9} {'items/s':>9}")
+        for _, summary in task_runs:
+            print(f"{summary['variant']:<20} {summary['version']:<{width}} {summary['precision']:6.3f} "
+                  f"{summary['recall']:6.3f} {summary['f1']:6.3f} {summary['accuracy']:6.3f} "
+                  f"{summary['p50_us']:9.1f} {summary['p95_us']:9.1f} {summary['throughput_per_s']:9.0f}")
+
+        if thresholds is None:
+            continue
+        for run, _ in task_runs:
+            rows = sweep(run["scores"], run["labels"], thresholds)
+            best = max(range(len(rows)), key=lambda i: rows[i]["f1"])
+            print(f"\n  {run['variant']}: verdict when confidence > threshold")
+            print(f"  {'threshold':>9} {'flagged':>8} {'prec':>6} {'recall':>6} {'f1':>6} {'acc':>6}")
+            for i, row in enumerate(rows):
+                marker = " *" if i == best else ""
+                print(f"  {row['threshold']:9.2f} {row['positive_share']:8.1%} {row['precision']:6.3f} "
+                      f"{row['recall']:6.3f} {row['f1']:6.3f} {row['accuracy']:6.3f}{marker}")
+    return summaries
+
+
+def parse_thresholds(spec):
+    start, stop, step = (float(value) for value in spec.split(':'))
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate detector versions for quality and speed")
+    parser.add_argument('--hate', nargs='*', default=[], help="Labeled hate speech CSV files")
+    parser.add_argument('--fake', nargs='*', default=[], help="Labeled fake news CSV files (e.g. Fake.csv True.csv)")
+    parser.add_argument('--model-dir', nargs='+', default=[os.environ.get('MODEL_PATH', '../models')],
+                        help="Model directories to compare; each adds a model and a cascade variant")
+    parser.add_argument('--hate-band', type=lambda value: parse_band(value, None), default=(0.2, 0.7),
+                        help="Cascade band for hate speech, as low,high")
+    parser.add_argument('--fake-band', type=lambda value: parse_band(value, None), default=(0.25, 0.85),
+                        help="Cascade band for fake news, as low,high")
+    parser.add_argument('--lexicon', default=os.environ.get('HATE_LEXICON_PATH'), help="Hate lexicon file")
+    parser.add_argument('--domain-index', default=os.environ.get('DOMAIN_REPUTATION_PATH'),
+                        help="Domain reputation index from build_domain_index.py")
+    parser.add_argument('--limit', type=int, help="Use at most this many items per task")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Items per task sent to a worker")
+    parser.add_argument('--sweep', nargs='?', const='0.05:0.95:0.05', metavar='START:STOP:STEP',
+                        help="Also report every threshold in this range (default 0.05:0.95:0.05)")
+    parser.add_argument('--save-scores', help="Keep per-item scores in this .npz file")
+    parser.add_argument('--load-scores', help="Report on a --save-scores file instead of scoring")
+    parser.add_argument('--output', help="Write the summary rows to this JSON file")
+    args = parser.parse_args()
+
+    if args.load_scores:
+        runs = load_scores(args.load_scores)
+    else:
+        if not args.hate and not args.fake:
+            parser.error("Pass --hate and/or --fake dataset files, or --load-scores")
+        datasets = {}
+        for task in TASKS:
+            if getattr(args, task):
+                datasets[task] = load_task(task, getattr(args, task), args.limit)
+        runs = score_variants(args, build_variants(args), datasets)
+        if args.save_scores:
+            save_scores(args.save_scores, runs)
+
+    summaries = print_report(runs, parse_thresholds(args.sweep) if args.sweep else None)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
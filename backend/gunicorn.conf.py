@@ -0,0 +1,26 @@
+"""gunicorn settings: import the app and build its detectors once, in the master
+
+gunicorn reads this file from the working directory, so the usual command
+picks it up:
+
+    gunicorn -w 4 -b 0.0.0.0:5000 app:app
+
+Workers are forked after the warm-up, so they start ready and share the
+lexicon tables, models and memory-mapped indexes with the master
+copy-on-write instead of each building its own.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('PRELOAD', 'on') != 'off'
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked
+    if not preload_app:
+        return
+    import app
+    app.warm_up()
+    # Warm-up objects live for the whole process; keeping them out of the
+    # collector stops its bookkeeping writes from un-sharing their pages
+    gc.freeze()
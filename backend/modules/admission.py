@@ -0,0 +1,340 @@
+import asyncio
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from .metrics import REGISTRY
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    'moderation_admission_rejected_total', 'Requests shed by admission control', ['traffic_class', 'reason']
+)
+ADMISSION_INFLIGHT = REGISTRY.gauge(
+    'moderation_admission_inflight', 'Admitted requests in flight across every worker on the host',
+    ['traffic_class']
+)
+
+STATE_MAGIC = b'MODADM2\0'
+# magic, traffic class count, capped endpoint count, process slots, bucket slots
+STATE_HEADER = struct.Struct('<8sIIII')
+STATE_HEADER_SIZE = 64
+MAX_CLASSES = 8
+MAX_ENDPOINTS = 32
+PROCESS_DTYPE = np.dtype([('pid', '<i8'), ('inflight', '<i8', (MAX_CLASSES,)),
+                          ('endpoint_inflight', '<i8', (MAX_ENDPOINTS,))])
+BUCKET_DTYPE = np.dtype([('key', '<u8'), ('tokens', '<f8'), ('updated', '<f8')])
+# Bucket slots checked for a key before the least recently used one is reused
+PROBE_LENGTH = 8
+# Pause between tries for an in-flight slot while a request waits for one
+QUEUE_POLL_S = 0.002
+
+
+def default_state_path(name='moderation-admission'):
+    """Shared-memory file under /dev/shm where available, else the temp directory"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+def parse_endpoint_limits(value):
+    """{endpoint: in-flight cap} from '/api/analyze-video=2,/api/moderate=16'"""
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        endpoint, _, limit = item.partition('=')
+        limits[endpoint.strip()] = int(limit)
+    return limits
+
+
+class SharedLimiterState:
+    """Token buckets and in-flight counters in a memory-mapped file shared by every worker
+
+    Each operation holds an flock on the file (processes) and a thread lock
+    (threads of one process share the flock). In-flight counts are kept per
+    process, so a worker that dies without releasing its requests is
+    dropped from the totals as soon as its PID is gone.
+    """
+
+    def __init__(self, path, process_slots=256, bucket_slots=65536):
+        self.path = path
+        self.process_slots = process_slots
+        self.bucket_slots = bucket_slots
+        self._lock = threading.Lock()
+        self._row = None
+        self._row_pid = None
+        self._next_reap = 0.0
+        self._slot_warned = False
+
+        size = STATE_HEADER_SIZE + process_slots * PROCESS_DTYPE.itemsize + bucket_slots * BUCKET_DTYPE.itemsize
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._fd_pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, STATE_HEADER.size, 0)
+            expected = STATE_HEADER.pack(STATE_MAGIC, MAX_CLASSES, MAX_ENDPOINTS, process_slots, bucket_slots)
+            if header != expected or os.fstat(self._fd).st_size != size:
+                # New file or a different layout: start from empty tables
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, expected, 0)
+            self._mmap = mmap.mmap(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self.processes = np.frombuffer(self._mmap, dtype=PROCESS_DTYPE, count=process_slots,
+                                       offset=STATE_HEADER_SIZE)
+        self.buckets = np.frombuffer(self._mmap, dtype=BUCKET_DTYPE, count=bucket_slots,
+                                     offset=STATE_HEADER_SIZE + process_slots * PROCESS_DTYPE.itemsize)
+
+    def _locked(self):
+        # A forked worker shares its parent's open file, and with it the flock,
+        # so each process locks through its own descriptor
+        if self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._fd_pid = os.getpid()
+        return _FileLock(self._lock, self._fd)
+
+    def take(self, key, cost, rate, burst):
+        """Take `cost` tokens from a client's bucket; 0 when allowed, else seconds until it would be"""
+        now = time.monotonic()
+        start = key % self.bucket_slots
+        slots = [(start + i) % self.bucket_slots for i in range(PROBE_LENGTH)]
+        with self._locked():
+            buckets = self.buckets
+            slot = next((s for s in slots if buckets['key'][s] == key), None)
+            if slot is None:
+                # Reuse an empty slot or the one idle longest; a reset bucket starts full
+                slot = min(slots, key=lambda s: buckets['updated'][s])
+                buckets['key'][slot] = key
+                tokens = burst
+            else:
+                elapsed = now - buckets['updated'][slot]
+                tokens = min(burst, buckets['tokens'][slot] + elapsed * rate)
+            buckets['updated'][slot] = now
+            if tokens >= cost:
+                buckets['tokens'][slot] = tokens - cost
+                return 0.0
+            buckets['tokens'][slot] = tokens
+            return (cost - tokens) / rate if rate > 0 else float('inf')
+
+    def try_acquire(self, index, class_limit, total_limit, endpoint=None, endpoint_limit=None):
+        """Count one more in-flight request of class `index` (and capped endpoint) if every limit allows it
+
+        A process that finds no free row is let through uncounted rather
+        than failing the request.
+        """
+        with self._locked():
+            self._reap_dead()
+            inflight = self.processes['inflight']
+            if inflight[:, index].sum() >= class_limit or inflight.sum() >= total_limit:
+                return False
+            endpoints = self.processes['endpoint_inflight']
+            if endpoint is not None and endpoints[:, endpoint].sum() >= endpoint_limit:
+                return False
+            row = self._own_row()
+            if row is None:
+                return True
+            inflight[row, index] += 1
+            if endpoint is not None:
+                endpoints[row, endpoint] += 1
+            return True
+
+    def release(self, index, endpoint=None):
+        with self._locked():
+            # No row means nothing was counted for this process
+            if self._row_pid != os.getpid():
+                return
+            self.processes['inflight'][self._row, index] -= 1
+            if endpoint is not None:
+                self.processes['endpoint_inflight'][self._row, endpoint] -= 1
+
+    def inflight(self):
+        """Host-wide in-flight count per class index"""
+        with self._locked():
+            self._reap_dead()
+            return self.processes['inflight'].sum(axis=0)
+
+    def _own_row(self):
+        pid = os.getpid()
+        if self._row_pid != pid:
+            pids = self.processes['pid']
+            free = np.flatnonzero(pids == 0)
+            if not len(free):
+                if not self._slot_warned:
+                    print(f"Admission: no free process slot in {self.path}, not counting this worker")
+                    self._slot_warned = True
+                return None
+            self._row = int(free[0])
+            pids[self._row] = pid
+            self.processes['inflight'][self._row] = 0
+            self.processes['endpoint_inflight'][self._row] = 0
+            self._row_pid = pid
+        return self._row
+
+    def _reap_dead(self):
+        """Free the rows of processes that exited, at most once a second"""
+        now = time.monotonic()
+        if now < self._next_reap:
+            return
+        self._next_reap = now + 1.0
+        for row in np.flatnonzero(self.processes['pid']):
+            pid = int(self.processes['pid'][row])
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self.processes['pid'][row] = 0
+                self.processes['inflight'][row] = 0
+                self.processes['endpoint_inflight'][row] = 0
+            except PermissionError:
+                pass
+
+
+class _FileLock:
+    __slots__ = ('_lock', '_fd')
+
+    def __init__(self, lock, fd):
+        self._lock = lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+        return False
+
+
+class TrafficClass:
+    """Admission settings for a group of endpoints
+
+    `cost` is taken from the client's token bucket per request; `shed_at`
+    is the share of the host-wide in-flight limit above which this class
+    is turned away, so a class with a lower value is shed first and leaves
+    the remaining capacity to the others.
+    """
+
+    def __init__(self, name, cost=1.0, max_inflight=None, shed_at=1.0, queue_timeout=0.1):
+        self.name = name
+        self.cost = cost
+        self.max_inflight = max_inflight
+        self.shed_at = shed_at
+        self.queue_timeout = queue_timeout
+
+
+class AdmissionController:
+    """Per-client rate limits and host-wide concurrency caps with a short wait queue
+
+    `admit` returns None when a request may proceed (the caller must then
+    call `release` with the same class and endpoint) or a rejection dict
+    with the HTTP status, reason and Retry-After seconds. Endpoints named in
+    `endpoint_limits` are also held to their own in-flight cap; every worker
+    must be given the same ones.
+    """
+
+    def __init__(self, state, classes, rate=20.0, burst=40.0, max_inflight=64, max_waiting=32,
+                 endpoint_limits=None):
+        if len(classes) > MAX_CLASSES:
+            raise ValueError(f"At most {MAX_CLASSES} traffic classes are supported")
+        endpoint_limits = endpoint_limits or {}
+        if len(endpoint_limits) > MAX_ENDPOINTS:
+            raise ValueError(f"At most {MAX_ENDPOINTS} endpoint limits are supported")
+        self.state = state
+        self.classes = {traffic_class.name: (index, traffic_class) for index, traffic_class in enumerate(classes)}
+        # Sorted, so every worker maps an endpoint to the same column
+        self.endpoints = {endpoint: (index, endpoint_limits[endpoint])
+                          for index, endpoint in enumerate(sorted(endpoint_limits))}
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight = max_inflight
+        # Requests of this process allowed to wait for a slot at once
+        self.max_waiting = max_waiting
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    @staticmethod
+    def client_key(client):
+        """64-bit bucket key for an API key or address; never 0, which marks an empty slot"""
+        digest = hashlib.blake2b(client.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') | 1
+
+    def admit(self, class_name, client, endpoint=None):
+        """Admission decision; blocks the calling thread while the request waits for a slot"""
+        steps = self._admission(class_name, client, endpoint)
+        try:
+            while True:
+                time.sleep(next(steps))
+        except StopIteration as done:
+            return done.value
+        finally:
+            steps.close()
+
+    async def admit_async(self, class_name, client, endpoint=None):
+        """admit() for an event loop: each try is non-blocking and the wait is asyncio.sleep"""
+        steps = self._admission(class_name, client, endpoint)
+        try:
+            while True:
+                await asyncio.sleep(next(steps))
+        except StopIteration as done:
+            return done.value
+        finally:
+            # A cancelled request still leaves the wait queue
+            steps.close()
+
+    def _admission(self, class_name, client, endpoint):
+        """Yields seconds to pause between tries for a slot; returns None or a rejection"""
+        index, traffic_class = self.classes[class_name]
+        endpoint_index, endpoint_limit = self.endpoints.get(endpoint, (None, None))
+
+        if self.rate > 0:
+            wait = self.state.take(self.client_key(client), traffic_class.cost, self.rate, self.burst)
+            if wait:
+                return self._reject(traffic_class, 429, 'rate_limited', wait)
+
+        limits = (index, traffic_class.max_inflight or self.max_inflight,
+                  max(1, int(self.max_inflight * traffic_class.shed_at)), endpoint_index, endpoint_limit)
+        if self.state.try_acquire(*limits):
+            return None
+
+        # Over capacity: wait briefly for a slot, unless too many already do
+        with self._waiting_lock:
+            if self._waiting >= self.max_waiting or not traffic_class.queue_timeout:
+                return self._reject(traffic_class, 503, 'overloaded', 1)
+            self._waiting += 1
+        try:
+            deadline = time.monotonic() + traffic_class.queue_timeout
+            while time.monotonic() < deadline:
+                yield QUEUE_POLL_S
+                if self.state.try_acquire(*limits):
+                    return None
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+        return self._reject(traffic_class, 503, 'overloaded', 1)
+
+    def release(self, class_name, endpoint=None):
+        self.state.release(self.classes[class_name][0], self.endpoints.get(endpoint, (None,))[0])
+
+    def _reject(self, traffic_class, status, reason, retry_after):
+        ADMISSION_REJECTED.labels(traffic_class.name, reason).inc()
+        return {
+            "status": status,
+            "reason": reason,
+            "retry_after": max(1, math.ceil(retry_after))
+        }
+
+    def collect(self):
+        """Copy host-wide in-flight counts into the metrics gauge"""
+        inflight = self.state.inflight()
+        for name, (index, _) in self.classes.items():
+            ADMISSION_INFLIGHT.labels(name).set(int(inflight[index]))
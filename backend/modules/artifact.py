@@ -0,0 +1,205 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+ARTIFACT_MAGIC = b'MODART\r\n'
+FORMAT_VERSION = 1
+# magic, format version, flags (unused), table-of-contents length, its sha256
+HEADER = struct.Struct('<8sIIQ32s')
+ALIGNMENT = 64
+
+
+class ArtifactError(ValueError):
+    """Artifact file is missing, corrupt or from an unsupported format version"""
+
+
+class ArtifactWriter:
+    """Collects components (metadata plus named arrays) and writes one artifact file
+
+    Layout: fixed header, JSON table of contents, then every array as raw
+    little-endian bytes on a 64-byte boundary. The table records each
+    section's dtype, shape, offset and sha256, and the header records the
+    table's sha256, so a reader can validate everything it maps.
+    """
+
+    def __init__(self):
+        self.components = {}
+
+    def add(self, name, arrays, metadata=None):
+        self.components[name] = (
+            {key: np.ascontiguousarray(value) for key, value in arrays.items()},
+            metadata or {}
+        )
+
+    def write(self, path):
+        """Write atomically: readers see either the old file or the complete new one"""
+        sections = {}
+        payloads = []
+        offset = 0
+        for component, (arrays, _) in sorted(self.components.items()):
+            for key, array in sorted(arrays.items()):
+                array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+                data = array.tobytes()
+                offset += -offset % ALIGNMENT
+                sections[f"{component}/{key}"] = {
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "offset": offset,
+                    "nbytes": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest()
+                }
+                payloads.append((offset, data))
+                offset += len(data)
+
+        components = {name: metadata for name, (_, metadata) in self.components.items()}
+        digest = hashlib.sha256(json.dumps([components, sections], sort_keys=True).encode('utf-8'))
+        toc = {
+            "version": digest.hexdigest()[:16],
+            "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "components": components,
+            "sections": sections
+        }
+        toc_bytes = json.dumps(toc, sort_keys=True).encode('utf-8')
+        data_start = HEADER.size + len(toc_bytes)
+        data_start += -data_start % ALIGNMENT
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(ARTIFACT_MAGIC, FORMAT_VERSION, 0, len(toc_bytes),
+                                hashlib.sha256(toc_bytes).digest()))
+            f.write(toc_bytes)
+            for section_offset, data in payloads:
+                f.write(b'\0' * (data_start + section_offset - f.tell()))
+                f.write(data)
+            # Trailing empty sections still need their offset inside the file
+            f.write(b'\0' * (data_start + offset - f.tell()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return toc["version"]
+
+
+class Artifact:
+    """Read-only memory-mapped artifact
+
+    Arrays are views straight into the mapping, so every process that opens
+    the same file shares its pages through the OS page cache. The mapping
+    stays open while any array from it is alive, so an old artifact can be
+    dropped while in-flight requests still use it.
+    """
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                self.mtime = os.fstat(f.fileno()).st_mtime
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise ArtifactError(f"Cannot open artifact {path}: {e}")
+
+        if len(self._mmap) < HEADER.size:
+            raise ArtifactError(f"{path} is too short to be an artifact")
+        magic, version, _, toc_length, toc_digest = HEADER.unpack_from(self._mmap, 0)
+        if magic != ARTIFACT_MAGIC:
+            raise ArtifactError(f"{path} is not a moderation artifact")
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        toc_bytes = self._mmap[HEADER.size:HEADER.size + toc_length]
+        if hashlib.sha256(toc_bytes).digest() != toc_digest:
+            raise ArtifactError(f"{path} has a corrupt table of contents")
+        toc = json.loads(toc_bytes)
+        self.version = toc["version"]
+        self.created = toc["created"]
+        self.components = toc["components"]
+        self._sections = toc["sections"]
+        self._data_start = HEADER.size + toc_length + (-(HEADER.size + toc_length) % ALIGNMENT)
+
+        for name, section in self._sections.items():
+            end = self._data_start + section["offset"] + section["nbytes"]
+            if end > len(self._mmap):
+                raise ArtifactError(f"{path} is truncated (section {name})")
+            if verify:
+                start = self._data_start + section["offset"]
+                if hashlib.sha256(self._mmap[start:end]).hexdigest() != section["sha256"]:
+                    raise ArtifactError(f"{path} failed the checksum of section {name}")
+
+    def __contains__(self, component):
+        return component in self.components
+
+    def metadata(self, component):
+        return self.components[component]
+
+    def arrays(self, component):
+        """Read-only arrays of one component, keyed by name"""
+        prefix = f"{component}/"
+        arrays = {}
+        for name, section in self._sections.items():
+            if not name.startswith(prefix):
+                continue
+            dtype = np.dtype(section["dtype"])
+            count = section["nbytes"] // dtype.itemsize
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                  offset=self._data_start + section["offset"])
+            arrays[name[len(prefix):]] = array.reshape(section["shape"])
+        return arrays
+
+
+class ArtifactWatcher:
+    """Reopens an artifact file when it is replaced, at most every `interval` seconds
+
+    Builders replace the file with os.replace, so a changed mtime always
+    means a complete new file. A file that fails validation is reported and
+    skipped; the current artifact stays in service.
+    """
+
+    def __init__(self, path, on_load, interval=1.0, verify=True):
+        self.path = path
+        self.on_load = on_load
+        self.interval = interval
+        self.verify = verify
+        self.current = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        artifact = Artifact(self.path, self.verify)
+        self.on_load(artifact)
+        self.current = artifact
+        self._mtime = artifact.mtime
+        return artifact
+
+    def reload_if_changed(self):
+        """Swap in a replaced artifact file; True when a new one was loaded"""
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        # One thread checks and loads; the others keep serving the current artifact
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return False
+            if mtime == self._mtime:
+                return False
+            try:
+                self.load()
+            except ArtifactError as e:
+                print(f"Artifact reload failed, keeping version {self.current.version}: {e}")
+                # Don't retry the same broken file on every check
+                self._mtime = mtime
+                return False
+            return True
+        finally:
+            self._lock.release()
@@ -0,0 +1,80 @@
+from .metrics import REGISTRY, timed
+
+CASCADE_TIER = REGISTRY.counter(
+    'moderation_cascade_answers_total', 'Items answered by each cascade tier', ['cascade', 'tier']
+)
+
+
+def parse_band(value, default):
+    """"low,high" from configuration as a (low, high) tuple"""
+    if not value:
+        return default
+    low, high = (float(part) for part in value.split(','))
+    if not 0 <= low <= high <= 1:
+        raise ValueError(f"Uncertainty band must satisfy 0 <= low <= high <= 1, got {value}")
+    return low, high
+
+
+class CascadeStage:
+    """One tier: a batch function plus how to read its score
+
+    `run` takes a list of items and returns one result dict per item;
+    `score` maps a result to a 0-1 harm score compared against the band.
+    A low score may only mean the stage found nothing to go on: with
+    `confirms_low`, a callable taking the item, a score below the band
+    settles the item only when it also returns True.
+    """
+
+    def __init__(self, name, run, score=None, confirms_low=None):
+        self.name = name
+        self.run = run
+        self.score = score or (lambda result: result["confidence"])
+        self.confirms_low = confirms_low
+
+
+class CascadeScheduler:
+    """Runs stages cheapest first and stops as soon as a stage is confident
+
+    An item is settled when its score is outside the uncertainty band
+    (below `low` means clearly fine, above `high` clearly harmful); only
+    items inside the band go on to the next, costlier stage. The last stage
+    always answers. Each result records the tier that answered it.
+    """
+
+    def __init__(self, name, stages, band=(0.2, 0.8)):
+        self.name = name
+        self.stages = stages
+        self.low, self.high = band
+        self._tier_counters = [CASCADE_TIER.labels(name, stage.name) for stage in stages]
+
+    @property
+    def version(self):
+        """Stages and band, for cache keys: results change when either does"""
+        names = '+'.join(stage.name for stage in self.stages)
+        return f"{names}@{self.low}-{self.high}" if len(self.stages) > 1 else names
+
+    def run(self, items):
+        """Results for every item, in input order"""
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+        last = len(self.stages) - 1
+
+        for depth, stage in enumerate(self.stages):
+            if not pending:
+                break
+            with timed(f"{self.name}.{stage.name}"):
+                outputs = stage.run([items[i] for i in pending])
+
+            escalate = []
+            for i, result in zip(pending, outputs):
+                score = stage.score(result)
+                low = score < self.low and (stage.confirms_low is None or stage.confirms_low(items[i]))
+                if depth == last or low or score > self.high:
+                    result["tier"] = stage.name
+                    results[i] = result
+                else:
+                    escalate.append(i)
+            self._tier_counters[depth].inc(len(pending) - len(escalate))
+            pending = escalate
+
+        return results
@@ -0,0 +1,352 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .metrics import REGISTRY, timed
+from .text_analysis import TextAnalysis
+
+CHAT_SESSIONS = REGISTRY.gauge('moderation_chat_sessions', 'Chat conversations held in the session store')
+CHAT_EVICTIONS = REGISTRY.counter(
+    'moderation_chat_evictions_total', 'Chat conversations dropped from memory', ['reason']
+)
+
+# Updates to one conversation are serialized on one of these locks, chosen by
+# its ID, so a lock per conversation is not needed
+LOCK_STRIPES = 64
+# A message that is a single token this short may be part of a word typed
+# across several messages ("stu", "pid"); this many of them in a row are kept
+FRAGMENT_CHARS = 4
+MAX_FRAGMENTS = 8
+# Distinct lexicon terms remembered per conversation
+MAX_KEYWORDS = 16
+
+
+class ConversationState:
+    """What one conversation keeps between messages, a few hundred bytes in all"""
+
+    __slots__ = ('window', 'fragments', 'keywords', 'messages', 'flagged', 'score_total', 'peak',
+                 'toxicity', 'updated')
+
+    def __init__(self, now):
+        # The last normalized tokens, space-joined: one string is far smaller than a list of them
+        self.window = ''
+        self.fragments = ()
+        self.keywords = ()
+        self.messages = 0
+        self.flagged = 0
+        self.score_total = 0.0
+        self.peak = 0.0
+        self.toxicity = 0.0
+        self.updated = now
+
+    def dumps(self):
+        return json.dumps([getattr(self, name) for name in self.__slots__], separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, data):
+        state = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, json.loads(data)):
+            setattr(state, name, tuple(value) if isinstance(value, list) else value)
+        return state
+
+
+class MemorySessionStore:
+    """Conversations in this process's memory, in least recently used order
+
+    Only right for a single worker: another worker never sees them.
+    """
+
+    def __init__(self, max_sessions, idle_seconds):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def update(self, conversation_id, now, apply):
+        """apply(state) with the conversation's state, created if new; what it returns"""
+        with self._stripes[hash(conversation_id) % LOCK_STRIPES]:
+            return apply(self._session(conversation_id, now))
+
+    def view(self, conversation_id, read):
+        """read(state), or None if the conversation is unknown"""
+        with self._stripes[hash(conversation_id) % LOCK_STRIPES]:
+            state = self._sessions.get(conversation_id)
+            return None if state is None else read(state)
+
+    def pop(self, conversation_id):
+        with self._lock:
+            state = self._sessions.pop(conversation_id, None)
+            CHAT_SESSIONS.set(len(self._sessions))
+        return state is not None
+
+    def _session(self, conversation_id, now):
+        """State of a conversation, created if new, marked most recently used"""
+        with self._lock:
+            state = self._sessions.get(conversation_id)
+            if state is None:
+                state = self._sessions[conversation_id] = ConversationState(now)
+            else:
+                self._sessions.move_to_end(conversation_id)
+            self._evict(now)
+            CHAT_SESSIONS.set(len(self._sessions))
+            return state
+
+    def _evict(self, now):
+        # Least recently used first, so only the head can be idle or over capacity
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            CHAT_EVICTIONS.labels('capacity').inc()
+        cutoff = now - self.idle_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.updated >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            CHAT_EVICTIONS.labels('idle').inc()
+
+
+class SharedSessionStore:
+    """Conversations in an SQLite file shared by every worker on the host
+
+    Each update reads, changes and writes one row inside an immediate
+    transaction, so messages of one conversation handled by different
+    workers are applied one after the other. Point `path` at /dev/shm to
+    keep it off the disk. Idle and excess conversations are dropped every
+    `check_every` updates.
+    """
+
+    def __init__(self, path, max_sessions, idle_seconds, check_every=100):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.check_every = check_every
+        self._writes = 0
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_lru ON conversations (updated)")
+
+    def _connection(self):
+        # One connection per thread, and never reuse one inherited across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def update(self, conversation_id, now, apply):
+        """apply(state) with the conversation's state, created if new; what it returns"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            state = ConversationState(now) if row is None else ConversationState.loads(row[0])
+            # An idle conversation starts over, as it would once evicted from memory
+            if state.updated < now - self.idle_seconds:
+                state = ConversationState(now)
+            result = apply(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, state, updated) VALUES (?, ?, ?)",
+                (conversation_id, state.dumps(), state.updated)
+            )
+            self._writes += 1
+            if self._writes % self.check_every == 0:
+                self._evict(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def view(self, conversation_id, read):
+        """read(state), or None if the conversation is unknown"""
+        row = self._connection().execute(
+            "SELECT state FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return None if row is None else read(ConversationState.loads(row[0]))
+
+    def pop(self, conversation_id):
+        return self._connection().execute(
+            "DELETE FROM conversations WHERE id = ?", (conversation_id,)
+        ).rowcount > 0
+
+    def _evict(self, conn, now):
+        idle = conn.execute("DELETE FROM conversations WHERE updated < ?", (now - self.idle_seconds,)).rowcount
+        CHAT_EVICTIONS.labels('idle').inc(idle)
+        held = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        if held > self.max_sessions:
+            conn.execute(
+                "DELETE FROM conversations WHERE id IN"
+                " (SELECT id FROM conversations ORDER BY updated LIMIT ?)", (held - self.max_sessions,)
+            )
+            CHAT_EVICTIONS.labels('capacity').inc(held - self.max_sessions)
+            held = self.max_sessions
+        CHAT_SESSIONS.set(held)
+
+
+class ChatSessions:
+    """Incremental hate speech moderation for live chat conversations
+
+    Every message is scored on its own by the detector, then matched
+    against the tail of its conversation's token window, which catches
+    lexicon phrases and words that are split across messages. Each
+    conversation keeps a decaying toxicity level that rises with every
+    abusive message and halves every `half_life` seconds, so sustained
+    abuse is flagged even when no single message is. A message costs time
+    in its own length only: the window and the fragments it is matched
+    against are bounded.
+
+    Conversations are dropped once idle for `idle_seconds`, and the least
+    recently used ones whenever there are more than `max_sessions`. With
+    `store_path` they are kept in an SQLite file every worker on the host
+    shares, so any worker can take a conversation's next message;
+    otherwise in this process's memory, which is faster but only right
+    when one process serves every message of a conversation.
+    """
+
+    def __init__(self, detector, max_sessions=50000, idle_seconds=1800, window_tokens=16,
+                 half_life=300, toxic_level=1.0, store_path=None):
+        self.detector = detector
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.window_tokens = window_tokens
+        self.half_life = half_life
+        # Decayed toxicity at which a conversation is reported as toxic
+        self.toxic_level = toxic_level
+        self.store = SharedSessionStore(store_path, max_sessions, idle_seconds) if store_path else \
+            MemorySessionStore(max_sessions, idle_seconds)
+
+    def __len__(self):
+        return len(self.store)
+
+    def add_message(self, conversation_id, text, now=None):
+        """Moderate the next message of a conversation; its verdict plus the conversation's"""
+        # Wall-clock time, which every worker on the host agrees on
+        now = time.time() if now is None else now
+        analysis = TextAnalysis(text)
+        # The expensive part runs outside every lock
+        result = self.detector.predict_analysis(analysis)
+        tokens = analysis.tokens
+
+        def apply(state):
+            with timed('chat.context'):
+                context = self._context_matches(state, tokens)
+            verdict = self._with_context(result, context) if context else result
+            self._update(state, verdict, tokens, now)
+            return {
+                **verdict,
+                "message": state.messages,
+                "context_keywords": context,
+                "conversation": self._summary(state, now)
+            }
+
+        return self.store.update(conversation_id, now, apply)
+
+    def _context_matches(self, state, tokens):
+        """Lexicon terms found only by reading the message together with the ones before it"""
+        matcher = self.detector.matcher
+        found = {}
+        # Phrases that start in the window and end in this message
+        if matcher.max_phrase_tokens > 1 and state.window and tokens:
+            tail = state.window.split()[-(matcher.max_phrase_tokens - 1):]
+            for term_id, first, last in matcher.match_tokens(tail + tokens[:matcher.max_phrase_tokens - 1]):
+                if first < len(tail) <= last:
+                    found.setdefault(matcher.terms[term_id], None)
+        # Words typed a few letters per message: every run of fragments ending here
+        if state.fragments and self._is_fragment(tokens):
+            fragments = state.fragments + (tokens[0],)
+            for start in range(len(fragments) - 1):
+                for term in matcher.find_all_tokens([''.join(fragments[start:])]):
+                    found.setdefault(term, None)
+        return list(found)
+
+    @staticmethod
+    def _is_fragment(tokens):
+        return len(tokens) == 1 and len(tokens[0]) <= FRAGMENT_CHARS
+
+    def _with_context(self, result, context):
+        """The message verdict, raised to what the keyword rules give its terms plus the context ones"""
+        keywords = list(dict.fromkeys(result.get("keywords_found", []) + context))
+        confidence = np.array([min(len(keywords) * 0.25, 1.0)])
+        if confidence[0] <= result["confidence"]:
+            return {**result, "keywords_found": keywords}
+        return self.detector._results(confidence, confidence > 0.4, [keywords])[0]
+
+    def _update(self, state, result, tokens, now):
+        confidence = result["confidence"]
+        hateful = result.get("is_hate_speech", False)
+        keywords = result.get("keywords_found", [])
+
+        state.messages += 1
+        state.flagged += hateful
+        state.score_total += confidence
+        state.peak = max(state.peak, confidence)
+        # Clean messages only let the level decay; anything that matched adds to it
+        state.toxicity = self._decayed(state, now) + (confidence if hateful or keywords else 0.0)
+        state.updated = now
+
+        if keywords:
+            new = [term for term in keywords if term not in state.keywords]
+            state.keywords = (state.keywords + tuple(new))[:MAX_KEYWORDS]
+        if tokens:
+            state.window = ' '.join((state.window.split() + tokens)[-self.window_tokens:])
+        if self._is_fragment(tokens):
+            state.fragments = (state.fragments + (tokens[0],))[-MAX_FRAGMENTS:]
+        else:
+            state.fragments = ()
+
+    def _decayed(self, state, now):
+        elapsed = max(0.0, now - state.updated)
+        return state.toxicity * 0.5 ** (elapsed / self.half_life)
+
+    def _summary(self, state, now):
+        toxicity = self._decayed(state, now)
+        return {
+            "messages": state.messages,
+            "flagged_messages": state.flagged,
+            "toxicity": round(toxicity, 3),
+            "is_toxic": toxicity >= self.toxic_level,
+            "peak_confidence": round(state.peak, 2),
+            "mean_confidence": round(state.score_total / state.messages, 3) if state.messages else 0.0,
+            "keywords_found": list(state.keywords)
+        }
+
+    def summary(self, conversation_id, now=None):
+        """Current state of a conversation, or None if it is unknown or was evicted"""
+        now = time.time() if now is None else now
+
+        def read(state):
+            return None if state.updated < now - self.idle_seconds else self._summary(state, now)
+
+        return self.store.view(conversation_id, read)
+
+    def end(self, conversation_id):
+        """Forget a conversation; whether it was known"""
+        return self.store.pop(conversation_id)
+
+    def stats(self):
+        return {
+            "sessions": len(self.store),
+            "max_sessions": self.max_sessions,
+            "idle_seconds": self.idle_seconds,
+            "shared": isinstance(self.store, SharedSessionStore)
+        }
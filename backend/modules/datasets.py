@@ -0,0 +1,73 @@
+"""Loaders for the text datasets listed in data/DATASETS.md
+
+Each loader reads one CSV and yields plain Python values, so training
+scripts can mix datasets freely. The layout is detected from the header:
+
+- Hate Speech and Offensive Language (Davidson et al.): `tweet`, `class`
+  (0 hate, 1 offensive, 2 neither)
+- Twitter hatred sentiment: `tweet`, `label` (1 hate)
+- Jigsaw toxic comments: `comment_text` plus the six toxicity columns
+- Fake and real news: `Fake.csv` / `True.csv` with `title` and `text`
+- Our own split files (data/text/*/train.csv): `text`, `label`
+"""
+import csv
+import os
+import sys
+
+JIGSAW_LABELS = ('toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate')
+FAKE_LABELS = {'fake': 1, 'false': 1, '1': 1, 'real': 0, 'true': 0, '0': 0}
+
+# News articles and some comments are longer than the csv module allows by default
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def _rows(path):
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        yield from csv.DictReader(f)
+
+
+def _header(path):
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        return next(csv.reader(f), [])
+
+
+def load_hate_speech_csv(path):
+    """Yield (text, label) pairs, label 1 for hateful or offensive text"""
+    columns = set(_header(path))
+
+    if {'tweet', 'class'} <= columns:
+        for row in _rows(path):
+            yield row['tweet'], int(row['class'] in ('0', '1'))
+    elif {'comment_text', 'toxic'} <= columns:
+        for row in _rows(path):
+            yield row['comment_text'], int(any(row.get(label) == '1' for label in JIGSAW_LABELS))
+    elif {'tweet', 'label'} <= columns:
+        for row in _rows(path):
+            yield row['tweet'], int(row['label'] == '1')
+    elif {'text', 'label'} <= columns:
+        for row in _rows(path):
+            yield row['text'], int(row['label'] in ('1', 'hate', 'hate_speech', 'offensive', 'toxic'))
+    else:
+        raise ValueError(f"Unrecognized hate speech dataset layout in {path}")
+
+
+def load_fake_news_csv(path):
+    """Yield (title, content, label) triples, label 1 for fake news"""
+    columns = set(_header(path))
+    if not {'title', 'text'} <= columns:
+        raise ValueError(f"Unrecognized fake news dataset layout in {path}")
+
+    # Fake.csv / True.csv carry the label in the file name
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    file_label = FAKE_LABELS.get(name)
+    if 'label' not in columns and file_label is None:
+        raise ValueError(f"No label column in {path}; name the file Fake.csv or True.csv")
+
+    for row in _rows(path):
+        if 'label' in columns:
+            label = FAKE_LABELS.get(row['label'].strip().lower())
+            if label is None:
+                continue
+        else:
+            label = file_label
+        yield row['title'] or '', row['text'] or '', label
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+import struct
+
+import numpy as np
+
+INDEX_MAGIC = b'DOMREP01'
+# magic, domain count, table slots, version
+HEADER = struct.Struct('<8sQQ12s')
+ALIGNMENT = 64
+MIN_SLOTS = 64
+# The table is kept at most half full so probe runs stay short
+MAX_LOAD = 0.5
+
+# A dot followed by a label character is the literal the domain scan looks
+# for; sentence ends (". The") and decimals ("3.5") do not lead anywhere
+_DOT_LABEL = re.compile(r'\.[a-z0-9]')
+_HOST = re.compile(r'(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z][a-z0-9-]*[a-z0-9]')
+_LABEL_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789-.')
+
+
+def normalize_domain(domain):
+    """Lowercase host name without scheme, port, path, trailing dot or leading www."""
+    domain = domain.strip().lower()
+    if '://' in domain:
+        domain = domain.split('://', 1)[1]
+    domain = domain.split('/', 1)[0].split(':', 1)[0].strip('.')
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain
+
+
+def iter_domains(lower):
+    """Yield (domain, start, end) for each host name in lowercased text
+
+    Hosts are found in URLs (https://news.bbc.co.uk/...) and as bare names
+    (reuters.com); the top-level label must start with a letter, so
+    abbreviations and numbers are skipped, and so are email addresses.
+    """
+    last = 0
+    for dot in _DOT_LABEL.finditer(lower):
+        if dot.start() < last:
+            continue
+        start = dot.start()
+        while start > last and lower[start - 1] in _LABEL_CHARS:
+            start -= 1
+        match = _HOST.match(lower, start)
+        if match is None or match.end() <= dot.start():
+            last = dot.start() + 1
+            continue
+        end = match.end()
+        last = end
+        if lower[start - 1:start] == '@' or lower[end:end + 1] == '@':
+            continue
+        if (end < len(lower) and lower[end].isalnum()) or (start and lower[start - 1].isalnum()):
+            # Part of a longer non-ASCII word
+            continue
+        yield normalize_domain(match.group()), start, end
+
+
+def extract_domains(lower):
+    """Distinct host names in lowercased text, in order of first appearance"""
+    return list(dict.fromkeys(domain for domain, _, _ in iter_domains(lower)))
+
+
+def load_domain_file(path):
+    """Read (domain, score) pairs: one 'domain,score' per line, '#' starts a comment
+
+    Tabs work as the separator too, and a header line is skipped.
+    """
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            domain, _, score = line.replace('\t', ',').partition(',')
+            try:
+                entries.append((domain, float(score)))
+            except ValueError:
+                continue
+    return entries
+
+
+def _domain_key(domain):
+    """Non-zero 64-bit key of a normalized domain; zero marks an empty slot"""
+    digest = hashlib.blake2b(domain.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class DomainReputationIndex:
+    """Open-addressing hash table from domain to a reputation score in [0, 1]
+
+    Each slot holds a 64-bit key of the domain name and its score, so an
+    entry costs 24 bytes at the default load and the table needs no string
+    storage. A lookup hashes the domain and then each parent domain (most
+    specific first: news.bbc.co.uk, bbc.co.uk, co.uk, uk), so its cost grows
+    with the length of the name, not the number of entries. Saved indexes
+    are memory-mapped read-only and shared between processes.
+    """
+
+    def __init__(self, keys=None, scores=None, count=0, version=None):
+        if keys is None:
+            keys = np.zeros(MIN_SLOTS, dtype=np.uint64)
+            scores = np.zeros(MIN_SLOTS, dtype=np.float32)
+        if len(keys) & (len(keys) - 1):
+            raise ValueError("Domain index table size must be a power of two")
+        # Plain ndarray views: element reads on a memmap subclass cost several times more
+        self._keys = keys.view(np.ndarray)
+        self._scores = scores.view(np.ndarray)
+        self._mask = len(keys) - 1
+        self._count = count
+        self.version = version or self._fingerprint()
+
+    @classmethod
+    def build(cls, entries):
+        """Index of (domain, score) pairs; a domain listed twice keeps its last score"""
+        by_key = {}
+        for domain, score in entries:
+            domain = normalize_domain(domain)
+            if domain:
+                by_key[_domain_key(domain)] = min(max(float(score), 0.0), 1.0)
+
+        slots = MIN_SLOTS
+        while slots * MAX_LOAD < len(by_key):
+            slots *= 2
+        mask = slots - 1
+        keys = [0] * slots
+        scores = [0.0] * slots
+        for key, score in by_key.items():
+            slot = key & mask
+            while keys[slot]:
+                slot = (slot + 1) & mask
+            keys[slot] = key
+            scores[slot] = score
+        return cls(np.array(keys, dtype=np.uint64), np.array(scores, dtype=np.float32), len(by_key))
+
+    def __len__(self):
+        return self._count
+
+    def _fingerprint(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self._keys).tobytes())
+        digest.update(np.ascontiguousarray(self._scores).tobytes())
+        return digest.hexdigest()[:12]
+
+    def _get(self, domain):
+        key = _domain_key(domain)
+        keys = self._keys
+        slot = key & self._mask
+        while True:
+            stored = int(keys[slot])
+            if stored == key:
+                return float(self._scores[slot])
+            if not stored:
+                return None
+            slot = (slot + 1) & self._mask
+
+    def lookup(self, domain):
+        """Score of the most specific listed suffix of domain as a dict, or None"""
+        domain = normalize_domain(domain)
+        while domain:
+            score = self._get(domain)
+            if score is not None:
+                return {"domain": domain, "score": round(score, 2)}
+            domain = domain.partition('.')[2]
+        return None
+
+    def score(self, domain):
+        """Reputation of domain (or its closest listed parent), or None if unlisted"""
+        match = self.lookup(domain)
+        return match["score"] if match is not None else None
+
+    def to_arrays(self):
+        """Flat arrays of the table, for save() and model artifacts"""
+        return {"keys": self._keys, "scores": self._scores}
+
+    @classmethod
+    def from_arrays(cls, arrays, count=None, version=None):
+        """Index over to_arrays() output; the arrays are used as is (e.g. memory-mapped)"""
+        keys = arrays["keys"]
+        if count is None:
+            count = int(np.count_nonzero(keys))
+        return cls(keys, arrays["scores"], count, version)
+
+    def save(self, path):
+        """Write the index atomically in the memory-mappable on-disk format"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(INDEX_MAGIC, self._count, len(self._keys), self.version.encode('ascii')))
+            for section in (self._keys, self._scores):
+                f.write(b'\0' * (-f.tell() % ALIGNMENT))
+                f.write(np.ascontiguousarray(section).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a saved index read-only; pages are shared between processes"""
+        with open(path, 'rb') as f:
+            magic, count, slots, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a domain reputation index")
+
+        offset = HEADER.size
+        arrays = []
+        for dtype in (np.uint64, np.float32):
+            offset += -offset % ALIGNMENT
+            arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(slots,)))
+            offset += slots * np.dtype(dtype).itemsize
+        return cls(arrays[0], arrays[1], count, version.decode('ascii'))
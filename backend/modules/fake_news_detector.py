@@ -1,10 +1,61 @@
-import re
+import hashlib
+import os
 import numpy as np
 
+from .cascade import CascadeScheduler, CascadeStage
+from .domain_reputation import DomainReputationIndex
+from .metrics import timed
+from .result_cache import make_cache_key
+from .text_analysis import TextAnalysis
+from .text_classifier import TextClassifier
+from .text_normalizer import TextNormalizer
+
+# preprocess_text keeps hashtag words and turns punctuation into spaces
+PREPROCESS_NORMALIZER = TextNormalizer(punctuation=' ')
+
+# Hand-written indicators the classifier gets as extra dense features
+HEURISTIC_FEATURES = (
+    'title_clickbait_terms', 'title_excessive_punctuation', 'title_caps_ratio',
+    'content_credible_sources', 'content_short', 'content_sensational_terms'
+)
+
+# Outlets the built-in domain index rates; a full index is built offline with
+# build_domain_index.py and loaded from DOMAIN_REPUTATION_PATH or the artifact
+CREDIBLE_DOMAINS = {
+    'bbc.co.uk': 0.9, 'bbc.com': 0.9, 'cnn.com': 0.8, 'reuters.com': 0.95, 'apnews.com': 0.95,
+    'theguardian.com': 0.9, 'nytimes.com': 0.9, 'washingtonpost.com': 0.9,
+    'timesofindia.indiatimes.com': 0.8, 'thehindu.com': 0.85
+}
+# A cited domain moves credibility by (score - 0.5) * DOMAIN_WEIGHT, all of
+# them together by at most MAX_DOMAIN_ADJUSTMENT either way
+DOMAIN_WEIGHT = 0.4
+MAX_DOMAIN_ADJUSTMENT = 0.4
+# Cited domains scoring at least this count as credible sources for the classifier
+CREDIBLE_SCORE = 0.5
+
 class FakeNewsDetector:
     """Detects fake news and misinformation"""
     
-    def __init__(self):
+    # Bump when scoring logic changes so cached results are not reused
+    VERSION = "heuristic-2"
+    
+    def __init__(self, cache=None, model_path=None, cascade_band=None, domain_index=None):
+        self.cache = cache
+        # Reputation of cited domains; hostnames in the content are looked up here
+        self.domain_index = domain_index if domain_index is not None \
+            else DomainReputationIndex.build(CREDIBLE_DOMAINS.items())
+        # Classifier trained by train_models.py; replaces the fixed weights below
+        self.classifier = None
+        if model_path and os.path.exists(model_path):
+            self.classifier = TextClassifier.load(model_path)
+        
+        # With a band, the fixed-weight heuristic answers clear-cut articles and
+        # only uncertain ones reach the classifier
+        heuristic = CascadeStage('heuristic', self.heuristic_batch)
+        model = CascadeStage('model', self.model_batch)
+        self.tiers = CascadeScheduler('fake', [heuristic, model], cascade_band) if cascade_band \
+            else CascadeScheduler('fake', [model])
+        
         # Fake news indicators
         self.fake_indicators = [
             'shocking', 'unbelievable', 'you won\'t believe',
@@ -16,21 +67,53 @@ class FakeNewsDetector:
             'instant', 'guaranteed', 'proven', 'magic'
         ]
         
+        # Outlets named in the text. Names that are also common words or parts
+        # of words ('hindu', 'nyt') are left to domain_index, which scores links
         self.credible_sources = [
             'bbc', 'cnn', 'reuters', 'ap news', 'the guardian',
-            'nyt', 'washington post', 'times of india', 'hindu'
+            'new york times', 'washington post', 'times of india'
         ]
     
+    def load_artifact(self, artifact):
+        """Use the model and domain index stored in a memory-mapped Artifact, if it has them"""
+        if 'fake_model' in artifact:
+            self.classifier = TextClassifier.from_config(artifact.metadata('fake_model'),
+                                                         artifact.arrays('fake_model')['weights'])
+        if 'domain_reputation' in artifact:
+            metadata = artifact.metadata('domain_reputation')
+            self.domain_index = DomainReputationIndex.from_arrays(artifact.arrays('domain_reputation'),
+                                                                  metadata.get('domains'),
+                                                                  metadata.get('version'))
+    
+    @property
+    def lexicon_version(self):
+        """Fingerprint of the indicator and source lists and the domain index"""
+        # Recomputed on every call so in-place edits to the lists invalidate the cache
+        digest = hashlib.sha1()
+        for terms in (self.fake_indicators, self.credible_sources, [self.domain_index.version]):
+            digest.update('\n'.join(terms).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:12]
+    
+    @property
+    def model_version(self):
+        """Fingerprint of the loaded classifier and its tiers, or "heuristic" without one"""
+        return f"{self.classifier.version}:{self.tiers.version}" if self.classifier is not None else "heuristic"
+    
+    def cache_key(self, title, content):
+        """Cache key for a title/content pair under the current version"""
+        # Case and punctuation feed the clickbait checks, so only outer whitespace is ignored
+        return make_cache_key('fake_news', f"{self.VERSION}:{self.lexicon_version}:{self.model_version}",
+                              title.strip(), content.strip())
+    
     def preprocess_text(self, text):
         """Clean text"""
-        text = text.lower()
-        text = re.sub(r'http\S+|www\S+|https\S+', '', text)
-        text = re.sub(r'[^\w\s]', ' ', text)
-        return text.strip()
+        return PREPROCESS_NORMALIZER.normalize(text).strip()
     
     def check_clickbait(self, title):
         """Check for clickbait patterns"""
-        title_lower = title.lower()
+        analysis = title if isinstance(title, TextAnalysis) else TextAnalysis(title)
+        title_lower = analysis.lower
         clickbait_score = 0
         
         for indicator in self.fake_indicators:
@@ -38,23 +121,69 @@ class FakeNewsDetector:
                 clickbait_score += 1
         
         # Check for excessive punctuation
-        if title.count('!') > 2 or title.count('?') > 2:
+        if analysis.text.count('!') > 2 or analysis.text.count('?') > 2:
             clickbait_score += 1
         
         # Check for all caps words
-        words = title.split()
+        words = analysis.words
         caps_words = sum(1 for word in words if word.isupper() and len(word) > 2)
         if caps_words > len(words) * 0.3:
             clickbait_score += 1
         
         return clickbait_score
     
+    def domain_scores(self, domains):
+        """Scores of the listed domains among `domains`, as {listed domain: score}"""
+        scores = {}
+        for domain in domains:
+            match = self.domain_index.lookup(domain)
+            if match is not None:
+                scores.setdefault(match["domain"], match["score"])
+        return scores
+    
+    def domain_adjustment(self, scores):
+        """Credibility change from the scores of the cited domains"""
+        adjustment = sum((score - 0.5) * DOMAIN_WEIGHT for score in scores)
+        return max(-MAX_DOMAIN_ADJUSTMENT, min(MAX_DOMAIN_ADJUSTMENT, adjustment))
+    
+    def heuristic_features(self, title, content):
+        """Indicator values for the classifier, in HEURISTIC_FEATURES order"""
+        title_lower = title.lower
+        content_lower = content.lower
+        words = title.words
+        caps_words = sum(1 for word in words if word.isupper() and len(word) > 2)
+        return [
+            sum(1 for indicator in self.fake_indicators if indicator in title_lower),
+            float(title.text.count('!') > 2 or title.text.count('?') > 2),
+            caps_words / len(words) if words else 0.0,
+            sum(1 for source in self.credible_sources if source in content_lower)
+            + sum(1 for score in self.domain_scores(content.domains).values() if score >= CREDIBLE_SCORE),
+            float(len(content.words) < 50),
+            sum(1 for indicator in self.fake_indicators if indicator in content_lower)
+        ]
+    
+    def model_probability(self, pairs):
+        """Classifier fake-news probability for (title, content) TextAnalysis pairs"""
+        texts = [f"{title.text}\n{content.text}" for title, content in pairs]
+        features = [self.heuristic_features(title, content) for title, content in pairs]
+        with timed('fake.model'):
+            return self.classifier.predict_proba(texts, features)
+    
     def analyze_content(self, content):
         """Analyze content credibility"""
-        if not content:
+        analysis = content if isinstance(content, TextAnalysis) else TextAnalysis(content)
+        if not analysis.text:
             return 0.5
         
-        content_lower = content.lower()
+        if self.classifier is not None:
+            return 1 - float(self.model_probability([(TextAnalysis(''), analysis)])[0])
+        return self.analyze_heuristic(analysis)
+    
+    def analyze_heuristic(self, analysis):
+        """Content credibility from source mentions, cited domains, length and sensational terms"""
+        if not analysis.text:
+            return 0.5
+        content_lower = analysis.lower
         
         # Check for credible sources
         credibility_score = 0
@@ -62,8 +191,11 @@ class FakeNewsDetector:
             if source in content_lower:
                 credibility_score += 0.2
         
+        # Reputation of the domains the content links to
+        credibility_score += self.domain_adjustment(self.domain_scores(analysis.domains).values())
+        
         # Check content length (very short = suspicious)
-        if len(content.split()) < 50:
+        if len(analysis.words) < 50:
             credibility_score -= 0.2
         
         # Check for sensational language
@@ -74,11 +206,15 @@ class FakeNewsDetector:
     
     def predict(self, title, content=""):
         """Predict if news is fake"""
+        return self.predict_analysis(TextAnalysis(title), TextAnalysis(content))
+    
+    def predict_analysis(self, title, content):
+        """Predict fake news from shared title and content TextAnalysis objects"""
         # If no title, use content as title
-        if not title and content:
+        if not title.text and content.text:
             title = content
         
-        if not title and not content:
+        if not title.text and not content.text:
             return {
                 "is_fake": False,
                 "confidence": 0.0,
@@ -88,40 +224,123 @@ class FakeNewsDetector:
                 "recommendation": "Please provide content to analyze"
             }
         
+        if self.cache is not None:
+            key = self.cache_key(title.text, content.text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
         # Analyze title
-        clickbait_score = self.check_clickbait(title)
+        with timed('fake.clickbait'):
+            clickbait_score = self.check_clickbait(title)
         
-        # Analyze content
-        content_credibility = self.analyze_content(content if content else title)
+        item = (title, content if content.text else title, clickbait_score)
+        if self.classifier is not None:
+            result = self.tiers.run([item])[0]
+        else:
+            result = self.heuristic_batch([item])[0]
+        
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return result
+    
+    def predict_batch(self, items):
+        """Predict fake news for many {title, content} items, in input order"""
+        results = [None] * len(items)
+        indices = []
+        keys = []
+        scored = []
         
-        # Calculate fake probability
-        fake_probability = (clickbait_score * 0.15) + (1 - content_credibility)
-        fake_probability = min(fake_probability, 1.0)
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[i] = {"error": "Item must be an object with title and content"}
+                continue
+            
+            title = item.get('title') or ''
+            content = item.get('content') or ''
+            if not isinstance(title, str) or not isinstance(content, str):
+                results[i] = {"error": "Title and content must be strings"}
+                continue
+            
+            if not title and content:
+                title = content
+            if not title and not content:
+                results[i] = self.predict(title, content)
+                continue
+            
+            if self.cache is not None:
+                key = self.cache_key(title, content)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+                keys.append(key)
+            
+            indices.append(i)
+            title = TextAnalysis(title)
+            scored.append((title, TextAnalysis(content) if content else title, self.check_clickbait(title)))
         
-        is_fake = fake_probability > 0.6
+        if not indices:
+            return results
         
-        # Determine category
-        if fake_probability > 0.8:
-            category = "highly_likely_fake"
-        elif fake_probability > 0.6:
-            category = "likely_fake"
-        elif fake_probability > 0.4:
-            category = "uncertain"
+        if self.classifier is not None:
+            outputs = self.tiers.run(scored)
         else:
-            category = "likely_real"
-        
-        return {
-            "is_fake": is_fake,
-            "confidence": round(fake_probability, 2),
-            "category": category,
-            "credibility_score": round(content_credibility, 2),
-            "clickbait_indicators": clickbait_score,
-            "recommendation": "Verify from credible sources" if is_fake else "Appears credible",
-            "details": {
-                "title_analysis": f"Found {clickbait_score} clickbait indicators",
-                "content_credibility": f"{int(content_credibility * 100)}% credible"
+            outputs = self.heuristic_batch(scored)
+        
+        for j, i in enumerate(indices):
+            results[i] = outputs[j]
+            if self.cache is not None:
+                self.cache.set(keys[j], results[i])
+        
+        return results
+    
+    def heuristic_batch(self, items):
+        """Fixed-weight scores for (title, body, clickbait) items"""
+        with timed('fake.content'):
+            credibility = np.array([self.analyze_heuristic(body) for _, body, _ in items], dtype=np.float64)
+        clickbait = np.array([count for _, _, count in items], dtype=np.int64)
+        fake_probability = np.minimum(clickbait * 0.15 + (1 - credibility), 1.0)
+        return self._results(fake_probability, credibility, fake_probability > 0.6, clickbait)
+    
+    def model_batch(self, items):
+        """Classifier scores for (title, body, clickbait) items"""
+        fake_probability = self.model_probability([(title, body) for title, body, _ in items])
+        clickbait = np.array([count for _, _, count in items], dtype=np.int64)
+        return self._results(fake_probability, 1 - fake_probability,
+                             fake_probability >= self.classifier.threshold, clickbait)
+    
+    def _results(self, fake_probability, credibility, is_fake, clickbait):
+        """Result dicts from per-item score arrays"""
+        with timed('fake.batch_score'):
+            category = np.select(
+                [fake_probability > 0.8, is_fake, fake_probability > 0.4],
+                ["highly_likely_fake", "likely_fake", "uncertain"],
+                default="likely_real"
+            )
+        
+        confidence = np.round(fake_probability, 2).tolist()
+        credibility_rounded = np.round(credibility, 2).tolist()
+        clickbait = clickbait.tolist()
+        credibility = credibility.tolist()
+        is_fake = is_fake.tolist()
+        category = category.tolist()
+        
+        return [
+            {
+                "is_fake": is_fake[j],
+                "confidence": confidence[j],
+                "category": category[j],
+                "credibility_score": credibility_rounded[j],
+                "clickbait_indicators": clickbait[j],
+                "recommendation": "Verify from credible sources" if is_fake[j] else "Appears credible",
+                "details": {
+                    "title_analysis": f"Found {clickbait[j]} clickbait indicators",
+                    "content_credibility": f"{int(credibility[j] * 100)}% credible"
+                }
             }
-        }
+            for j in range(len(confidence))
+        ]
 
 # Test function
 if __name__ == "__main__":
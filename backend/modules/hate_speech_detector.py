@@ -1,12 +1,48 @@
-import re
+import os
 import numpy as np
 
+from .cascade import CascadeScheduler, CascadeStage
+from .lexicon_matcher import LexiconMatcher, load_lexicon_file
+from .metrics import timed
+from .result_cache import make_cache_key
+from .text_analysis import TextAnalysis
+from .text_classifier import TextClassifier
+
+# Words that point a text at a person or group. Abuse without a lexicon term
+# nearly always has one, so the rules tier only settles a keyword-free text
+# as clean when it has none of them either
+TARGET_TERMS = frozenset([
+    'you', 'your', 'youre', 'yours', 'yourself', 'yourselves', 'u', 'ur', 'ya', 'yall',
+    'he', 'him', 'his', 'she', 'her', 'they', 'them', 'their', 'these', 'those', 'people',
+    'women', 'men', 'girls', 'boys', 'gay', 'gays', 'jews', 'muslims', 'christians',
+    'blacks', 'whites', 'immigrants', 'foreigners', 'refugees'
+])
+
 class HateSpeechDetector:
     """Detects hate speech and toxic content in text"""
     
-    def __init__(self):
-        # Use rule-based detection (transformers needs PyTorch)
+    # Bump when scoring logic changes so cached results are not reused
+    VERSION = "rules-3"
+    
+    def __init__(self, lexicon_path=None, cache=None, near_duplicates=None, model_path=None,
+                 cascade_band=None):
+        # Hashed n-gram logistic regression trained by train_models.py;
+        # without a model file, fall back to keyword rules
         self.classifier = None
+        if model_path and os.path.exists(model_path):
+            self.classifier = TextClassifier.load(model_path)
+        
+        # With a (low, high) band, the keyword rules answer first and only
+        # texts scoring inside the band go on to the classifier. No keyword
+        # is no evidence either way, so a low rule score is only trusted
+        # for texts that address nobody
+        rules = CascadeStage('rules', self.rule_batch, confirms_low=self.is_untargeted)
+        model = CascadeStage('model', self.model_detection)
+        self.tiers = CascadeScheduler('hate', [rules, model], cascade_band) if cascade_band \
+            else CascadeScheduler('hate', [model])
+        self.cache = cache
+        # Optional NearDuplicateIndex; reworded copies reuse their cluster's verdict
+        self.near_duplicates = near_duplicates
         self.hate_keywords = [
             'hate', 'kill', 'stupid', 'idiot', 'dumb', 'ugly',
             'racist', 'sexist', 'offensive', 'abuse', 'loser',
@@ -15,26 +51,98 @@ class HateSpeechDetector:
             'damn', 'hell', 'ass', 'crap', 'suck', 'sucks',
             'retard', 'moron', 'scum', 'filth', 'garbage'
         ]
+        
+        # Compiled once; rule_based_detection does a single pass per text
+        self.matcher = LexiconMatcher(self.hate_keywords)
+        self.lexicon_path = None
+        self._lexicon_mtime = None
+        if lexicon_path:
+            self.load_lexicon(lexicon_path)
+    
+    def load_lexicon(self, path):
+        """Replace the keyword lexicon with the terms in a lexicon file"""
+        mtime = os.path.getmtime(path)
+        keywords = load_lexicon_file(path)
+        matcher = LexiconMatcher(keywords)
+        
+        # Build fully before swapping so in-flight requests keep a consistent matcher
+        self.matcher = matcher
+        self.hate_keywords = keywords
+        self.lexicon_path = path
+        self._lexicon_mtime = mtime
+        # Cluster verdicts were scored with the old lexicon
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
+        return len(matcher)
+    
+    def load_artifact(self, artifact):
+        """Use the lexicon and model stored in a memory-mapped Artifact"""
+        matcher = self.matcher
+        if 'hate_lexicon' in artifact:
+            matcher = LexiconMatcher.from_arrays(artifact.arrays('hate_lexicon'))
+        classifier = self.classifier
+        if 'hate_model' in artifact:
+            classifier = TextClassifier.from_config(artifact.metadata('hate_model'),
+                                                    artifact.arrays('hate_model')['weights'])
+        
+        self.matcher = matcher
+        self.hate_keywords = matcher.terms
+        self.classifier = classifier
+        # The artifact now owns the lexicon; stop watching the lexicon file
+        self.lexicon_path = None
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
+    
+    def reload_lexicon_if_changed(self):
+        """Reload the lexicon file if it was modified since the last load"""
+        if not self.lexicon_path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.lexicon_path)
+        except OSError:
+            return False
+        if mtime == self._lexicon_mtime:
+            return False
+        self.load_lexicon(self.lexicon_path)
+        return True
+    
+    @property
+    def lexicon_version(self):
+        """Fingerprint of the currently loaded lexicon"""
+        return self.matcher.version
+    
+    @property
+    def model_version(self):
+        """Fingerprint of the loaded classifier and its tiers, or "rules" without one"""
+        return f"{self.classifier.version}:{self.tiers.version}" if self.classifier is not None else "rules"
+    
+    def cache_key(self, analysis):
+        """Cache key for a TextAnalysis under the current detector, lexicon and model version"""
+        # Matching and the classifier's features ignore case and spacing
+        normalized = ' '.join(analysis.lower.split())
+        return make_cache_key('hate_speech', f"{self.VERSION}:{self.lexicon_version}:{self.model_version}",
+                              normalized)
     
     def preprocess_text(self, text):
         """Clean and preprocess text"""
-        text = text.lower()
-        text = re.sub(r'http\S+|www\S+|https\S+', '', text)  # Remove URLs
-        text = re.sub(r'@\w+', '', text)  # Remove mentions
-        text = re.sub(r'#\w+', '', text)  # Remove hashtags
-        text = re.sub(r'[^\w\s]', '', text)  # Remove special chars
-        return text.strip()
+        return TextAnalysis(text).clean
+    
+    def highlight(self, text):
+        """Character spans of lexicon matches in the original text, obfuscated forms included"""
+        return [{"start": start, "end": end, "text": text[start:end], "term": term}
+                for term, start, end in self.matcher.iter_matches(text)]
     
     def rule_based_detection(self, text):
         """Simple rule-based detection as fallback"""
-        text_lower = text.lower()
-        hate_score = 0
-        found_keywords = []
+        analysis = text if isinstance(text, TextAnalysis) else TextAnalysis(text)
         
-        for keyword in self.hate_keywords:
-            if keyword in text_lower:
-                hate_score += 1
-                found_keywords.append(keyword)
+        with timed('hate.tokenize'):
+            tokens = analysis.tokens
+        
+        # Whole-token matches only, so "hello" no longer matches "hell"
+        with timed('hate.match'):
+            found_keywords = self.matcher.find_all_tokens(tokens)
+        hate_score = len(found_keywords)
         
         # Calculate confidence
         confidence = min(hate_score * 0.25, 1.0)
@@ -48,9 +156,51 @@ class HateSpeechDetector:
             "keywords_found": found_keywords
         }
     
+    def rule_batch(self, analyses, found=None):
+        """rule_based_detection for many TextAnalysis objects, scored together"""
+        if found is None:
+            found = [self.matcher.find_all_tokens(analysis.tokens) for analysis in analyses]
+        with timed('hate.batch_score'):
+            hits = np.fromiter((len(keywords) for keywords in found), dtype=np.float64, count=len(found))
+            confidence = np.minimum(hits * 0.25, 1.0)
+            return self._results(confidence, confidence > 0.4, found)
+    
+    @staticmethod
+    def is_untargeted(analysis):
+        """Whether a text has none of the words that aim abuse at a person or group"""
+        return TARGET_TERMS.isdisjoint(analysis.tokens)
+    
+    def model_detection(self, analyses, found=None):
+        """Score TextAnalysis objects with the trained classifier in one batch"""
+        if found is None:
+            found = [self.matcher.find_all_tokens(analysis.tokens) for analysis in analyses]
+        with timed('hate.model'):
+            probability = self.classifier.predict_proba([analysis.text for analysis in analyses])
+        return self._results(probability, probability >= self.classifier.threshold, found)
+    
+    def _results(self, confidence, is_hate, found):
+        """Result dicts from per-text score arrays, with the rule-based severity bands"""
+        severity = np.where(confidence > 0.7, "high", np.where(is_hate, "medium", "low")).tolist()
+        confidence = np.round(confidence, 2).tolist()
+        is_hate = is_hate.tolist()
+        return [
+            {
+                "is_hate_speech": is_hate[j],
+                "confidence": confidence[j],
+                "category": "hate_speech" if is_hate[j] else "normal",
+                "severity": severity[j],
+                "keywords_found": found[j]
+            }
+            for j in range(len(found))
+        ]
+    
     def predict(self, text):
         """Predict if text contains hate speech"""
-        if not text or len(text.strip()) == 0:
+        return self.predict_analysis(TextAnalysis(text))
+    
+    def predict_analysis(self, analysis):
+        """Predict hate speech from a shared TextAnalysis"""
+        if not analysis:
             return {
                 "is_hate_speech": False,
                 "confidence": 0.0,
@@ -58,11 +208,132 @@ class HateSpeechDetector:
                 "severity": "none"
             }
         
-        # Preprocess
-        clean_text = self.preprocess_text(text)
+        if self.cache is not None:
+            key = self.cache_key(analysis)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        signature = None
+        if self.near_duplicates is not None:
+            normalized = self.near_duplicates.normalize(analysis.text)
+            if normalized is not None:
+                # The lexicon always reads the incoming text, so an abusive edit of a
+                # clean post cannot borrow the clean verdict
+                with timed('hate.match'):
+                    found = self.matcher.find_all_tokens(analysis.tokens)
+                with timed('hate.minhash'):
+                    signature = self.near_duplicates.signature(normalized)
+                with timed('hate.cluster_lookup'):
+                    match = self.near_duplicates.lookup(signature, self._reusable(analysis, found))
+                if match is not None and match["verdict"] is not None:
+                    return self._cluster_result(match, found)
+        
+        if self.classifier is not None:
+            result = self.tiers.run([analysis])[0]
+        else:
+            result = self.rule_based_detection(analysis)
+        
+        # Cached without cluster_id: clusters age out of the index long before cache entries
+        if self.cache is not None:
+            self.cache.set(key, result)
+        if signature is not None:
+            # A member scored in full reports its cluster but does not replace its representative
+            result["cluster_id"] = match["cluster_id"] if match is not None else \
+                self.near_duplicates.add(signature, dict(result), analysis.tokens)
+        return result
+    
+    def _reusable(self, analysis, found):
+        """Whether a cluster verdict may stand for this text
+        
+        Only when every token of the text, and so every lexicon term, is
+        already in the representative: an edit that adds words, abusive or
+        not, is scored in full. With a classifier loaded the verdict is never
+        reused, since the model may read the same words differently.
+        """
+        if self.classifier is not None:
+            return lambda verdict, tokens: False
+        return lambda verdict, tokens: set(analysis.tokens) <= tokens and \
+            set(found) <= set(verdict.get("keywords_found", ()))
+    
+    def _cluster_result(self, match, found):
+        """Verdict of a cluster representative, reported for a near-duplicate with its own matches"""
+        return {
+            **match["verdict"],
+            "keywords_found": found,
+            "cluster_id": match["cluster_id"],
+            "cluster_size": match["size"]
+        }
+    
+    def predict_batch(self, texts):
+        """Predict hate speech for many texts, returning results in input order"""
+        results = [None] * len(texts)
+        indices = []
+        keys = []
+        analyses = []
+        found = []
+        normalized = []
+        
+        for i, text in enumerate(texts):
+            if not isinstance(text, str):
+                results[i] = {"error": "Text must be a string"}
+                continue
+            if not text.strip():
+                results[i] = self.predict(text)
+                continue
+            
+            analysis = TextAnalysis(text)
+            if self.cache is not None:
+                key = self.cache_key(analysis)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+                keys.append(key)
+            
+            indices.append(i)
+            analyses.append(analysis)
+            found.append(self.matcher.find_all_tokens(analysis.tokens))
+            if self.near_duplicates is not None:
+                normalized.append(self.near_duplicates.normalize(text))
+        
+        if not indices:
+            return results
+        
+        # Hash every clusterable text of the batch in one pass
+        signatures = [None] * len(indices)
+        if self.near_duplicates is not None:
+            clusterable = [j for j, value in enumerate(normalized) if value is not None]
+            if clusterable:
+                with timed('hate.minhash'):
+                    matrix = self.near_duplicates.signatures([normalized[j] for j in clusterable])
+                for row, j in enumerate(clusterable):
+                    signatures[j] = matrix[row]
+        
+        # Score the whole batch at once with the same thresholds as predict
+        if self.classifier is not None:
+            scored = self.tiers.run(analyses)
+        else:
+            scored = self.rule_batch(analyses, found)
+        
+        for j, i in enumerate(indices):
+            results[i] = scored[j]
+            
+            # Same answer as predict(): earlier items of the wave, in this
+            # batch or before it, decide the verdict of later ones
+            match = None
+            if signatures[j] is not None:
+                match = self.near_duplicates.lookup(signatures[j], self._reusable(analyses[j], found[j]))
+                if match is not None and match["verdict"] is not None:
+                    results[i] = self._cluster_result(match, found[j])
+                    continue
+            if self.cache is not None:
+                self.cache.set(keys[j], results[i])
+            if signatures[j] is not None:
+                results[i]["cluster_id"] = match["cluster_id"] if match is not None else \
+                    self.near_duplicates.add(signatures[j], dict(results[i]), analyses[j].tokens)
         
-        # Use rule-based detection
-        return self.rule_based_detection(text)
+        return results
 
 # Test function
 if __name__ == "__main__":
@@ -0,0 +1,338 @@
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+INDEX_MAGIC = b'PHIDX001'
+HEADER = struct.Struct('<8sQQ')
+ALIGNMENT = 64
+
+# Hashes are split into four 16-bit chunks for multi-index lookup
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# With four chunks, any hash within distance 7 differs by at most one bit
+# in some chunk, so probing single-bit flips of each chunk finds it
+MAX_SUPPORTED_DISTANCE = 7
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis as a matrix"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+_BIT_WEIGHTS = (1 << np.arange(63, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+def _pack_bits(bits):
+    """64 booleans, most significant first, as a Python int"""
+    return int(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.ravel()], initial=np.uint64(0)))
+
+
+def dhash(gray):
+    """64-bit difference hash of a grayscale image"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _pack_bits(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    """64-bit DCT perceptual hash of a grayscale image"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (_DCT_32 @ small @ _DCT_32.T)[:8, :8]
+    # The DC term only reflects overall brightness, so leave it out of the median
+    median = np.median(low.ravel()[1:])
+    return _pack_bits(low > median)
+
+
+def hamming(a, b):
+    """Number of differing bits between two 64-bit hashes"""
+    return bin(a ^ b).count('1')
+
+
+def _popcount(values):
+    """Per-element bit count of a uint64 array"""
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def _chunk(hash_value, index):
+    return (hash_value >> (CHUNK_BITS * index)) & CHUNK_MASK
+
+
+def _flip_masks(max_distance):
+    """Chunk probes: every value within max_distance // CHUNKS bits of the query chunk"""
+    masks = [0]
+    for radius in range(1, max_distance // CHUNKS + 1):
+        for bits in combinations(range(CHUNK_BITS), radius):
+            masks.append(sum(1 << bit for bit in bits))
+    return masks
+
+
+def _check_distance(max_distance):
+    if not 0 <= max_distance <= MAX_SUPPORTED_DISTANCE:
+        raise ValueError(f"max_distance must be between 0 and {MAX_SUPPORTED_DISTANCE}")
+
+
+class PerceptualHashIndex:
+    """Multi-index hash table for near-duplicate lookup of 64-bit image hashes
+
+    Entries live in flat arrays (hash, safe flag, confidence) plus, for each
+    16-bit chunk, the chunk values in sorted order and the entry ids in that
+    order. A lookup probes each chunk's sorted keys with binary search, so it
+    touches a handful of candidates even with millions of entries. Saved
+    indexes are memory-mapped read-only and shared between workers; entries
+    added while building one (build_hash_index.py) go to a small in-memory
+    delta that is merged in when it grows. The API never adds to it: verdicts
+    reached at runtime go to a RecentHashIndex instead.
+    """
+
+    def __init__(self, max_distance=6, merge_threshold=50000):
+        _check_distance(max_distance)
+        self.max_distance = max_distance
+        self.merge_threshold = merge_threshold
+        self._lock = threading.Lock()
+        self._set_base(*self._empty_arrays())
+        self._delta = []
+        self._delta_chunks = [dict() for _ in range(CHUNKS)]
+
+        self._flip_masks = _flip_masks(max_distance)
+
+    @staticmethod
+    def _empty_arrays():
+        return (np.zeros(0, np.uint64), np.zeros(0, np.uint8), np.zeros(0, np.float32),
+                [np.zeros(0, np.uint16) for _ in range(CHUNKS)],
+                [np.zeros(0, np.uint32) for _ in range(CHUNKS)])
+
+    def _set_base(self, hashes, safe, confidence, keys, order):
+        self._hashes = hashes
+        self._safe = safe
+        self._confidence = confidence
+        self._keys = keys
+        self._order = order
+
+    def __len__(self):
+        return len(self._hashes) + len(self._delta)
+
+    def add(self, hash_value, is_safe, confidence):
+        """Record the verdict for an image hash"""
+        with self._lock:
+            entry_id = len(self._hashes) + len(self._delta)
+            self._delta.append((hash_value, is_safe, confidence))
+            for index in range(CHUNKS):
+                self._delta_chunks[index].setdefault(_chunk(hash_value, index), []).append(entry_id)
+            if len(self._delta) >= self.merge_threshold:
+                self._merge()
+
+    def _merge(self):
+        """Fold the delta into the sorted base arrays"""
+        delta = np.array([entry[0] for entry in self._delta], dtype=np.uint64)
+        hashes = np.concatenate([self._hashes, delta])
+        safe = np.concatenate([self._safe, np.array([e[1] for e in self._delta], dtype=np.uint8)])
+        confidence = np.concatenate([self._confidence, np.array([e[2] for e in self._delta], dtype=np.float32)])
+        self._set_base(hashes, safe, confidence, *self._build_chunk_tables(hashes))
+        self._delta = []
+        self._delta_chunks = [dict() for _ in range(CHUNKS)]
+
+    @staticmethod
+    def _build_chunk_tables(hashes):
+        keys = []
+        order = []
+        for index in range(CHUNKS):
+            chunk = ((hashes >> np.uint64(CHUNK_BITS * index)) & np.uint64(CHUNK_MASK)).astype(np.uint16)
+            sort = np.argsort(chunk, kind='stable').astype(np.uint32)
+            keys.append(chunk[sort])
+            order.append(sort)
+        return keys, order
+
+    def _candidates(self, hash_value):
+        """Entry ids sharing a chunk (within the probe radius) with hash_value"""
+        ids = []
+        base_size = len(self._hashes)
+        for index in range(CHUNKS):
+            chunk = _chunk(hash_value, index)
+            probes = np.array([chunk ^ mask for mask in self._flip_masks], dtype=np.uint16)
+            if base_size:
+                keys = self._keys[index]
+                lo = np.searchsorted(keys, probes, side='left')
+                hi = np.searchsorted(keys, probes, side='right')
+                for start, stop in zip(lo, hi):
+                    if stop > start:
+                        ids.append(self._order[index][start:stop])
+            delta_chunks = self._delta_chunks[index]
+            for probe in probes.tolist():
+                matches = delta_chunks.get(probe)
+                if matches:
+                    ids.append(np.array(matches, dtype=np.uint32))
+        if not ids:
+            return np.zeros(0, np.uint32)
+        return np.unique(np.concatenate(ids))
+
+    def _entry(self, entry_id):
+        base_size = len(self._hashes)
+        if entry_id < base_size:
+            return int(self._hashes[entry_id]), bool(self._safe[entry_id]), float(self._confidence[entry_id])
+        return self._delta[entry_id - base_size]
+
+    def lookup(self, hash_value):
+        """Closest stored entry within max_distance as a dict, or None"""
+        with self._lock:
+            candidates = self._candidates(hash_value)
+            if not len(candidates):
+                return None
+
+            base_size = len(self._hashes)
+            stored = np.concatenate([
+                np.asarray(self._hashes[candidates[candidates < base_size]], dtype=np.uint64),
+                np.array([self._delta[int(i) - base_size][0] for i in candidates[candidates >= base_size]],
+                         dtype=np.uint64)
+            ])
+            distances = _popcount(stored ^ np.uint64(hash_value))
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                return None
+
+            matched_hash, is_safe, confidence = self._entry(int(candidates[best]))
+            return {
+                "hash": f"{matched_hash:016x}",
+                "distance": distance,
+                "is_safe": is_safe,
+                "confidence": round(confidence, 2)
+            }
+
+    def to_arrays(self):
+        """Flat arrays of every entry, for save() and model artifacts"""
+        with self._lock:
+            if self._delta:
+                self._merge()
+            arrays = {"hashes": self._hashes, "safe": self._safe, "confidence": self._confidence}
+            for index in range(CHUNKS):
+                arrays[f"keys{index}"] = self._keys[index]
+                arrays[f"order{index}"] = self._order[index]
+            return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, max_distance=6, merge_threshold=50000):
+        """Index over to_arrays() output; the arrays are used as is (e.g. memory-mapped)"""
+        index = cls(max_distance, merge_threshold)
+        index._set_base(arrays["hashes"], arrays["safe"], arrays["confidence"],
+                        [arrays[f"keys{i}"] for i in range(CHUNKS)],
+                        [arrays[f"order{i}"] for i in range(CHUNKS)])
+        return index
+
+    def save(self, path):
+        """Write the index atomically in the memory-mappable on-disk format"""
+        with self._lock:
+            if self._delta:
+                self._merge()
+            sections = [self._hashes, self._safe, self._confidence, *self._keys, *self._order]
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(INDEX_MAGIC, len(self._hashes), self.max_distance))
+                for section in sections:
+                    f.write(b'\0' * (-f.tell() % ALIGNMENT))
+                    f.write(np.ascontiguousarray(section).tobytes())
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, max_distance=None, merge_threshold=50000):
+        """Memory-map a saved index read-only; pages are shared between processes"""
+        with open(path, 'rb') as f:
+            magic, count, saved_distance = HEADER.unpack(f.read(HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a perceptual hash index")
+
+        index = cls(max_distance if max_distance is not None else saved_distance, merge_threshold)
+        dtypes = [np.uint64, np.uint8, np.float32] + [np.uint16] * CHUNKS + [np.uint32] * CHUNKS
+        offset = HEADER.size
+        arrays = []
+        for dtype in dtypes:
+            offset += -offset % ALIGNMENT
+            if count:
+                arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)))
+            else:
+                arrays.append(np.zeros(0, dtype))
+            offset += count * np.dtype(dtype).itemsize
+
+        index._set_base(arrays[0], arrays[1], arrays[2],
+                        arrays[3:3 + CHUNKS], arrays[3 + CHUNKS:])
+        return index
+
+
+class RecentHashIndex:
+    """Bounded, per-process near-duplicate index of verdicts reached at runtime
+
+    Kept apart from the curated PerceptualHashIndex so that index stays
+    read-only and shared. Entries are kept in least recently used order;
+    the oldest is dropped past `max_entries`, and an entry older than
+    `max_age` seconds is no longer returned. Lookups probe per-chunk tables
+    like the curated index, so they cost the same at any size.
+    """
+
+    def __init__(self, max_distance=6, max_entries=10000, max_age=86400):
+        _check_distance(max_distance)
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._flip_masks = _flip_masks(max_distance)
+        self._lock = threading.Lock()
+        # hash -> (is_safe, confidence, time added)
+        self._entries = OrderedDict()
+        self._chunks = [dict() for _ in range(CHUNKS)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, hash_value, is_safe, confidence):
+        """Record the verdict for an image hash, replacing any earlier one"""
+        with self._lock:
+            if hash_value in self._entries:
+                self._remove(hash_value)
+            self._entries[hash_value] = (is_safe, confidence, time.monotonic())
+            for index in range(CHUNKS):
+                self._chunks[index].setdefault(_chunk(hash_value, index), set()).add(hash_value)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, hash_value):
+        del self._entries[hash_value]
+        for index in range(CHUNKS):
+            chunk = _chunk(hash_value, index)
+            members = self._chunks[index][chunk]
+            members.discard(hash_value)
+            if not members:
+                del self._chunks[index][chunk]
+
+    def lookup(self, hash_value):
+        """Closest live entry within max_distance, in PerceptualHashIndex.lookup's format, or None"""
+        with self._lock:
+            expired = time.monotonic() - self.max_age
+            best, best_distance = None, self.max_distance + 1
+            for index in range(CHUNKS):
+                chunks = self._chunks[index]
+                chunk = _chunk(hash_value, index)
+                for mask in self._flip_masks:
+                    for candidate in chunks.get(chunk ^ mask, ()):
+                        distance = hamming(candidate, hash_value)
+                        if distance < best_distance and self._entries[candidate][2] >= expired:
+                            best, best_distance = candidate, distance
+            if best is None:
+                return None
+
+            self._entries.move_to_end(best)
+            is_safe, confidence, _ = self._entries[best]
+            return {
+                "hash": f"{best:016x}",
+                "distance": best_distance,
+                "is_safe": is_safe,
+                "confidence": round(confidence, 2)
+            }
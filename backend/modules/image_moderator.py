@@ -1,74 +1,164 @@
+import os
+import threading
+from functools import cached_property
+
 import cv2
 import numpy as np
-from PIL import Image
 import pytesseract
 
+from .cascade import CASCADE_TIER
+from .image_hash import phash
+from .metrics import timed
+
+FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+class DecodedImage:
+    """One decoded image plus derived views, shared by every analysis stage"""
+    
+    def __init__(self, bgr, original_size):
+        self.bgr = bgr
+        # (width, height) before any downscaling
+        self.original_size = original_size
+    
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+    
+    @cached_property
+    def hsv(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+    
+    @cached_property
+    def rgb(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+
 class ImageModerator:
     """Analyzes images for harmful content"""
     
-    def __init__(self):
+    def __init__(self, max_dimension=1024, hash_index=None, cascade=False, min_edge_density=0.0005,
+                 recent_hashes=None):
         # Initialize with basic thresholds
         self.nsfw_threshold = 0.7
         self.violence_threshold = 0.6
+        # Longest side images are analyzed at; larger images are downscaled once
+        self.max_dimension = max_dimension
+        # Optional PerceptualHashIndex of already-moderated images, read-only here
+        self.hash_index = hash_index
+        # Optional RecentHashIndex that remembers verdicts reached at runtime
+        self.recent_hashes = recent_hashes
+        # With cascade on, pixel statistics answer clear-cut images and only
+        # the rest pay for OCR and face detection
+        self.cascade = cascade
+        # Share of Canny edge pixels below which an image cannot hold legible text
+        self.min_edge_density = min_edge_density
+        self._tier_counters = {tier: CASCADE_TIER.labels('image', tier) for tier in ('pixels', 'full')}
+        
+        # CascadeClassifier is not safe to share between threads, so each
+        # thread parses the model once and keeps its own copy
+        self._local = threading.local()
+        # Load eagerly so a missing model fails at startup, not on the first request
+        self.face_cascade
     
-    def detect_text_in_image(self, image_path):
-        """Extract text from image using OCR"""
+    @property
+    def face_cascade(self):
+        """This thread's face cascade, loaded on first use"""
+        cascade = getattr(self._local, 'face_cascade', None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+            if cascade.empty():
+                raise RuntimeError(f"Could not load face cascade from {FACE_CASCADE_PATH}")
+            self._local.face_cascade = cascade
+        return cascade
+    
+    def decode(self, source):
+        """Decode bytes, a file-like object, a path or a BGR array exactly once"""
+        if isinstance(source, DecodedImage):
+            return source
+        
+        if isinstance(source, np.ndarray):
+            img = source
+        else:
+            if isinstance(source, (str, os.PathLike)):
+                with open(source, 'rb') as f:
+                    data = f.read()
+            elif hasattr(source, 'read'):
+                data = source.read()
+            else:
+                data = source
+            
+            buffer = np.frombuffer(data, dtype=np.uint8)
+            img = cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+            if img is None:
+                raise ValueError("Could not decode image")
+        
+        height, width = img.shape[:2]
+        scale = self.max_dimension / max(height, width)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        
+        return DecodedImage(img, (width, height))
+    
+    def detect_text_in_image(self, image, timeout=0):
+        """Extract text from image using OCR; tesseract is killed after `timeout` seconds (0 = none)"""
+        return self._read_text(image, timeout)[0]
+    
+    def _read_text(self, image, timeout):
+        """(OCR text, whether OCR ran); "" and False when it failed"""
         try:
-            img = Image.open(image_path)
-            text = pytesseract.image_to_string(img)
-            return text.strip()
+            image = self.decode(image)
+            text = pytesseract.image_to_string(image.rgb, timeout=timeout)
+            return text.strip(), True
+        except RuntimeError as e:
+            # pytesseract raises this after killing a tesseract that ran too long
+            if str(e) == 'Tesseract process timeout':
+                raise TimeoutError(f"OCR did not finish within {timeout}s")
+            print(f"OCR Error: {e}")
+            return "", False
         except Exception as e:
             print(f"OCR Error: {e}")
-            return ""
+            return "", False
     
-    def analyze_image_properties(self, image_path):
+    def analyze_image_properties(self, image):
         """Analyze basic image properties"""
         try:
-            img = cv2.imread(image_path)
-            
-            if img is None:
-                return None
+            image = self.decode(image)
             
             # Get image dimensions
-            height, width, channels = img.shape
+            width, height = image.original_size
             
             # Calculate brightness
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            brightness = np.mean(gray)
-            
-            # Calculate color distribution
-            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            brightness = np.mean(image.gray)
             
             # Detect red dominance (potential violence indicator)
-            red_mask = cv2.inRange(hsv, np.array([0, 50, 50]), np.array([10, 255, 255]))
-            red_percentage = (np.sum(red_mask > 0) / (height * width)) * 100
+            red_mask = cv2.inRange(image.hsv, np.array([0, 50, 50]), np.array([10, 255, 255]))
+            red_percentage = (np.count_nonzero(red_mask) / red_mask.size) * 100
             
             return {
                 "dimensions": f"{width}x{height}",
-                "brightness": round(brightness, 2),
+                "brightness": round(float(brightness), 2),
                 "red_percentage": round(red_percentage, 2)
             }
         except Exception as e:
             print(f"Image analysis error: {e}")
             return None
     
-    def detect_faces(self, image_path):
+    def detect_faces(self, image):
         """Detect faces in image"""
         try:
-            img = cv2.imread(image_path)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            image = self.decode(image)
             
-            # Load face cascade
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-            
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+            faces = self.face_cascade.detectMultiScale(image.gray, 1.1, 4)
             return len(faces)
         except Exception as e:
             print(f"Face detection error: {e}")
             return 0
     
+    def edge_density(self, image):
+        """Share of pixels on a Canny edge; text always produces dense edges"""
+        edges = cv2.Canny(image.gray, 100, 200)
+        return np.count_nonzero(edges) / edges.size
+    
     def check_violence_indicators(self, properties):
         """Check for violence indicators"""
         if not properties:
@@ -86,21 +176,45 @@ class ImageModerator:
         
         return min(violence_score, 1.0)
     
-    def analyze(self, image_path):
-        """Complete image analysis"""
+    def analyze(self, source, ocr_timeout=0):
+        """Complete image analysis of raw bytes, a file-like object, a path or an array"""
         try:
-            # Extract text from image
-            extracted_text = self.detect_text_in_image(image_path)
+            # Decode once; every stage below shares the same pixels
+            with timed('image.decode'):
+                image = self.decode(source)
             
-            # Analyze image properties
-            properties = self.analyze_image_properties(image_path)
+            # Re-uploads and light edits reuse the earlier verdict before any expensive stage
+            with timed('image.phash'):
+                image_hash = phash(image.gray)
+            with timed('image.hash_lookup'):
+                match = self._lookup_hash(image_hash)
+            if match is not None:
+                return self._near_duplicate_result(image_hash, match)
             
-            # Detect faces
-            face_count = self.detect_faces(image_path)
+            # Analyze image properties
+            with timed('image.properties'):
+                properties = self.analyze_image_properties(image)
             
             # Check for violence indicators
             violence_score = self.check_violence_indicators(properties)
             
+            if self.cascade:
+                with timed('image.pixels'):
+                    # Text can only make an image less safe, and edge-free images hold none
+                    settled = violence_score >= 0.5 or self.edge_density(image) < self.min_edge_density
+                if settled:
+                    self._tier_counters['pixels'].inc()
+                    return self._pixel_tier_result(image_hash, violence_score, properties)
+                self._tier_counters['full'].inc()
+            
+            # Extract text from image
+            with timed('image.ocr'):
+                extracted_text, text_read = self._read_text(image, ocr_timeout)
+            
+            # Detect faces
+            with timed('image.faces'):
+                face_count = self.detect_faces(image)
+            
             # Simple hate speech check in extracted text
             hate_keywords = ['hate', 'kill', 'stupid', 'ugly', 'racist']
             text_lower = extracted_text.lower()
@@ -108,17 +222,27 @@ class ImageModerator:
             
             # Determine if image is safe
             is_safe = violence_score < 0.5 and not hate_in_text
+            confidence = 0.7 if is_safe else 0.8
             
-            return {
+            # A "safe" verdict without the text is not one to hand to every re-upload
+            if text_read:
+                self._remember(image_hash, is_safe, confidence)
+            
+            result = {
                 "is_safe": is_safe,
-                "confidence": round(0.7 if is_safe else 0.8, 2),
+                "confidence": round(confidence, 2),
                 "extracted_text": extracted_text[:200] if extracted_text else "No text found",
                 "has_hate_text": hate_in_text,
                 "violence_score": round(violence_score, 2),
                 "face_count": face_count,
                 "properties": properties,
-                "warnings": self._generate_warnings(violence_score, hate_in_text, extracted_text)
+                "perceptual_hash": f"{image_hash:016x}",
+                "warnings": self._generate_warnings(violence_score, hate_in_text,
+                                                    extracted_text if text_read else None, text_read)
             }
+            if self.cascade:
+                result["tier"] = "full"
+            return result
         
         except Exception as e:
             return {
@@ -127,17 +251,78 @@ class ImageModerator:
                 "confidence": 0.0
             }
     
-    def _generate_warnings(self, violence_score, hate_in_text, text):
+    def _pixel_tier_result(self, image_hash, violence_score, properties):
+        """Result settled from pixel statistics alone, without OCR or face detection"""
+        is_safe = violence_score < 0.5
+        confidence = 0.7 if is_safe else 0.8
+        self._remember(image_hash, is_safe, confidence)
+        
+        return {
+            "is_safe": is_safe,
+            "confidence": round(confidence, 2),
+            # Safe images here have no edges that could be text; unsafe ones were not read
+            "extracted_text": "No text found" if is_safe else "Not analyzed",
+            "has_hate_text": False,
+            "violence_score": round(violence_score, 2),
+            "face_count": None,
+            "properties": properties,
+            "perceptual_hash": f"{image_hash:016x}",
+            "warnings": self._generate_warnings(violence_score, False, "" if is_safe else None),
+            "tier": "pixels"
+        }
+    
+    def _lookup_hash(self, image_hash):
+        """Closest match in the curated index, else in the recent verdicts, or None"""
+        if self.hash_index is not None:
+            match = self.hash_index.lookup(image_hash)
+            if match is not None:
+                return match
+        if self.recent_hashes is not None:
+            return self.recent_hashes.lookup(image_hash)
+        return None
+    
+    def _remember(self, image_hash, is_safe, confidence):
+        if self.recent_hashes is not None:
+            self.recent_hashes.add(image_hash, is_safe, confidence)
+    
+    def _near_duplicate_result(self, image_hash, match):
+        """Result for an image that matches an already-moderated one"""
+        warnings = ["Near-duplicate of a previously moderated image"]
+        if not match["is_safe"]:
+            warnings.append("Matches a known harmful image")
+        
+        return {
+            "is_safe": match["is_safe"],
+            "confidence": match["confidence"],
+            "perceptual_hash": f"{image_hash:016x}",
+            "near_duplicate": {
+                "hash": match["hash"],
+                "distance": match["distance"]
+            },
+            "warnings": warnings
+        }
+    
+    def analyze_batch(self, sources, executor=None):
+        """Analyze many images, in parallel when given an executor, in input order"""
+        if executor is None:
+            return [self.analyze(source) for source in sources]
+        return list(executor.map(self.analyze, sources))
+    
+    def _generate_warnings(self, violence_score, hate_in_text, text, text_read=True):
         """Generate warning messages"""
         warnings = []
         
+        if not text_read:
+            warnings.append("Text in image could not be read")
+        
         if violence_score > 0.5:
             warnings.append("Potential violent content detected")
         
         if hate_in_text:
             warnings.append("Hate speech detected in image text")
         
-        if not text:
+        # None means OCR did not run
+        if text is not None and not text:
             warnings.append("No text found in image")
         
         return warnings if warnings else ["Image appears safe"]
@@ -0,0 +1,362 @@
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from .metrics import REGISTRY, timed
+
+JOBS_TOTAL = REGISTRY.counter(
+    'moderation_jobs_total', 'Finished job attempts by kind and outcome', ['kind', 'outcome']
+)
+JOB_WAIT_SECONDS = REGISTRY.histogram(
+    'moderation_job_wait_seconds', 'Time jobs spent queued before a worker claimed them', ['kind'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+)
+
+# Statuses a job moves through; done and failed are final
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Seconds added to a job's timeout before another worker may assume it died
+LEASE_GRACE = 30
+
+
+def parse_callback_hosts(value):
+    """Allowed callback hosts from a comma-separated list; '.example.com' also allows its subdomains"""
+    return tuple(host.strip().lower() for host in (value or '').split(',') if host.strip())
+
+
+def check_callback_url(url, allowed_hosts):
+    """Raise ValueError unless url is an http(s) URL on an allowed host that resolves to public addresses only
+
+    Checked when a job is submitted and again before each callback, so a
+    host re-pointed at an internal address in between is still refused.
+    """
+    if not allowed_hosts:
+        raise ValueError("Job callbacks are disabled; set JOB_CALLBACK_HOSTS to allow them")
+    parsed = urllib.parse.urlsplit(url)
+    host = (parsed.hostname or '').lower()
+    if parsed.scheme not in ('http', 'https') or not host:
+        raise ValueError("callback_url must be an http(s) URL")
+    if not any(host == allowed or (allowed.startswith('.') and host.endswith(allowed))
+               for allowed in allowed_hosts):
+        raise ValueError(f"callback_url host {host} is not in JOB_CALLBACK_HOSTS")
+    try:
+        port = parsed.port
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port or 443, proto=socket.IPPROTO_TCP)}
+    except (ValueError, OSError) as e:
+        raise ValueError(f"callback_url host {host} cannot be resolved: {e}") from None
+    for address in addresses:
+        # Loopback, RFC 1918, link-local (cloud metadata), CGNAT, multicast and reserved ranges
+        if not ipaddress.ip_address(address.split('%', 1)[0]).is_global:
+            raise ValueError(f"callback_url host {host} resolves to a non-public address")
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    """A redirect could point the callback anywhere; treat it as a failure instead"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirects)
+
+
+class JobQueue:
+    """Persistent priority queue of moderation jobs in one SQLite file
+
+    Every process that opens the same path shares the queue, so gunicorn
+    workers and restarts drain it together. A running job holds a lease of
+    its timeout plus a grace period; if its worker dies the lease expires
+    and the job is queued again, counting as one attempt.
+    """
+
+    def __init__(self, path, retention=86400):
+        self.path = path
+        # Finished jobs (and their results) are kept this many seconds
+        self.retention = retention
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " priority INTEGER NOT NULL, params TEXT NOT NULL, payload BLOB,"
+            " attempts INTEGER NOT NULL, max_attempts INTEGER NOT NULL, timeout REAL NOT NULL,"
+            " callback_url TEXT, result TEXT, error TEXT,"
+            " created REAL NOT NULL, available_at REAL NOT NULL,"
+            " started REAL, finished REAL, lease_expires REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, created)")
+
+    def _connection(self):
+        # One connection per thread, and never reuse one inherited across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def submit(self, kind, params=None, payload=None, priority=0, max_attempts=3, timeout=60.0,
+               callback_url=None):
+        """Queue a job and return its ID; higher priority runs first"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, kind, status, priority, params, payload, attempts, max_attempts,"
+            " timeout, callback_url, created, available_at) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, int(priority), json.dumps(params or {}), payload,
+             int(max_attempts), float(timeout), callback_url, now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """Mark the next ready job running and return it, or None when the queue is idle"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose worker died go back to the queue, or fail if out of attempts
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END,"
+                " error = 'Worker lease expired', finished = CASE WHEN attempts < max_attempts"
+                " THEN NULL ELSE ? END WHERE status = ? AND lease_expires < ?",
+                (QUEUED, FAILED, now, RUNNING, now)
+            )
+            row = conn.execute(
+                "SELECT id, kind, params, payload, attempts, max_attempts, timeout, callback_url, created"
+                " FROM jobs WHERE status = ? AND available_at <= ?"
+                " ORDER BY priority DESC, created LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job_id, kind, params, payload, attempts, max_attempts, timeout, callback_url, created = row
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started = ?, lease_expires = ?"
+                " WHERE id = ?",
+                (RUNNING, now, now + timeout + LEASE_GRACE, job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return {
+            "id": job_id,
+            "kind": kind,
+            "params": json.loads(params),
+            "payload": bytes(payload) if payload is not None else None,
+            "attempt": attempts + 1,
+            "max_attempts": max_attempts,
+            "timeout": timeout,
+            "callback_url": callback_url,
+            "created": created
+        }
+
+    def complete(self, job_id, attempt, result):
+        """Store the result of one attempt; False if the attempt had already lost its lease
+
+        The payload is dropped once it is no longer needed.
+        """
+        return self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, payload = NULL, finished = ?,"
+            " lease_expires = NULL WHERE id = ? AND status = ? AND attempts = ?",
+            (DONE, json.dumps(result), time.time(), job_id, RUNNING, attempt)
+        ).rowcount > 0
+
+    def fail(self, job_id, attempt, error, retry_delay=1.0, retry=True):
+        """Record a failed attempt; the job is retried with backoff until out of attempts
+
+        Returns the job's new status, or None if the attempt had already
+        lost its lease (the job was queued again or failed meanwhile).
+        """
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if retry and attempt < row[0]:
+            status, updated = QUEUED, conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_expires = NULL"
+                " WHERE id = ? AND status = ? AND attempts = ?",
+                (QUEUED, error, now + retry_delay * 2 ** (attempt - 1), job_id, RUNNING, attempt)
+            )
+        else:
+            status, updated = FAILED, conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, finished = ?, lease_expires = NULL"
+                " WHERE id = ? AND status = ? AND attempts = ?",
+                (FAILED, error, now, job_id, RUNNING, attempt)
+            )
+        return status if updated.rowcount > 0 else None
+
+    def get(self, job_id):
+        """Status of one job, with its result once done"""
+        row = self._connection().execute(
+            "SELECT id, kind, status, priority, attempts, max_attempts, result, error,"
+            " created, started, finished FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        (job_id, kind, status, priority, attempts, max_attempts, result, error,
+         created, started, finished) = row
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": status,
+            "priority": priority,
+            "attempts": attempts,
+            "max_attempts": max_attempts,
+            "created": created,
+            "started": started,
+            "finished": finished
+        }
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def depth(self):
+        """Job counts by status"""
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0)
+        for status, count in self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def prune(self):
+        """Delete finished jobs older than the retention period"""
+        self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+            (DONE, FAILED, time.time() - self.retention)
+        )
+
+
+class JobWorkerPool:
+    """Threads that drain a JobQueue with one handler per job kind
+
+    A handler gets the job's params, payload and timeout in seconds and
+    returns a JSON-serializable result; raising fails the attempt, and a
+    ValueError (bad input) fails the job without retries. The
+    timeout is for handlers to pass to anything that can hang (tesseract is
+    killed by pytesseract when it expires), since a Python thread cannot be
+    stopped from outside. Threads start lazily in each process, so a pool
+    created before gunicorn forks is safe.
+    """
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=0.5, retry_delay=1.0, callback_hosts=()):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        # Hosts job results may be POSTed to; none means callbacks are off
+        self.callback_hosts = callback_hosts
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def notify(self):
+        """Wake an idle worker after a submit in this process"""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        last_prune = 0.0
+        while not self._stop.is_set():
+            # Nothing may end the thread: ensure_started() would not replace it
+            try:
+                job = self.queue.claim()
+                if job is None:
+                    if time.monotonic() - last_prune > 60:
+                        self.queue.prune()
+                        last_prune = time.monotonic()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                self.run_job(job)
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def run_job(self, job):
+        kind = job["kind"]
+        JOB_WAIT_SECONDS.labels(kind).observe(max(0.0, time.time() - job["created"]))
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind {kind}")
+            with timed(f'job.{kind}'):
+                result = handler(job["params"], job["payload"], job["timeout"])
+        except Exception as e:
+            self._failed(job, str(e), retry=not isinstance(e, ValueError))
+            return
+
+        try:
+            stored = self.queue.complete(job["id"], job["attempt"], result)
+        except (TypeError, ValueError) as e:
+            # Not JSON-serializable: no retry would produce a storable result
+            self._failed(job, f"Job result could not be stored: {e}", retry=False)
+            return
+        if not stored:
+            # Ran past its lease: a newer attempt or the lease expiry owns the job now
+            JOBS_TOTAL.labels(kind, 'stale').inc()
+            return
+        JOBS_TOTAL.labels(kind, 'done').inc()
+        self.send_callback(job)
+
+    def _failed(self, job, error, retry):
+        status = self.queue.fail(job["id"], job["attempt"], error, self.retry_delay, retry=retry)
+        JOBS_TOTAL.labels(job["kind"], 'stale' if status is None else 'retry' if status == QUEUED else 'failed').inc()
+        if status == FAILED:
+            self.send_callback(job)
+
+    def send_callback(self, job):
+        """POST the final job status to the submitter's callback URL, best effort"""
+        if not job["callback_url"]:
+            return
+        try:
+            check_callback_url(job["callback_url"], self.callback_hosts)
+            body = json.dumps(self.queue.get(job["id"])).encode('utf-8')
+            callback = urllib.request.Request(
+                job["callback_url"], data=body, headers={'Content-Type': 'application/json'}, method='POST'
+            )
+            with _callback_opener.open(callback, timeout=5):
+                pass
+        except Exception as e:
+            print(f"Job callback to {job['callback_url']} failed: {e}")
@@ -0,0 +1,43 @@
+import threading
+import time
+
+
+class LazyComponent:
+    """Stand-in for an object that is built on first use
+
+    Attribute access is forwarded to the built object, so callers use the
+    component as if it were the object itself. Concurrent first uses wait
+    for a single build; a build that raises is retried on the next use.
+    Assigning attributes needs the real object from get().
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                started = time.perf_counter()
+                instance = self._factory()
+                self.load_seconds = time.perf_counter() - started
+                self._instance = instance
+            return self._instance
+
+    def __getattr__(self, name):
+        # Only called for names the component itself does not have
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        state = f"loaded in {self.load_seconds * 1000:.1f} ms" if self.loaded else "not loaded"
+        return f"<LazyComponent {self.name}: {state}>"
@@ -0,0 +1,222 @@
+import hashlib
+import re
+
+import numpy as np
+
+from .text_normalizer import MATCH_NORMALIZER
+
+# Tokens are runs of word characters; \w is Unicode-aware so this covers
+# non-Latin scripts as well as English
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize_term(term):
+    """Split a lexicon term into tokens, normalized the same way as the text it is matched against"""
+    return TOKEN_PATTERN.findall(MATCH_NORMALIZER.normalize(term))
+
+
+def _pack_strings(strings):
+    """UTF-8 blob plus offsets, the flat form of a list of strings"""
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def load_lexicon_file(path):
+    """Read a lexicon file: one term per line, '#' starts a comment"""
+    terms = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            term = line.split('#', 1)[0].strip()
+            if term:
+                terms.append(term)
+    return terms
+
+
+class LexiconMatcher:
+    """Token-level Aho-Corasick automaton for whole-word lexicon matching
+
+    Terms may be single words or multi-word phrases. The automaton is built
+    once, then every lookup is a single left-to-right pass over the tokens of
+    the input, so cost does not depend on how many terms are loaded.
+    """
+
+    def __init__(self, terms=()):
+        self.terms = []
+        self._term_lengths = []
+        # Per-state transition table, failure link and emitted term ids
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self.max_phrase_tokens = 0
+
+        seen = set()
+        for term in terms:
+            tokens = tokenize_term(term)
+            key = ' '.join(tokens)
+            if not tokens or key in seen:
+                continue
+            seen.add(key)
+            self._add(key, tokens)
+
+        self._build_failure_links()
+        self.version = self._fingerprint()
+
+    @classmethod
+    def from_file(cls, path):
+        """Build a matcher from a lexicon file"""
+        return cls(load_lexicon_file(path))
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _add(self, key, tokens):
+        """Insert a tokenized term into the trie"""
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+
+        self._output[state].append(len(self.terms))
+        self.terms.append(key)
+        self._term_lengths.append(len(tokens))
+        self.max_phrase_tokens = max(self.max_phrase_tokens, len(tokens))
+
+    def _build_failure_links(self):
+        """Breadth-first pass that fills failure links and merges outputs"""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child].extend(self._output[self._fail[child]])
+
+        # Outputs are read-only from here on
+        self._output = [tuple(out) for out in self._output]
+
+    def to_arrays(self):
+        """The automaton as flat arrays (CSR transitions and outputs)"""
+        vocabulary = sorted({token for edges in self._goto for token in edges})
+        token_ids = {token: i for i, token in enumerate(vocabulary)}
+        edge_tokens, edge_targets, output_terms = [], [], []
+        edge_indptr = [0]
+        output_indptr = [0]
+        for edges, output in zip(self._goto, self._output):
+            for token, target in sorted(edges.items()):
+                edge_tokens.append(token_ids[token])
+                edge_targets.append(target)
+            edge_indptr.append(len(edge_tokens))
+            output_terms.extend(output)
+            output_indptr.append(len(output_terms))
+
+        terms, term_offsets = _pack_strings(self.terms)
+        tokens, token_offsets = _pack_strings(vocabulary)
+        return {
+            "terms": terms,
+            "term_offsets": term_offsets,
+            "term_lengths": np.array(self._term_lengths, dtype=np.int32),
+            "tokens": tokens,
+            "token_offsets": token_offsets,
+            "edge_indptr": np.array(edge_indptr, dtype=np.int64),
+            "edge_tokens": np.array(edge_tokens, dtype=np.int32),
+            "edge_targets": np.array(edge_targets, dtype=np.int32),
+            "fail": np.array(self._fail, dtype=np.int32),
+            "output_indptr": np.array(output_indptr, dtype=np.int64),
+            "output_terms": np.array(output_terms, dtype=np.int32)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild a matcher from to_arrays() output without re-running the construction"""
+        matcher = cls()
+        vocabulary = _unpack_strings(arrays["tokens"], arrays["token_offsets"])
+        edge_indptr = arrays["edge_indptr"].tolist()
+        edge_tokens = arrays["edge_tokens"].tolist()
+        edge_targets = arrays["edge_targets"].tolist()
+        output_indptr = arrays["output_indptr"].tolist()
+        output_terms = arrays["output_terms"].tolist()
+
+        matcher._goto = [
+            {vocabulary[edge_tokens[i]]: edge_targets[i] for i in range(start, end)}
+            for start, end in zip(edge_indptr, edge_indptr[1:])
+        ]
+        matcher._output = [
+            tuple(output_terms[start:end]) for start, end in zip(output_indptr, output_indptr[1:])
+        ]
+        matcher._fail = arrays["fail"].tolist()
+        matcher.terms = _unpack_strings(arrays["terms"], arrays["term_offsets"])
+        matcher._term_lengths = arrays["term_lengths"].tolist()
+        matcher.max_phrase_tokens = max(matcher._term_lengths, default=0)
+        matcher.version = matcher._fingerprint()
+        return matcher
+
+    def _fingerprint(self):
+        """Short stable hash of the loaded terms"""
+        digest = hashlib.sha1('\n'.join(sorted(self.terms)).encode('utf-8'))
+        return digest.hexdigest()[:12]
+
+    def match_tokens(self, tokens):
+        """Yield (term_id, first_token, last_token) for every match"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        lengths = self._term_lengths
+        state = 0
+
+        for index, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for term_id in output[state]:
+                yield term_id, index - lengths[term_id] + 1, index
+
+    def iter_matches(self, text):
+        """Yield (term, start, end) character spans of matches in the original text
+
+        Matching runs on the normalized text, so a span covers the obfuscated
+        form as written ("1d10t", "s.t.u.p.i.d").
+        """
+        normalized, offsets = MATCH_NORMALIZER.normalize_with_offsets(text)
+        spans = []
+        tokens = []
+        for m in TOKEN_PATTERN.finditer(normalized):
+            spans.append(m.span())
+            tokens.append(m.group())
+        for term_id, first, last in self.match_tokens(tokens):
+            yield self.terms[term_id], offsets[spans[first][0]], offsets[spans[last][1] - 1] + 1
+
+    def find_all(self, text):
+        """Distinct matched terms in order of first occurrence"""
+        return self.find_all_tokens(TOKEN_PATTERN.findall(MATCH_NORMALIZER.normalize(text)))
+
+    def find_all_tokens(self, tokens):
+        """Distinct matched terms in already-tokenized, normalized input"""
+        found = {}
+        for term_id, _, _ in self.match_tokens(tokens):
+            if term_id not in found:
+                found[term_id] = None
+        return [self.terms[term_id] for term_id in found]
+
+    def count(self, text):
+        """Number of distinct terms that occur in text"""
+        return len(self.find_all(text))
@@ -0,0 +1,232 @@
+import hashlib
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Rolling-hash base for byte shingles
+SHINGLE_BASE = np.uint64(1099511628211)
+# Shingles hashed per MinHash chunk; bounds the (num_perm x shingles) working set
+CHUNK_SHINGLES = 1 << 16
+
+
+def normalize_for_shingles(text):
+    """Lowercase and collapse whitespace so spacing tricks don't split clusters"""
+    return ' '.join(text.lower().split())
+
+
+def shingle_hashes(texts, shingle_size):
+    """Hash every character shingle of every text in one vectorized pass
+
+    Returns (hashes, starts): hashes of all shingles concatenated in text
+    order, and the index of each text's first shingle. Texts must be at
+    least `shingle_size` bytes long.
+    """
+    encoded = [text.encode('utf-8') for text in texts]
+    lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    powers = SHINGLE_BASE ** np.arange(shingle_size - 1, -1, -1, dtype=np.uint64)
+    windows = sliding_window_view(data, shingle_size) @ powers
+
+    # Drop windows that straddle two texts
+    ends = np.cumsum(lengths)
+    window_text = np.repeat(np.arange(len(encoded)), lengths)[:len(windows)]
+    valid = np.arange(len(windows)) + shingle_size <= ends[window_text]
+    hashes = windows[valid]
+    hashes = ((hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xffffffff)).astype(np.uint32)
+
+    counts = lengths - shingle_size + 1
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return hashes, starts
+
+
+class NearDuplicateIndex:
+    """Clusters near-identical texts with MinHash signatures and LSH banding
+
+    Each text becomes a set of character shingles whose MinHash signature is
+    split into bands; texts sharing any band are candidates and join a
+    cluster when their estimated Jaccard similarity reaches `threshold`.
+    Clusters carry the verdict of their first member (the representative)
+    so reworded copies in a spam wave reuse it.
+
+    Buckets live in generations covering `window_seconds / generations` each.
+    The oldest generation is dropped as time moves on (or when one fills up),
+    taking its buckets and idle clusters with it, so memory stays flat.
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=5, threshold=0.7,
+                 window_seconds=3600, generations=6, max_clusters=100000,
+                 min_length=20, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.generations = generations
+        self.max_clusters = max_clusters
+        # Shorter texts share too few shingles to cluster reliably
+        self.min_length = max(min_length, shingle_size)
+
+        rng = np.random.default_rng(seed)
+        # Random affine permutations of the 32-bit shingle hashes; 32-bit
+        # multiplies vectorize far better than 64-bit ones
+        self._a = (rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint32) << np.uint32(1)) | np.uint32(1)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32)
+        self._band_weights = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget every cluster, e.g. after the scoring rules change"""
+        with self._lock:
+            self._generations = deque()
+            self._clusters = {}
+            self._generation_number = 0
+            self._rotate(time.monotonic())
+            self.hits = 0
+            self.misses = 0
+
+    def normalize(self, text):
+        """Normalized text, or None when it is too short to cluster"""
+        normalized = normalize_for_shingles(text)
+        return normalized if len(normalized) >= self.min_length else None
+
+    def signatures(self, texts):
+        """MinHash signatures of normalized texts as a (len(texts), num_perm) array"""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # Group texts so each chunk hashes roughly CHUNK_SHINGLES shingles
+            stop, shingles = start, 0
+            while stop < len(texts) and (stop == start or shingles < CHUNK_SHINGLES):
+                shingles += len(texts[stop]) - self.shingle_size + 1
+                stop += 1
+
+            hashes, starts = shingle_hashes(texts[start:stop], self.shingle_size)
+            permuted = np.multiply(self._a[:, None], hashes[None, :])
+            permuted += self._b[:, None]
+            result[start:stop] = np.minimum.reduceat(permuted, starts, axis=1).T
+            start = stop
+        return result
+
+    def signature(self, text):
+        return self.signatures([text])[0]
+
+    def band_keys(self, signatures):
+        """One bucket key per band for each signature row"""
+        signatures = np.atleast_2d(signatures)
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (banded * self._band_weights).sum(axis=2)
+
+    def _rotate(self, now):
+        self._generation_number += 1
+        self._generations.append({
+            "number": self._generation_number,
+            "started": now,
+            "buckets": [dict() for _ in range(self.bands)],
+            "cluster_ids": set()
+        })
+        while len(self._generations) > self.generations:
+            expired = self._generations.popleft()
+            for cluster_id in expired["cluster_ids"]:
+                cluster = self._clusters.get(cluster_id)
+                if cluster is not None and cluster["generation"] == expired["number"]:
+                    del self._clusters[cluster_id]
+
+    def _current(self, now):
+        current = self._generations[-1]
+        span = self.window_seconds / self.generations
+        per_generation = max(1, self.max_clusters // self.generations)
+        if now - current["started"] >= span or len(current["cluster_ids"]) >= per_generation:
+            self._rotate(now)
+            current = self._generations[-1]
+        return current
+
+    def _touch(self, cluster, keys, now):
+        """Move a cluster into the current generation so active waves stay indexed"""
+        current = self._current(now)
+        if cluster["generation"] != current["number"]:
+            cluster["generation"] = current["number"]
+            for band, key in enumerate(keys):
+                current["buckets"][band][key] = cluster["cluster_id"]
+        current["cluster_ids"].add(cluster["cluster_id"])
+
+    def lookup(self, signature, accept=None):
+        """Closest cluster at or above the similarity threshold as a dict, or None
+
+        With `accept`, a callable given the cluster's verdict and its
+        representative's tokens, a cluster it turns down still counts the
+        text as a member but its verdict is not reused: "verdict" is None.
+        """
+        keys = self.band_keys(signature)[0].tolist()
+        now = time.monotonic()
+        with self._lock:
+            best, best_similarity = None, 0.0
+            seen = set()
+            for generation in reversed(self._generations):
+                for band, key in enumerate(keys):
+                    cluster_id = generation["buckets"][band].get(key)
+                    if cluster_id is None or cluster_id in seen:
+                        continue
+                    seen.add(cluster_id)
+                    cluster = self._clusters.get(cluster_id)
+                    if cluster is None:
+                        continue
+                    similarity = float(np.count_nonzero(cluster["signature"] == signature)) / self.num_perm
+                    if similarity > best_similarity:
+                        best, best_similarity = cluster, similarity
+
+            if best is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+            reused = accept is None or accept(best["verdict"], best["tokens"])
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+            best["size"] += 1
+            self._touch(best, keys, now)
+            return {
+                "cluster_id": best["cluster_id"],
+                "size": best["size"],
+                "similarity": round(best_similarity, 2),
+                "verdict": best["verdict"] if reused else None
+            }
+
+    def add(self, signature, verdict, tokens=()):
+        """Start a cluster represented by this signature, verdict and tokens; returns its id"""
+        keys = self.band_keys(signature)[0].tolist()
+        cluster_id = hashlib.sha1(signature.tobytes()).hexdigest()[:16]
+        now = time.monotonic()
+        with self._lock:
+            cluster = self._clusters.get(cluster_id)
+            if cluster is None:
+                cluster = {
+                    "cluster_id": cluster_id,
+                    "signature": signature.copy(),
+                    "verdict": verdict,
+                    "tokens": frozenset(tokens),
+                    "size": 1,
+                    "generation": None
+                }
+                self._clusters[cluster_id] = cluster
+            self._touch(cluster, keys, now)
+        return cluster_id
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "clusters": len(self._clusters),
+                "generations": len(self._generations),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,99 @@
+import gzip
+
+# Faster encoders and brotli are optional; without them responses are
+# standard-library JSON and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_ALIASES = ('application/x-msgpack', 'application/vnd.msgpack')
+
+# Compact responses carry categories and severities as these numbers
+CATEGORY_CODES = {
+    # Hate speech
+    "empty": 0, "normal": 1, "hate_speech": 2,
+    # Fake news
+    "insufficient_data": 0, "likely_real": 1, "uncertain": 2, "likely_fake": 3, "highly_likely_fake": 4
+}
+SEVERITY_CODES = {"none": 0, "low": 1, "medium": 2, "high": 3}
+CODED_FIELDS = {"category": CATEGORY_CODES, "severity": SEVERITY_CODES}
+# Echoed input (text, and span excerpts that start/end already locate) and
+# prose restating other fields
+OMITTED_FIELDS = frozenset(('text', 'recommendation', 'details'))
+_CONTAINERS = (dict, list)
+
+
+def wants_compact(args, headers):
+    """Whether the request asked for compact responses (Prefer: return=minimal or ?compact=1)"""
+    prefer = headers.get('Prefer', '').replace(' ', '').lower()
+    return 'return=minimal' in prefer or args.get('compact', '').lower() in ('1', 'true')
+
+
+def compact(value):
+    """Copy of a response body without echoed input or prose, categories as codes
+
+    Results may be shared with the cache, so nothing is modified in place.
+    """
+    if type(value) is list:
+        return [compact(item) if type(item) in _CONTAINERS else item for item in value]
+    if type(value) is not dict:
+        return value
+    out = {}
+    for key, item in value.items():
+        if key in OMITTED_FIELDS:
+            continue
+        kind = type(item)
+        if kind in _CONTAINERS:
+            item = compact(item)
+        elif kind is str and key in CODED_FIELDS:
+            item = CODED_FIELDS[key].get(item, item)
+        out[key] = item
+    return out
+
+
+def response_mimetypes():
+    """Response types this server can produce, preferred first"""
+    if msgpack is None:
+        return [JSON_MIMETYPE]
+    return [JSON_MIMETYPE, MSGPACK_MIMETYPE, *MSGPACK_ALIASES]
+
+
+def dumps_orjson(obj, default, sort_keys=True, indent=False):
+    """JSON bytes through orjson, or None when it is not installed or cannot encode obj"""
+    if orjson is None:
+        return None
+    option = orjson.OPT_SORT_KEYS if sort_keys else 0
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        return orjson.dumps(obj, default=default, option=option)
+    except orjson.JSONEncodeError:
+        # Non-string keys, integers beyond 64 bits: the standard library handles these
+        return None
+
+
+def dumps_msgpack(obj, default):
+    return msgpack.packb(obj, default=default)
+
+
+def compression_encodings():
+    """Content codings this server can produce, preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(body, encoding, gzip_level=1, brotli_quality=4):
+    """Body compressed with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(namespace, version, *parts):
+    """Content-addressed key for a detector input"""
+    digest = hashlib.sha256()
+    digest.update(f"{namespace}\0{version}".encode('utf-8'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(part.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class MemoryCacheBackend:
+    """Per-process LRU store bounded by total value size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value)
+            self.size_bytes += len(value)
+            while self.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheBackend:
+    """SQLite-backed LRU store shared by every process on the host
+
+    Point `path` at a local disk or at /dev/shm to share a warm cache between
+    gunicorn workers. The size cap is enforced every `check_every` writes, so
+    the file can briefly exceed `max_bytes` between checks.
+    """
+
+    def __init__(self, path, max_bytes, check_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+
+    def _connection(self):
+        # One connection per thread, and never reuse one inherited across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, now):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at and expires_at <= now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        return bytes(value)
+
+    def set(self, key, value, expires_at):
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), expires_at, time.time())
+        )
+        self._writes += 1
+        if self._writes % self.check_every == 0:
+            self._enforce_limit(conn)
+
+    def _enforce_limit(self, conn):
+        """Drop expired entries, then least recently used ones, until under the cap"""
+        conn.execute("DELETE FROM entries WHERE expires_at > 0 AND expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            evicted += 1
+            excess -= size
+            if excess <= 0:
+                break
+        self.evictions += evicted
+
+    @property
+    def size_bytes(self):
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class ResultCache:
+    """Caches JSON-serializable detector results with TTL and hit/miss counters"""
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return a fresh copy of the cached result, or None"""
+        value = self.backend.get(key, time.time())
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, result):
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        value = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        self.backend.set(key, value, expires_at)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Counters for the cache stats endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "size_bytes": self.backend.size_bytes,
+            "max_bytes": self.backend.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def create_cache(kind='memory', max_bytes=64 * 1024 * 1024, ttl=3600, path=None):
+    """Build a ResultCache from configuration, or None when caching is off"""
+    if kind in (None, '', 'off', 'none'):
+        return None
+    if kind == 'memory':
+        return ResultCache(MemoryCacheBackend(max_bytes), ttl=ttl)
+    if kind == 'disk':
+        if not path:
+            raise ValueError("Disk cache requires a path")
+        return ResultCache(DiskCacheBackend(path, max_bytes), ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
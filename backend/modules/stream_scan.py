@@ -0,0 +1,240 @@
+import codecs
+
+import numpy as np
+
+from .domain_reputation import iter_domains
+from .fake_news_detector import CREDIBLE_SCORE, MAX_DOMAIN_ADJUSTMENT
+from .metrics import timed
+from .text_analysis import TextAnalysis
+
+WHITESPACE = ' \n\t\r\f\v'
+# Spans reported per detector; enough to show why, bounded for huge inputs
+MAX_SPANS = 50
+
+
+def _last_space(text, low, high):
+    return max(text.rfind(char, low, high) for char in WHITESPACE)
+
+
+def _first_space(text, low, high):
+    found = [index for index in (text.find(char, low, high) for char in WHITESPACE) if index >= 0]
+    return min(found) if found else -1
+
+
+def iter_windows(chunks, window_chars=65536, overlap_chars=512, encoding='utf-8'):
+    """Yield (offset, text, seen_to, last) windows over an iterable of byte chunks
+
+    Windows end and start on whitespace so no token is cut, and each one
+    repeats the last `overlap_chars` characters of the one before, so a
+    phrase up to that long is always whole in some window. `offset` is the
+    character offset of the window in the document and `seen_to` the end
+    of the previous window: anything ending before it was already scanned.
+    Only one window plus one chunk is held in memory at a time.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    buffer = ''
+    offset = 0
+    seen_to = 0
+
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        while len(buffer) >= window_chars:
+            cut = _last_space(buffer, window_chars // 2, window_chars)
+            if cut <= 0:
+                cut = window_chars
+            yield offset, buffer[:cut], seen_to, False
+
+            seen_to = offset + cut
+            start = _first_space(buffer, max(0, cut - overlap_chars), cut)
+            if start < 0:
+                start = max(0, cut - overlap_chars)
+            buffer = buffer[start:]
+            offset += start
+
+    buffer += decoder.decode(b'', final=True)
+    yield offset, buffer, seen_to, True
+
+
+class HateSpeechScan:
+    """Incremental hate speech verdict over the windows of one document
+
+    Keyword hits only ever raise the rule score, so a positive verdict is
+    final as soon as it is reached. With a classifier each window is scored
+    on its own (through the detector's cascade) and the document is hateful
+    if any window is.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.found = {}
+        self.spans = []
+        self.best = None
+
+    def feed(self, offset, text, seen_to):
+        """Scan one window; True once the verdict can no longer change"""
+        with timed('stream.hate'):
+            for term, start, end in self._matches(text):
+                if offset + end <= seen_to:
+                    continue
+                self.found.setdefault(term, None)
+                if len(self.spans) < MAX_SPANS:
+                    self.spans.append({"start": offset + start, "end": offset + end,
+                                       "text": text[start:end], "term": term})
+
+            if self.detector.classifier is None:
+                return self.result()["is_hate_speech"]
+
+            window = self.detector.tiers.run([TextAnalysis(text)])[0]
+            if self.best is None or window["confidence"] > self.best["confidence"]:
+                self.best = window
+            if window["is_hate_speech"] and len(self.spans) < MAX_SPANS:
+                self.spans.append({"start": offset, "end": offset + len(text),
+                                   "confidence": window["confidence"], "tier": window.get("tier")})
+            return self.best["is_hate_speech"]
+
+    def _matches(self, text):
+        """(term, start, end) lexicon matches, tokenizing in bulk and locating only the hits"""
+        matcher = self.detector.matcher
+        if not any(True for _ in matcher.match_tokens(TextAnalysis(text).tokens)):
+            return []
+        # Offsets back into the original text only when there is something to point at
+        return list(matcher.iter_matches(text))
+
+    def result(self):
+        found = list(self.found)
+        if self.detector.classifier is None or self.best is None:
+            confidence = np.array([min(len(found) * 0.25, 1.0)])
+            result = self.detector._results(confidence, confidence > 0.4, [found])[0]
+        else:
+            result = {**self.best, "keywords_found": found}
+        result["spans"] = self.spans
+        return result
+
+
+class FakeNewsScan:
+    """Incremental fake news verdict over the windows of one article
+
+    Keeps only what the heuristic reads (distinct credible sources, scores
+    of distinct cited domains, distinct sensational terms, word count). A verdict is decided early when
+    no combination of terms still to come could move the score across the
+    threshold. The classifier reads the title plus the article's opening
+    (its vectorizer truncates there anyway) and the streamed counts, so it
+    waits for the end of the document. Without a title, the first window
+    stands in for it, as predict() uses the content.
+    """
+
+    def __init__(self, detector, title=''):
+        self.detector = detector
+        self.title = TextAnalysis(title)
+        self.opening = None
+        self.sources = {}
+        self.domains = {}
+        self.sensational = {}
+        self.words = 0
+        self.spans = []
+
+    def feed(self, offset, text, seen_to):
+        with timed('stream.fake'):
+            if self.opening is None:
+                self.opening = TextAnalysis(text)
+                if not self.title.text:
+                    self.title = self.opening
+            lower = text.lower()
+            for terms, seen, kind in ((self.detector.credible_sources, self.sources, "credible_source"),
+                                      (self.detector.fake_indicators, self.sensational, "sensational")):
+                for term in terms:
+                    if term in seen:
+                        continue
+                    start = lower.find(term)
+                    if start >= 0:
+                        seen[term] = None
+                        if len(self.spans) < MAX_SPANS:
+                            self.spans.append({"start": offset + start, "end": offset + start + len(term),
+                                               "text": text[start:start + len(term)], "term": term,
+                                               "kind": kind})
+            for domain, start, end in iter_domains(lower):
+                match = self.detector.domain_index.lookup(domain)
+                if match is None or match["domain"] in self.domains:
+                    continue
+                self.domains[match["domain"]] = match["score"]
+                if len(self.spans) < MAX_SPANS:
+                    self.spans.append({"start": offset + start, "end": offset + end, "text": text[start:end],
+                                       "term": match["domain"], "kind": "domain", "score": match["score"]})
+            # Windows start on whitespace, so the new part splits into whole words
+            self.words += len(text[max(0, seen_to - offset):].split())
+            return self.detector.classifier is None and self._decided()
+
+    def _credibility(self, sources, short, sensational, domains):
+        # Same operation order as analyze_heuristic, so scores on the threshold round alike
+        score = sum(0.2 for _ in range(sources))
+        score += domains
+        if short:
+            score -= 0.2
+        score -= sensational * 0.1
+        return max(0, min(1, 0.5 + score))
+
+    def _fake_probability(self, credibility):
+        return min(self.detector.check_clickbait(self.title) * 0.15 + (1 - credibility), 1.0)
+
+    def _decided(self):
+        """Whether every possible rest of the article leaves the verdict unchanged"""
+        short = self.words < 50
+        # Domains still to come could move the adjustment anywhere in its range
+        most_credible = self._credibility(len(self.detector.credible_sources), 0, len(self.sensational),
+                                          MAX_DOMAIN_ADJUSTMENT)
+        least_credible = self._credibility(len(self.sources), short, len(self.detector.fake_indicators),
+                                           -MAX_DOMAIN_ADJUSTMENT)
+        return self._fake_probability(most_credible) > 0.6 or self._fake_probability(least_credible) <= 0.6
+
+    def result(self):
+        clickbait = np.array([self.detector.check_clickbait(self.title)])
+        short = self.words < 50
+        if self.detector.classifier is not None:
+            # Same features as heuristic_features, from the streamed counts
+            features = self.detector.heuristic_features(self.title, TextAnalysis(''))[:3] + [
+                len(self.sources) + sum(1 for score in self.domains.values() if score >= CREDIBLE_SCORE),
+                float(short), len(self.sensational)
+            ]
+            opening = self.opening.text if self.opening is not None else ''
+            with timed('fake.model'):
+                fake_probability = self.detector.classifier.predict_proba(
+                    [f"{self.title.text}\n{opening}"], [features])
+            result = self.detector._results(fake_probability, 1 - fake_probability,
+                                            fake_probability >= self.detector.classifier.threshold,
+                                            clickbait)[0]
+        else:
+            credibility = np.array([
+                self._credibility(len(self.sources), short, len(self.sensational),
+                                  self.detector.domain_adjustment(self.domains.values())) if self.words else 0.5
+            ])
+            fake_probability = np.minimum(clickbait * 0.15 + (1 - credibility), 1.0)
+            result = self.detector._results(fake_probability, credibility, fake_probability > 0.6,
+                                            clickbait)[0]
+        result["spans"] = self.spans
+        return result
+
+
+def scan_stream(chunks, scans, window_chars=65536, overlap_chars=512, early_exit=True):
+    """Feed a document's windows to every scan, stopping once all verdicts are decided
+
+    Returns (results by scan name, stats); the rest of the input is not read
+    after an early exit.
+    """
+    stats = {"bytes_read": 0, "chars_scanned": 0, "windows": 0, "complete": False}
+
+    def counted(chunks):
+        for chunk in chunks:
+            stats["bytes_read"] += len(chunk)
+            yield chunk
+
+    for offset, text, seen_to, last in iter_windows(counted(chunks), window_chars, overlap_chars):
+        decided = [scan.feed(offset, text, seen_to) for scan in scans.values()]
+        stats["windows"] += 1
+        stats["chars_scanned"] = offset + len(text)
+        if last:
+            stats["complete"] = True
+        elif early_exit and all(decided):
+            break
+
+    stats["early_exit"] = not stats["complete"]
+    return {name: scan.result() for name, scan in scans.items()}, stats
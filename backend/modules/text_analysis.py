@@ -0,0 +1,48 @@
+from functools import cached_property
+
+from .domain_reputation import extract_domains
+from .lexicon_matcher import TOKEN_PATTERN
+from .text_normalizer import CLEAN_NORMALIZER, MATCH_NORMALIZER
+
+
+class TextAnalysis:
+    """Normalized views of one input text, computed once and shared by detectors
+
+    Each view is built on first access, so a detector only pays for what it
+    reads and every later reader gets the cached value.
+    """
+
+    def __init__(self, text):
+        self.text = text or ''
+
+    def __bool__(self):
+        return bool(self.text.strip())
+
+    @cached_property
+    def lower(self):
+        return self.text.lower()
+
+    @cached_property
+    def normalized(self):
+        """Case-folded text with URLs and mentions removed and obfuscation undone"""
+        return MATCH_NORMALIZER.normalize(self.text)
+
+    @cached_property
+    def tokens(self):
+        """Normalized word tokens, as used by the lexicon matcher"""
+        return TOKEN_PATTERN.findall(self.normalized)
+
+    @cached_property
+    def words(self):
+        """Whitespace-separated words with original case and punctuation"""
+        return self.text.split()
+
+    @cached_property
+    def clean(self):
+        """Normalized text without URLs, mentions, hashtags or punctuation"""
+        return CLEAN_NORMALIZER.normalize(self.text).strip()
+
+    @cached_property
+    def domains(self):
+        """Distinct host names cited in the text, from URLs and bare domains"""
+        return extract_domains(self.lower)
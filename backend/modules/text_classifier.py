@@ -0,0 +1,342 @@
+import hashlib
+import json
+
+import numpy as np
+
+# Odd multipliers that spread n-gram hashes over the feature space
+INDEX_MIX = np.uint32(0x9E3779B1)
+SIGN_MIX = np.uint32(0x85EBCA6B)
+NGRAM_MIX = np.uint64(0x100000001B3)
+# Base of the polynomial byte hash and its inverse modulo 2**64
+HASH_BASE = 0x100000001B3
+HASH_BASE_INVERSE = pow(HASH_BASE, -1, 1 << 64)
+
+NEWLINE = ord('\n')
+# Bytes that make up word tokens: ASCII letters, digits, underscore and
+# every byte of a multi-byte UTF-8 character
+WORD_BYTES = np.zeros(256, dtype=bool)
+WORD_BYTES[[ord(c) for c in '0123456789_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ']] = True
+WORD_BYTES[128:] = True
+
+
+_power_tables = {}
+
+
+def _lowercase_spaces(text):
+    return ' '.join(text.lower().split())
+
+
+# Text normalizations a vectorizer can apply before hashing, by the name
+# recorded in its config. They belong to the model's features: changing one
+# in place would silently mismatch every trained weight, so a new one gets
+# a new name
+NORMALIZATIONS = {
+    'lowercase-spaces': _lowercase_spaces
+}
+
+
+def _powers(base, count):
+    """base**0 .. base**(count - 1) modulo 2**64, from a table grown as needed"""
+    table = _power_tables.get(base)
+    if table is None or len(table) < count:
+        size = max(count, 2 * len(table) if table is not None else 1 << 16)
+        table = np.full(size, base, dtype=np.uint64)
+        table[0] = 1
+        table = np.cumprod(table, dtype=np.uint64)
+        _power_tables[base] = table
+    return table[:count]
+
+
+def _prefix_hashes(data):
+    """Prefix sums of byte * base**position, so any span hashes in O(1)"""
+    prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+    np.cumsum(data * _powers(HASH_BASE, len(data)), out=prefix[1:])
+    return prefix, _powers(HASH_BASE_INVERSE, len(data) + 1)
+
+
+def _fold(hashes):
+    """Fold 64-bit hashes to 32 bits"""
+    return ((hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xffffffff)).astype(np.uint32)
+
+
+def _span_hashes(prefix, inverse_powers, starts, ends):
+    """Position-independent hash of each data[start:end] span"""
+    return _fold((prefix[ends] - prefix[starts]) * inverse_powers[starts])
+
+
+class SparseMatrix:
+    """Sparse matrix of (row, column, value) entries backed by NumPy arrays
+
+    Products with dense vectors are single bincount passes, so scoring a
+    batch never touches a Python loop. Entries may repeat a (row, column)
+    pair; repeats add up like counts. Row slices, needed for mini-batch
+    training, go through a CSR view built on first use.
+    """
+
+    def __init__(self, rows, columns, values, shape):
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.shape = shape
+        self._csr = None
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    def dot(self, vector):
+        """Matrix-vector product, one value per row"""
+        return np.bincount(self.rows, weights=self.values * vector[self.columns], minlength=self.shape[0])
+
+    def transpose_dot(self, vector):
+        """Transposed product, one value per column (the gradient of a linear model)"""
+        return np.bincount(self.columns, weights=self.values * vector[self.rows], minlength=self.shape[1])
+
+    def _to_csr(self):
+        if self._csr is None:
+            order = np.argsort(self.rows, kind='stable')
+            indptr = np.zeros(self.shape[0] + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.rows, minlength=self.shape[0]), out=indptr[1:])
+            self._csr = (indptr, self.columns[order], self.values[order])
+        return self._csr
+
+    def take(self, rows):
+        """New matrix with the given rows, in the given order"""
+        indptr, columns, values = self._to_csr()
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = indptr[rows + 1] - indptr[rows]
+        starts = np.zeros(len(rows), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        positions = np.repeat(indptr[rows] - starts, lengths) + np.arange(lengths.sum())
+        new_rows = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+        return SparseMatrix(new_rows, columns[positions], values[positions], (len(rows), self.shape[1]))
+
+
+class HashingVectorizer:
+    """Character and word n-grams hashed into a fixed-size feature space
+
+    Nothing is learned or stored, so two processes with the same settings
+    map a text to the same columns. Each hashed n-gram adds +1 or -1 (a
+    second hash picks the sign, so collisions tend to cancel), and rows are
+    scaled by 1/sqrt(n-gram count) to keep long texts comparable with short
+    ones. Optional dense features go in extra columns after the hashed ones.
+    """
+
+    def __init__(self, n_features_bits=20, char_ngrams=(3, 5), word_ngrams=(1, 2),
+                 max_chars=None, extra_features=0, normalization='lowercase-spaces'):
+        if not 1 <= char_ngrams[0] <= char_ngrams[1] <= 8:
+            raise ValueError("Character n-grams must be between 1 and 8 bytes")
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown text normalization {normalization}")
+        self.n_features_bits = n_features_bits
+        self.char_ngrams = tuple(char_ngrams)
+        self.word_ngrams = tuple(word_ngrams)
+        self.max_chars = max_chars
+        self.extra_features = extra_features
+        # Models saved before the setting was recorded used this one
+        self.normalization = normalization
+        self._normalize = NORMALIZATIONS[normalization]
+
+    @property
+    def n_hashed(self):
+        return 1 << self.n_features_bits
+
+    @property
+    def n_features(self):
+        return self.n_hashed + self.extra_features
+
+    def config(self):
+        return {
+            "n_features_bits": self.n_features_bits,
+            "char_ngrams": list(self.char_ngrams),
+            "word_ngrams": list(self.word_ngrams),
+            "max_chars": self.max_chars,
+            "extra_features": self.extra_features,
+            "normalization": self.normalization
+        }
+
+    def _columns(self, hashes, salt):
+        """Feature column and +/-1 sign for each uint32 n-gram hash"""
+        salted = hashes ^ np.uint32(salt)
+        columns = (salted * INDEX_MIX) >> np.uint32(32 - self.n_features_bits)
+        signs = ((salted * SIGN_MIX) >> np.uint32(31)).astype(np.float64) * 2 - 1
+        return columns.astype(np.int64), signs
+
+    def _char_features(self, data, separators):
+        # N-grams of up to 8 bytes are packed into one integer exactly, so
+        # growing them is a shift and an OR per position
+        grams = data.astype(np.uint64)
+        clean = data != NEWLINE
+        rows, columns, signs = [], [], []
+        for n in range(1, self.char_ngrams[1] + 1):
+            if n > 1:
+                grams = (grams[:-1] << np.uint64(8)) | data[n - 1:]
+                # Windows that would reach across the separator between two texts
+                clean = clean[:-1] & (data[n - 1:] != NEWLINE)
+            if n < self.char_ngrams[0]:
+                continue
+            starts = np.flatnonzero(clean)
+            rows.append(separators[starts])
+            column, sign = self._columns(_fold(grams[starts]), n)
+            columns.append(column)
+            signs.append(sign)
+        return rows, columns, signs
+
+    def _word_features(self, data, prefix, inverse_powers, separators):
+        # Tokens are runs of word bytes, like TOKEN_PATTERN on ASCII text
+        word = WORD_BYTES[data].view(np.int8)
+        edges = np.diff(np.concatenate([[0], word, [0]]))
+        token_starts = np.flatnonzero(edges == 1)
+        token_ends = np.flatnonzero(edges == -1)
+        hashes = _span_hashes(prefix, inverse_powers, token_starts, token_ends).astype(np.uint64)
+        token_rows = separators[token_starts]
+
+        rows, columns, signs = [], [], []
+        for n in range(self.word_ngrams[0], self.word_ngrams[1] + 1):
+            if len(hashes) < n:
+                break
+            # Combine n consecutive token hashes, keeping only runs inside one text
+            combined = hashes[:len(hashes) - n + 1].copy()
+            for offset in range(1, n):
+                combined = combined * NGRAM_MIX + hashes[offset:len(hashes) - n + 1 + offset]
+            same_text = token_rows[:len(combined)] == token_rows[n - 1:]
+            rows.append(token_rows[:len(combined)][same_text])
+            column, sign = self._columns(_fold(combined[same_text]), 100 + n)
+            columns.append(column)
+            signs.append(sign)
+        return rows, columns, signs
+
+    def transform(self, texts, extra=None):
+        """SparseMatrix with one row per text"""
+        if self.max_chars:
+            texts = [text[:self.max_chars] for text in texts]
+        # One byte buffer for the whole batch: " text " blocks split by newlines,
+        # so word boundaries are part of the character n-grams
+        joined = '\n'.join(f" {self._normalize(text)} " for text in texts)
+        data = np.frombuffer(joined.encode('utf-8', 'surrogatepass'), dtype=np.uint8)
+        prefix, inverse_powers = _prefix_hashes(data)
+        # Row of each byte position (and one past the end)
+        separators = np.concatenate([[0], np.cumsum(data == NEWLINE)])
+
+        char_rows, char_columns, char_signs = self._char_features(data, separators)
+        word_rows, word_columns, word_signs = self._word_features(data, prefix, inverse_powers, separators)
+        rows = np.concatenate(char_rows + word_rows)
+        columns = np.concatenate(char_columns + word_columns)
+        values = np.concatenate(char_signs + word_signs)
+
+        ngram_counts = np.bincount(rows, minlength=len(texts))
+        values *= 1 / np.sqrt(np.maximum(ngram_counts, 1))[rows]
+
+        if self.extra_features:
+            extra = np.asarray(extra, dtype=np.float64).reshape(len(texts), self.extra_features)
+            rows = np.concatenate([rows, np.repeat(np.arange(len(texts)), self.extra_features)])
+            columns = np.concatenate([columns, np.tile(np.arange(self.n_hashed, self.n_features), len(texts))])
+            values = np.concatenate([values, extra.ravel()])
+
+        return SparseMatrix(rows, columns, values, (len(texts), self.n_features))
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -35, 35)))
+
+
+class TextClassifier:
+    """Logistic regression over hashed n-gram features
+
+    Trained offline with mini-batch SGD (see train_models.py) and saved as a
+    small .npz file of weights plus vectorizer settings.
+    """
+
+    def __init__(self, vectorizer=None, weights=None, bias=0.0, threshold=0.5):
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.weights = weights if weights is not None else np.zeros(self.vectorizer.n_features)
+        self.bias = bias
+        # Hashing megabytes of weights is far slower than a prediction, so it
+        # is done once here and again only when fit() replaces them
+        self._weights_digest = self._digest_weights()
+        # Probability at or above which a text is labeled positive
+        self.threshold = threshold
+
+    def _digest_weights(self):
+        return hashlib.sha1(np.ascontiguousarray(self.weights).tobytes()).digest()
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @threshold.setter
+    def threshold(self, value):
+        self._threshold = value
+        self._refresh_version()
+
+    def _refresh_version(self):
+        digest = hashlib.sha1(self._weights_digest)
+        digest.update(repr((self.bias, self.threshold, self.vectorizer.config())).encode('utf-8'))
+        # Fingerprint of the weights and settings, for cache keys
+        self.version = digest.hexdigest()[:12]
+
+    def decision_function(self, texts, extra=None):
+        features = self.vectorizer.transform(texts, extra)
+        return features.dot(self.weights) + self.bias
+
+    def predict_proba(self, texts, extra=None):
+        """Positive-class probability for each text"""
+        return _sigmoid(self.decision_function(texts, extra))
+
+    def fit(self, texts, labels, extra=None, epochs=5, learning_rate=0.5, l2=1e-6,
+            batch_size=256, seed=0):
+        """Train with mini-batch SGD on log loss, weighting classes to balance them"""
+        features = self.vectorizer.transform(texts, extra)
+        labels = np.asarray(labels, dtype=np.float64)
+        positives = labels.mean()
+        if positives in (0.0, 1.0):
+            raise ValueError("Training data needs both classes")
+        sample_weights = np.where(labels == 1, 0.5 / positives, 0.5 / (1 - positives))
+
+        weights = np.zeros(self.vectorizer.n_features)
+        bias = 0.0
+        rng = np.random.default_rng(seed)
+        for epoch in range(epochs):
+            rate = learning_rate / np.sqrt(epoch + 1)
+            order = rng.permutation(len(labels))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                rows = features.take(batch)
+                errors = (_sigmoid(rows.dot(weights) + bias) - labels[batch]) * sample_weights[batch]
+                weights *= 1 - rate * l2
+                weights -= rate * rows.transpose_dot(errors) / len(batch)
+                bias -= rate * errors.mean()
+
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self._weights_digest = self._digest_weights()
+        self._refresh_version()
+        return self
+
+    def config(self, **metadata):
+        return {
+            "vectorizer": self.vectorizer.config(),
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "metadata": metadata
+        }
+
+    def save(self, path, **metadata):
+        """Write weights and settings to an .npz file"""
+        with open(path, 'wb') as f:
+            np.savez(f, weights=self.weights, config=np.array(json.dumps(self.config(**metadata))))
+
+    @classmethod
+    def from_config(cls, config, weights):
+        """Classifier from config() output and a weight array, which is used as is (e.g. memory-mapped)"""
+        classifier = cls(HashingVectorizer(**config['vectorizer']), weights,
+                         config['bias'], config['threshold'])
+        classifier.metadata = config.get('metadata', {})
+        return classifier
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            config = json.loads(str(data['config']))
+            weights = data['weights']
+        return cls.from_config(config, weights)
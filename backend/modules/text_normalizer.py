@@ -0,0 +1,281 @@
+import re
+import unicodedata
+
+# Lookalike letters from other scripts, after case folding
+CONFUSABLES = {
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd',
+    'һ': 'h', 'ӏ': 'l', 'ԛ': 'q', 'ԝ': 'w',
+    # Greek
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p',
+    'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w',
+    # Latin letters NFKD leaves alone
+    'ı': 'i', 'ł': 'l', 'ø': 'o', 'đ': 'd', 'ħ': 'h', 'ŧ': 't', 'æ': 'ae', 'œ': 'oe', 'ɡ': 'g', 'ɑ': 'a'
+}
+
+# Digits and symbols read as letters inside otherwise alphabetic tokens
+LEET = {'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+        '@': 'a', '$': 's', '!': 'i', '|': 'l', '+': 't'}
+LEET_TABLE = str.maketrans(LEET)
+LEET_SYMBOLS = '@$|!+'
+# Characters that join single letters into an obfuscated word: s.t.u.p.i.d, k i l l
+SEPARATORS = ' .-_*~'
+
+# Cached folds per code point; beyond this many distinct characters they are
+# computed on every call instead, so adversarial input cannot grow the table
+MAX_CACHED_CHARS = 65536
+
+
+class _FoldTable(dict):
+    """str.translate table, filled in as characters are first seen
+
+    Each character is NFKD-decomposed, loses combining marks, is case folded
+    and then mapped through CONFUSABLES; invisible format characters (zero
+    width spaces and joiners, soft hyphens) are dropped.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if unicodedata.category(char) == 'Cf':
+            folded = ''
+        else:
+            decomposed = unicodedata.normalize('NFKD', char)
+            folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+            folded = ''.join(CONFUSABLES.get(c, c) for c in folded)
+        if len(self) < MAX_CACHED_CHARS:
+            self[codepoint] = folded
+        return folded
+
+
+class _PunctuationTable(dict):
+    """str.translate table replacing every character that is neither word nor space
+
+    ASCII is filled in up front with None for deletion, which keeps
+    str.translate on its ASCII fast path.
+    """
+
+    def __init__(self, replacement):
+        super().__init__()
+        self.replacement = replacement or None
+        for codepoint in range(128):
+            self[codepoint] = self._value(chr(codepoint))
+
+    def _value(self, char):
+        return char if char.isalnum() or char == '_' or char.isspace() else self.replacement
+
+    def __missing__(self, codepoint):
+        value = self._value(chr(codepoint))
+        if len(self) < MAX_CACHED_CHARS:
+            self[codepoint] = value
+        return value
+
+
+_FOLD = _FoldTable()
+for _code in range(128):
+    _FOLD[_code] = chr(_code).lower()
+
+# URLs, mentions and hashtags, each with a literal prefix that is checked for
+# before its pattern runs. The lookbehinds sit after the '@'/'#' so the
+# pattern still starts with a literal: name@example.com and c# are left alone.
+_STRIP = (
+    ('http', re.compile(r'https?://\S+')),
+    ('www.', re.compile(r'www\.\S+')),
+    ('@', re.compile(r'@(?<!\w@)\w+')),
+    ('#', re.compile(r'#(?<!\w#)(\w+)')),
+)
+
+# Every character that can start a leetspeak or separator rewrite, except
+# spaces, becomes one marker in a same-length copy of the text. A scan for a
+# single literal character is several times faster than one for a character
+# class, and plain prose has few markers.
+_MARKED = '@#0123456789' + LEET_SYMBOLS + SEPARATORS[1:]
+_SHAPE = str.maketrans({char: '\0' for char in _MARKED})
+# ASCII text takes the bytes route, whose translate is a plain table lookup
+_SHAPE_BYTES = bytes(0 if chr(code) in _MARKED else code for code in range(256))
+# (\0\0* rather than \0+, which the regex engine does not treat as a literal prefix)
+_MARKER_RUN = re.compile(r'\0\0*(?=\w)')
+_MARKER_RUN_BYTES = re.compile(rb'\0\0*(?=\w)')
+# Spaces get their own literal scan: a one-character word, a space, another
+_SPACED_BY_SPACE = re.compile(r' \w \w(?: \w)*(?!\w)')
+_SPACED = {sep: re.compile(rf'{re.escape(sep)}\w(?:{re.escape(sep)}\w)+(?!\w)') for sep in SEPARATORS}
+_LEET_RUN = re.compile(rf'[{re.escape(LEET_SYMBOLS)}0-9]+')
+_TOKEN_REST = re.compile(rf'[\w{re.escape(LEET_SYMBOLS)}]*')
+
+
+def _is_word(text, index):
+    return 0 <= index < len(text) and (text[index].isalnum() or text[index] == '_')
+
+
+def _is_token_char(char):
+    return char.isalnum() or char == '_' or char in LEET_SYMBOLS
+
+
+class TextNormalizer:
+    """Folds text for matching: case, Unicode lookalikes and common obfuscation
+
+    A translate table handles case folding, compatibility forms (full-width
+    letters, ligatures), accents, invisible characters and lookalike letters
+    from other scripts. URLs, mentions and hashtags are stripped, then
+    separator-spaced letters (s.t.u.p.i.d, k i l l) and leetspeak (1d10t,
+    h4te, $hit) are rewritten at the few sites a marker scan finds; a
+    pattern only runs when the text holds its prefix. `normalize_with_offsets`
+    gives the same text plus, per character, its index in the original.
+    """
+
+    def __init__(self, strip_hashtags=False, punctuation=None):
+        # Hashtags are removed entirely when set, otherwise only the '#' goes
+        self.strip_hashtags = strip_hashtags
+        # None keeps punctuation, '' deletes it, ' ' turns it into a space
+        self.punctuation = punctuation
+        self._punctuation_table = _PunctuationTable(punctuation) if punctuation is not None else None
+        self._strip = [(prefix, pattern, r'\1' if prefix == '#' and not strip_hashtags else '')
+                       for prefix, pattern in _STRIP]
+
+    def _strip_edits(self, text, pattern, template):
+        for match in pattern.finditer(text):
+            if template:
+                yield match.start(), match.end(), match.group(1), range(*match.span(1))
+            else:
+                yield match.start(), match.end(), '', ()
+
+    def _edits(self, folded):
+        """Yield (start, end, replacement, sources) leetspeak and separator rewrites, in order
+
+        `sources` gives the index in `folded` of each replacement character.
+        """
+        if folded.isascii():
+            shape, marker_run = folded.encode('ascii').translate(_SHAPE_BYTES), _MARKER_RUN_BYTES
+        else:
+            shape, marker_run = folded.translate(_SHAPE), _MARKER_RUN
+        # Most texts have no site at all, and search() is cheaper to rule that out
+        sites = [m.span() for m in marker_run.finditer(shape)] if marker_run.search(shape) else []
+        if _SPACED_BY_SPACE.search(folded):
+            sites = sorted(sites + [m.span() for m in _SPACED_BY_SPACE.finditer(folded)])
+        if not sites:
+            return
+        last = 0
+        for start, end in sites:
+            if start < last:
+                continue
+            lead = folded[start]
+            if lead in SEPARATORS and (end == start + 1 or lead == ' '):
+                edit = self._spaced(folded, start, last)
+            elif lead != '#':
+                edit = self._leet(folded, start, last)
+            else:
+                # c#: part of a word rather than a hashtag
+                edit = None
+            if edit is not None:
+                yield edit
+                last = edit[1]
+
+    def _spaced(self, folded, start, last):
+        """Rewrite of single characters joined by one repeated separator, starting at `start`"""
+        match = _SPACED[folded[start]].match(folded, start)
+        if match is None:
+            return None
+        end = match.end()
+        sources = list(range(start + 1, end, 2))
+        if start - 1 >= last and _is_word(folded, start - 1) and not _is_word(folded, start - 2):
+            # The run began with a one-character word before the first separator
+            sources.insert(0, start - 1)
+            start -= 1
+        elif len(sources) < 3:
+            return None
+        else:
+            start += 1
+        return start, end, ''.join(folded[i] for i in sources), sources
+
+    def _leet(self, folded, start, last):
+        """Rewrite of the token holding a digit/symbol run that precedes a letter, if it is leetspeak"""
+        run = _LEET_RUN.match(folded, start)
+        if run is None:
+            return None
+        if not ('a' <= folded[start - 1:start] <= 'z') and run.group().strip('$'):
+            # Leading digits and punctuation (4chan, 1st, !important) stay; a leading $ is an s
+            return None
+        token_start = start
+        while token_start > last and _is_token_char(folded[token_start - 1]):
+            token_start -= 1
+        token_end = _TOKEN_REST.match(folded, run.end()).end()
+        # Trailing symbols are punctuation (stupid!), not letters
+        while token_end > start and folded[token_end - 1] in LEET_SYMBOLS:
+            token_end -= 1
+        token = folded[token_start:token_end]
+        if '@' in token and folded[token_end:token_end + 1] == '.':
+            # name@example.com
+            return None
+        return token_start, token_end, token.translate(LEET_TABLE), range(token_start, token_end)
+
+    def normalize(self, text):
+        folded = text.lower() if text.isascii() else text.translate(_FOLD)
+        for prefix, pattern, template in self._strip:
+            if prefix in folded:
+                folded = pattern.sub(template, folded)
+        folded = _apply(folded, None, self._edits(folded))[0]
+        if self._punctuation_table is not None:
+            folded = folded.translate(self._punctuation_table)
+        return folded
+
+    def normalize_with_offsets(self, text):
+        """Normalized text and, per output character, its index in `text`
+
+        The offsets list has one extra entry, len(text), so a span
+        [start, end) of the output maps back to [offsets[start], offsets[end - 1] + 1).
+        """
+        if text.isascii():
+            folded = text.lower()
+            origins = list(range(len(text)))
+        else:
+            pieces = []
+            origins = []
+            for index, char in enumerate(text):
+                mapped = char.translate(_FOLD)
+                pieces.append(mapped)
+                origins.extend([index] * len(mapped))
+            folded = ''.join(pieces)
+
+        # Same steps as normalize, carrying the origin of every character along
+        for prefix, pattern, template in self._strip:
+            if prefix in folded:
+                folded, origins = _apply(folded, origins, self._strip_edits(folded, pattern, template))
+        folded, origins = _apply(folded, origins, self._edits(folded))
+
+        if self._punctuation_table is not None:
+            kept = []
+            kept_origins = []
+            for char, origin in zip(folded, origins):
+                mapped = char.translate(self._punctuation_table)
+                kept.append(mapped)
+                kept_origins.extend([origin] * len(mapped))
+            folded, origins = ''.join(kept), kept_origins
+
+        origins.append(len(text))
+        return folded, origins
+
+
+def _apply(text, origins, edits):
+    """Apply ordered, non-overlapping edits to text, and to its origins list unless None"""
+    pieces = []
+    new_origins = [] if origins is not None else None
+    last = 0
+    for start, end, replacement, sources in edits:
+        pieces.append(text[last:start])
+        pieces.append(replacement)
+        if origins is not None:
+            new_origins.extend(origins[last:start])
+            new_origins.extend(origins[i] for i in sources)
+        last = end
+    if not last:
+        return text, origins
+    pieces.append(text[last:])
+    if origins is not None:
+        new_origins.extend(origins[last:])
+    return ''.join(pieces), new_origins
+
+
+# Shared instances: matching keeps hashtag words and punctuation (tokens split
+# on it), cleaning reproduces the old preprocess_text output
+MATCH_NORMALIZER = TextNormalizer()
+CLEAN_NORMALIZER = TextNormalizer(strip_hashtags=True, punctuation='')
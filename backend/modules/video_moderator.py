@@ -0,0 +1,342 @@
+import contextvars
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import cv2
+import numpy as np
+
+from .metrics import REGISTRY, timed
+
+VIDEO_FRAMES = REGISTRY.counter(
+    'moderation_video_frames_total', 'Frames of GIFs and videos by what was done with them', ['outcome']
+)
+
+# Frames are compared as 32x32 grayscale thumbnails; a difference is the
+# mean absolute change in gray levels (0-255)
+SIGNATURE_SIZE = (32, 32)
+GIF_MAGIC = (b'GIF87a', b'GIF89a')
+# Per-image notes that say nothing about why a frame was flagged
+NEUTRAL_WARNINGS = frozenset(("Image appears safe", "No text found in image"))
+
+
+def frame_signature(frame):
+    """Tiny grayscale thumbnail of a BGR frame, for cheap frame-to-frame comparison"""
+    small = cv2.resize(frame, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def frame_difference(a, b):
+    """Mean absolute gray-level change between two signatures"""
+    return float(np.mean(np.abs(a - b)))
+
+
+def frame_warnings(result):
+    return [warning for warning in result.get("warnings", []) if warning not in NEUTRAL_WARNINGS]
+
+
+class BufferedStream(io.BufferedIOBase):
+    """Presents any readable, seekable file-like object (e.g. a SpooledTemporaryFile) as
+    the io.BufferedIOBase that OpenCV's stream reader accepts"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._raw.read(size)
+
+    def read1(self, size=-1):
+        return self._raw.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._raw.seek(offset, whence)
+
+    def tell(self):
+        return self._raw.tell()
+
+
+def as_stream(source):
+    """A path, or a stream OpenCV can read from, for bytes and file-like sources"""
+    if isinstance(source, (str, os.PathLike, io.BufferedIOBase)):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return BufferedStream(source)
+
+
+def is_animated_gif(data):
+    """Whether bytes hold a GIF with more than one frame"""
+    if data[:6] not in GIF_MAGIC:
+        return False
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return bool(getattr(image, 'is_animated', False))
+    except Exception:
+        return False
+
+
+class VideoModerator:
+    """Moderates animated GIFs and short videos frame by frame
+
+    Frames are decoded one at a time from the upload stream, sampled at an
+    interval that widens while the picture stays the same and narrows after
+    a scene change, and compared to the last analyzed frame so that
+    near-identical ones are skipped. The distinct frames go through the
+    image moderator, in parallel when given an executor, and decoding stops
+    as soon as one of them is confidently unsafe.
+    """
+
+    def __init__(self, image_moderator, sample_interval=0.5, min_interval=0.1, max_interval=2.0,
+                 duplicate_threshold=3.0, scene_change_threshold=30.0, max_frames=64,
+                 max_duration=600.0, stop_confidence=0.8, max_in_flight=4):
+        self.image_moderator = image_moderator
+        # Seconds between sampled frames, adapted within [min_interval, max_interval]
+        self.sample_interval = sample_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # Below this difference a sampled frame repeats the last analyzed one;
+        # above scene_change_threshold sampling drops to min_interval
+        self.duplicate_threshold = duplicate_threshold
+        self.scene_change_threshold = scene_change_threshold
+        # Upper bounds on frames analyzed and seconds of media read
+        self.max_frames = max_frames
+        self.max_duration = max_duration
+        # An unsafe frame at or above this confidence settles the whole clip
+        self.stop_confidence = stop_confidence
+        # Frames analyzed at once when given an executor
+        self.max_in_flight = max_in_flight
+
+    def open(self, source):
+        """VideoCapture over a path or an as_stream() stream
+
+        OpenCV does not hold a reference to the stream, so the caller must
+        keep it alive until the capture is released.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            capture = cv2.VideoCapture(os.fspath(source))
+        else:
+            try:
+                # OpenCV 4.10+ reads straight from the stream, nothing is buffered whole
+                capture = cv2.VideoCapture(source, cv2.CAP_FFMPEG, [])
+            except (TypeError, cv2.error):
+                capture = self._open_spooled(source)
+        if not capture.isOpened():
+            raise ValueError("Could not decode video")
+        return capture
+
+    def _open_spooled(self, stream):
+        # Older OpenCV only opens files: copy the stream to a temporary file in chunks
+        with tempfile.NamedTemporaryFile(suffix='.media', delete=False) as f:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+        try:
+            return cv2.VideoCapture(f.name)
+        finally:
+            # The capture keeps its descriptor open; the name is no longer needed
+            os.unlink(f.name)
+
+    def distinct_frames(self, capture, stats, deadline=None, stop=None):
+        """Yield (frame index, timestamp in seconds, BGR frame) for sampled, non-duplicate frames
+
+        Reading ends early when the `stop` event is set.
+        """
+        interval = self.sample_interval
+        next_sample = 0.0
+        previous = None
+        index = -1
+        while True:
+            if stop is not None and stop.is_set():
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                stats["truncated"] = True
+                return
+            # grab() demuxes and decodes; only sampled frames pay for the BGR conversion
+            with timed('video.decode'):
+                if not capture.grab():
+                    return
+            index += 1
+            stats["decoded"] += 1
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            stats["position"] = timestamp
+            if timestamp > self.max_duration:
+                stats["truncated"] = True
+                return
+            if timestamp < next_sample:
+                continue
+
+            with timed('video.decode'):
+                ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            stats["sampled"] += 1
+            with timed('video.dedup'):
+                signature = frame_signature(frame)
+                change = 255.0 if previous is None else frame_difference(signature, previous)
+
+            if change < self.duplicate_threshold:
+                stats["duplicates"] += 1
+                # Nothing is moving: look less often
+                interval = min(interval * 2, self.max_interval)
+            else:
+                previous = signature
+                interval = self.min_interval if change >= self.scene_change_threshold else self.sample_interval
+                yield index, timestamp, frame
+            next_sample = timestamp + interval
+
+    def settles(self, result):
+        """Whether a frame result is unsafe with enough confidence to stop reading"""
+        return not result.get("is_safe", True) and result.get("confidence", 0.0) >= self.stop_confidence
+
+    def analyze(self, source, executor=None, ocr_timeout=0, timeout=None):
+        """Moderate a GIF or video from a path, bytes or a seekable file-like object"""
+        # Held here for as long as the capture reads from it
+        source = as_stream(source)
+        try:
+            capture = self.open(source)
+        except Exception as e:
+            return {"error": str(e), "is_safe": True, "confidence": 0.0}
+
+        deadline = time.monotonic() + timeout if timeout else None
+        stats = {"decoded": 0, "sampled": 0, "duplicates": 0, "analyzed": 0, "position": 0.0, "truncated": False}
+        frames = []
+        pending = {}
+        # Set by whichever frame settles the clip; decoding checks it before every frame
+        settled = threading.Event()
+
+        def on_done(future):
+            if not future.cancelled() and self.settles(future.result()):
+                settled.set()
+
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+            for index, timestamp, frame in self.distinct_frames(capture, stats, deadline, settled):
+                if stats["analyzed"] >= self.max_frames:
+                    stats["truncated"] = True
+                    break
+                stats["analyzed"] += 1
+                if executor is None:
+                    result = self._analyze_frame(frame, ocr_timeout, deadline)
+                    frames.append((index, timestamp, result))
+                    if self.settles(result):
+                        settled.set()
+                    continue
+
+                future = executor.submit(contextvars.copy_context().run,
+                                         self._analyze_frame, frame, ocr_timeout, deadline)
+                pending[future] = (index, timestamp)
+                future.add_done_callback(on_done)
+                # Keep decoding while frames are analyzed; block only when the window is full
+                if len(pending) >= self.max_in_flight:
+                    self._collect(wait(pending, return_when=FIRST_COMPLETED).done, pending, frames)
+
+            if pending and not settled.is_set():
+                self._collect(wait(pending, timeout=self._remaining(deadline)).done, pending, frames)
+            if pending:
+                # Settled early or out of time: frames still waiting are not worth analyzing
+                self._collect([future for future in pending if future.done()], pending, frames)
+                for future in pending:
+                    future.cancel()
+                stats["truncated"] = stats["truncated"] or not settled.is_set()
+        finally:
+            capture.release()
+
+        VIDEO_FRAMES.labels('decoded').inc(stats["decoded"])
+        VIDEO_FRAMES.labels('duplicate').inc(stats["duplicates"])
+        VIDEO_FRAMES.labels('analyzed').inc(len(frames))
+        return self._result(frames, stats, settled.is_set(), fps, (width, height))
+
+    def _collect(self, done, pending, frames):
+        """Move finished futures from pending into frames"""
+        for future in done:
+            index, timestamp = pending.pop(future)
+            if not future.cancelled():
+                frames.append((index, timestamp, future.result()))
+
+    def _analyze_frame(self, frame, ocr_timeout, deadline):
+        """One frame, its OCR allowed no more than what is left of the clip's time when it starts"""
+        if deadline is not None:
+            # pytesseract reads 0 as no limit, so a spent budget still gets a tiny one
+            remaining = max(0.001, deadline - time.monotonic())
+            ocr_timeout = min(ocr_timeout, remaining) if ocr_timeout else remaining
+        return self.image_moderator.analyze(frame, ocr_timeout)
+
+    @staticmethod
+    def _remaining(deadline):
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _result(self, frames, stats, early_exit, fps, size):
+        frames.sort(key=lambda frame: frame[0])
+        analyzed = [(index, timestamp, result) for index, timestamp, result in frames if "error" not in result]
+        flagged = [(index, timestamp, result) for index, timestamp, result in analyzed if not result["is_safe"]]
+
+        if flagged:
+            is_safe = False
+            confidence = max(result["confidence"] for _, _, result in flagged)
+        elif analyzed:
+            is_safe = True
+            confidence = min(result["confidence"] for _, _, result in analyzed)
+        else:
+            is_safe = True
+            confidence = 0.0
+
+        warnings = []
+        if flagged:
+            times = ', '.join(f"{timestamp:.1f}s" for _, timestamp, _ in flagged)
+            warnings.append(f"Harmful content in frames at {times}")
+        for index, timestamp, result in flagged:
+            for warning in frame_warnings(result):
+                if warning not in warnings:
+                    warnings.append(warning)
+        if not analyzed:
+            warnings.append("No frame could be analyzed")
+        if stats["truncated"] and not early_exit:
+            warnings.append("Only part of the media was analyzed")
+
+        return {
+            "is_safe": is_safe,
+            "confidence": round(confidence, 2),
+            "media": {
+                "dimensions": f"{size[0]}x{size[1]}",
+                "fps": round(fps, 2) if fps else None,
+                # Up to the end of the last frame read
+                "duration_s": round(stats["position"] + (1 / fps if fps else 0.0), 2)
+            },
+            "frames": {
+                "decoded": stats["decoded"],
+                "sampled": stats["sampled"],
+                "duplicates_skipped": stats["duplicates"],
+                "analyzed": len(analyzed),
+                "failed": len(frames) - len(analyzed)
+            },
+            "early_exit": early_exit,
+            "truncated": stats["truncated"],
+            "flagged_frames": [
+                {
+                    "frame": index,
+                    "timestamp_s": round(timestamp, 3),
+                    "confidence": result["confidence"],
+                    "violence_score": result.get("violence_score"),
+                    "has_hate_text": result.get("has_hate_text", False),
+                    "warnings": frame_warnings(result)
+                }
+                for index, timestamp, result in flagged
+            ],
+            "warnings": warnings or ["No harmful frames found"]
+        }
+
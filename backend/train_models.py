@@ -0,0 +1,137 @@
+"""Train the hashed n-gram classifiers offline
+
+Reads the CSV datasets described in data/DATASETS.md and writes the model
+files the API loads from MODEL_PATH:
+
+    python train_models.py --hate ../data/text/labeled_data.csv ../data/text/jigsaw/train.csv
+    python train_models.py --fake ../data/text/Fake.csv ../data/text/True.csv
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from modules.datasets import load_fake_news_csv, load_hate_speech_csv
+from modules.fake_news_detector import HEURISTIC_FEATURES, FakeNewsDetector
+from modules.text_analysis import TextAnalysis
+from modules.text_classifier import HashingVectorizer, TextClassifier
+
+HATE_MODEL_FILE = 'hate_speech_model.npz'
+FAKE_MODEL_FILE = 'fake_news_model.npz'
+
+
+def split(count, holdout, seed=0):
+    """Shuffled train and validation index arrays"""
+    order = np.random.default_rng(seed).permutation(count)
+    cut = int(count * (1 - holdout))
+    return order[:cut], order[cut:]
+
+
+def sample(rows, limit, seed=0):
+    """At most `limit` rows drawn from every input file, not just the first ones read"""
+    if not limit or len(rows) <= limit:
+        return rows
+    order = np.random.default_rng(seed).permutation(len(rows))[:limit]
+    return [rows[i] for i in sorted(order)]
+
+
+def evaluate(probability, labels):
+    """Best-F1 threshold on the validation set and the scores at that threshold"""
+    best = None
+    for threshold in np.arange(0.05, 0.96, 0.01):
+        predicted = probability >= threshold
+        tp = np.sum(predicted & (labels == 1))
+        fp = np.sum(predicted & (labels == 0))
+        fn = np.sum(~predicted & (labels == 1))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        if best is None or f1 > best["f1"]:
+            best = {
+                "threshold": round(float(threshold), 2),
+                "precision": round(float(precision), 4),
+                "recall": round(float(recall), 4),
+                "f1": round(float(f1), 4),
+                "accuracy": round(float(np.mean(predicted == labels)), 4)
+            }
+    return best
+
+
+def train(classifier, texts, labels, extra, args, path, sources):
+    labels = np.asarray(labels)
+    train_rows, validation_rows = split(len(labels), args.holdout)
+
+    def rows(values, index):
+        return None if values is None else [values[i] for i in index]
+
+    started = time.perf_counter()
+    classifier.fit(rows(texts, train_rows), labels[train_rows], rows(extra, train_rows),
+                   epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2)
+    print(f"  trained on {len(train_rows)} examples in {time.perf_counter() - started:.1f}s")
+
+    scores = evaluate(classifier.predict_proba(rows(texts, validation_rows), rows(extra, validation_rows)),
+                      labels[validation_rows])
+    classifier.threshold = scores["threshold"]
+    print(f"  validation ({len(validation_rows)}): {scores}")
+
+    classifier.save(path, sources=sources, examples=len(labels), validation=scores)
+    print(f"  saved {path}")
+
+
+def train_hate_speech(args):
+    rows = sample([row for path in args.hate for row in load_hate_speech_csv(path)], args.limit)
+    texts, labels = [text for text, _ in rows], [label for _, label in rows]
+    print(f"Hate speech: {len(texts)} examples, {np.mean(labels):.1%} positive")
+
+    vectorizer = HashingVectorizer(n_features_bits=args.bits, max_chars=2000)
+    train(TextClassifier(vectorizer), texts, labels, None, args,
+          os.path.join(args.output_dir, HATE_MODEL_FILE), args.hate)
+
+
+def train_fake_news(args):
+    detector = FakeNewsDetector()
+    texts, labels, extra = [], [], []
+    # Sampled before the features are computed, so --limit also bounds that work
+    for title, content, label in sample([row for path in args.fake for row in load_fake_news_csv(path)],
+                                        args.limit):
+        title, content = TextAnalysis(title), TextAnalysis(content)
+        # Same fallbacks as FakeNewsDetector.predict
+        if not title.text:
+            title = content
+        body = content if content.text else title
+        texts.append(f"{title.text}\n{body.text}")
+        extra.append(detector.heuristic_features(title, body))
+        labels.append(label)
+    print(f"Fake news: {len(texts)} examples, {np.mean(labels):.1%} fake")
+
+    vectorizer = HashingVectorizer(n_features_bits=args.bits, max_chars=3000,
+                                   extra_features=len(HEURISTIC_FEATURES))
+    train(TextClassifier(vectorizer), texts, labels, extra, args,
+          os.path.join(args.output_dir, FAKE_MODEL_FILE), args.fake)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the hate speech and fake news classifiers")
+    parser.add_argument('--hate', nargs='*', default=[], help="Hate speech CSV files")
+    parser.add_argument('--fake', nargs='*', default=[], help="Fake news CSV files (e.g. Fake.csv True.csv)")
+    parser.add_argument('--output-dir', default=os.environ.get('MODEL_PATH', '../models'))
+    parser.add_argument('--bits', type=int, default=20, help="log2 of the hashed feature count")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--learning-rate', type=float, default=0.5)
+    parser.add_argument('--l2', type=float, default=1e-6)
+    parser.add_argument('--holdout', type=float, default=0.1, help="Share kept for validation")
+    parser.add_argument('--limit', type=int, help="Use at most this many examples per task")
+    args = parser.parse_args()
+
+    if not args.hate and not args.fake:
+        parser.error("Pass --hate and/or --fake dataset files")
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.hate:
+        train_hate_speech(args)
+    if args.fake:
+        train_fake_news(args)
+
+
+if __name__ == '__main__':
+    main()